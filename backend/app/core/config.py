@@ -1,4 +1,5 @@
 import os
+import tempfile
 from urllib.parse import quote_plus
 from dotenv import load_dotenv
 
@@ -15,10 +16,70 @@ class Settings:
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "table_constructor")
     
     ENCODED_PASSWORD = quote_plus(POSTGRES_PASSWORD)
-    DATABASE_URL = f"postgresql+psycopg2://{POSTGRES_USER}:{ENCODED_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    # SQLALCHEMY_DATABASE_URL позволяет подменить БД целиком (например, sqlite для бенчмарков)
+    DATABASE_URL = os.getenv(
+        "SQLALCHEMY_DATABASE_URL",
+        f"postgresql+psycopg2://{POSTGRES_USER}:{ENCODED_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    )
     
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     ALGORITHM = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+    # Импорт Excel: сколько строк читаем, проверяем и вставляем за один шаг
+    EXCEL_IMPORT_CHUNK_SIZE: int = int(os.getenv("EXCEL_IMPORT_CHUNK_SIZE", "5000"))
+    # Отчет валидации: сколько проблемных строк показывать по каждой колонке и где хранить полные отчеты
+    EXCEL_VALIDATION_SAMPLE_ERRORS: int = int(os.getenv("EXCEL_VALIDATION_SAMPLE_ERRORS", "20"))
+    EXCEL_REPORTS_DIR: str = os.getenv("EXCEL_REPORTS_DIR", os.path.join(tempfile.gettempdir(), "wautb_reports"))
+    EXCEL_REPORT_TTL_SECONDS: int = int(os.getenv("EXCEL_REPORT_TTL_SECONDS", "3600"))
+    # Фоновые задачи импорта: число потоков-воркеров, каталог для загруженных файлов и время хранения статуса
+    EXCEL_IMPORT_WORKERS: int = int(os.getenv("EXCEL_IMPORT_WORKERS", "2"))
+    EXCEL_UPLOADS_DIR: str = os.getenv("EXCEL_UPLOADS_DIR", os.path.join(tempfile.gettempdir(), "wautb_uploads"))
+    EXCEL_JOB_TTL_SECONDS: int = int(os.getenv("EXCEL_JOB_TTL_SECONDS", "3600"))
+    # Загрузки: максимальный размер файла и размер куска при копировании во временный файл
+    UPLOAD_MAX_BYTES: int = int(os.getenv("UPLOAD_MAX_BYTES", str(300 * 1024 * 1024)))
+    UPLOAD_SPOOL_CHUNK_BYTES: int = int(os.getenv("UPLOAD_SPOOL_CHUNK_BYTES", str(1024 * 1024)))
+    # Кэш загрузок (upload_token): каталог, время жизни и суммарный размер файлов вместе с кэшем разбора
+    UPLOAD_CACHE_DIR: str = os.getenv("UPLOAD_CACHE_DIR", os.path.join(tempfile.gettempdir(), "wautb_upload_cache"))
+    UPLOAD_CACHE_TTL_SECONDS: int = int(os.getenv("UPLOAD_CACHE_TTL_SECONDS", "1800"))
+    UPLOAD_CACHE_MAX_BYTES: int = int(os.getenv("UPLOAD_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+    # Превью: сколько первых строк файла читается для маппинга, типов и проверки (файл целиком не разбирается)
+    EXCEL_PREVIEW_SAMPLE_ROWS: int = int(os.getenv("EXCEL_PREVIEW_SAMPLE_ROWS", "1000"))
+    # Определение типов при создании таблицы: размер выборки и максимум вариантов для типа select
+    EXCEL_INFER_SAMPLE_ROWS: int = int(os.getenv("EXCEL_INFER_SAMPLE_ROWS", "2000"))
+    EXCEL_INFER_SELECT_MAX_OPTIONS: int = int(os.getenv("EXCEL_INFER_SELECT_MAX_OPTIONS", "20"))
+    # Пул процессов для разбора Excel: число процессов (0 - разбирать в потоке), места для массовых задач и длина очереди.
+    # Массовые задачи (создание таблицы) занимают не больше EXCEL_PARSE_WORKERS - 1 процессов; при одном процессе
+    # они выполняются в потоке, а процесс остается за превью
+    EXCEL_PARSE_WORKERS: int = int(os.getenv("EXCEL_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+    EXCEL_PARSE_BULK_SLOTS: int = int(os.getenv("EXCEL_PARSE_BULK_SLOTS", "1"))
+    EXCEL_PARSE_MAX_QUEUE: int = int(os.getenv("EXCEL_PARSE_MAX_QUEUE", "8"))
+    # WebSocket: очередь исходящих сообщений на соединение, сколько ждать закрытия отключаемого клиента и что делать при переполнении
+    # (drop_cursors - сначала выбрасывать перемещения курсоров, потом отключать; disconnect - отключать сразу)
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+    WS_CLOSE_TIMEOUT_SECONDS: float = float(os.getenv("WS_CLOSE_TIMEOUT_SECONDS", "5"))
+    WS_OVERFLOW_POLICY: str = os.getenv("WS_OVERFLOW_POLICY", "drop_cursors")
+    # Бинарный протокол (msgpack): сколько накопившихся событий уходит одним кадром; сжатие кадров permessage-deflate
+    WS_BATCH_MAX_MESSAGES: int = int(os.getenv("WS_BATCH_MAX_MESSAGES", "64"))
+    WS_PER_MESSAGE_DEFLATE: bool = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() in ("1", "true", "yes")
+    # Сколько раз в секунду рассылаются накопленные перемещения курсоров одной таблицы
+    WS_CURSOR_FLUSH_HZ: float = float(os.getenv("WS_CURSOR_FLUSH_HZ", "15"))
+    # Правки ячеек из WebSocket пишутся в БД отложенно: раз в столько миллисекунд или когда накопилось столько записей
+    WS_CELL_FLUSH_MS: int = int(os.getenv("WS_CELL_FLUSH_MS", "200"))
+    WS_CELL_FLUSH_MAX_RECORDS: int = int(os.getenv("WS_CELL_FLUSH_MAX_RECORDS", "500"))
+    # Блокировки ячеек - аренды: срок без активности владельца и такт колеса, снимающего истекшие
+    WS_LOCK_TTL_SECONDS: float = float(os.getenv("WS_LOCK_TTL_SECONDS", "60"))
+    WS_LOCK_REAPER_TICK_SECONDS: float = float(os.getenv("WS_LOCK_REAPER_TICK_SECONDS", "1"))
+    # Изменения из REST и импорта рассылаются подписчикам таблицы после commit; если в транзакции изменено больше записей,
+    # событие приходит без списка (truncated) и клиент перечитывает таблицу
+    WS_CHANGE_FEED_MAX_RECORDS: int = int(os.getenv("WS_CHANGE_FEED_MAX_RECORDS", "1000"))
+    # Журнал изменений хранит столько последних версий каждой таблицы; клиент, отставший сильнее, получает снимок
+    TABLE_CHANGE_LOG_RETENTION_VERSIONS: int = int(os.getenv("TABLE_CHANGE_LOG_RETENTION_VERSIONS", "10000"))
+    # Синхронизация таблиц между воркерами: postgres (LISTEN/NOTIFY в основной БД) или memory (один процесс, тесты).
+    # Узлы периодически объявляют своих пользователей; присутствие узла, молчащего три интервала, забывается
+    WS_PUBSUB_BACKEND: str = os.getenv(
+        "WS_PUBSUB_BACKEND", "postgres" if DATABASE_URL.startswith("postgresql") else "memory"
+    )
+    WS_PRESENCE_HEARTBEAT_SECONDS: float = float(os.getenv("WS_PRESENCE_HEARTBEAT_SECONDS", "15"))
+
 settings = Settings()
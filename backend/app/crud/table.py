@@ -1,8 +1,13 @@
 # crud/table.py
+from sqlalchemy import insert, select, update, delete, func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
-from ..models import TableTemplate, TableColumn, TableRecord
+from typing import List, Optional, Dict, Any, Iterator, Tuple
+from ..database import SessionLocal
+from ..core.config import settings
+from ..models import TableTemplate, TableColumn, TableRecord, TableVersion, TableChange
 from ..schemas.table import TableTemplateCreate, TableTemplateUpdate, TableColumnCreate, TableColumnUpdate, TableRecordCreate, TableRecordUpdate,TableColumnCreateWithoutTemplate,TableTemplateCreateWithColumns
+from .table_changes import TableChangeTracker, ENTITY_TABLE, ENTITY_COLUMN, ENTITY_RECORD, OP_INSERT, OP_UPDATE, OP_DELETE
 
 class TableTemplateRepository:
     def get_by_id(self, db: Session, template_id: int) -> Optional[TableTemplate]:
@@ -48,6 +53,7 @@ class TableTemplateRepository:
         update_data = template_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_template, field, value)
+        table_change_tracker.track(db, template_id, ENTITY_TABLE, OP_UPDATE, template_id, update_data)
         
         db.commit()
         db.refresh(db_template)
@@ -59,6 +65,7 @@ class TableTemplateRepository:
             return False
         
         db.delete(db_template)
+        table_change_tracker.track(db, template_id, ENTITY_TABLE, OP_DELETE, template_id)
         db.commit()
         return True
 
@@ -72,6 +79,10 @@ class TableColumnRepository:
     def create(self, db: Session, column_create: TableColumnCreate) -> TableColumn:
         db_column = TableColumn(**column_create.model_dump())
         db.add(db_column)
+        db.flush()
+        table_change_tracker.track(
+            db, db_column.table_template_id, ENTITY_COLUMN, OP_INSERT, db_column.id, column_create.model_dump()
+        )
         db.commit()
         db.refresh(db_column)
         return db_column
@@ -85,6 +96,7 @@ class TableColumnRepository:
         update_data = column_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_column, field, value)
+        table_change_tracker.track(db, db_column.table_template_id, ENTITY_COLUMN, OP_UPDATE, column_id, update_data)
         
         db.commit()
         db.refresh(db_column)
@@ -96,9 +108,21 @@ class TableColumnRepository:
             return False
         
         db.delete(db_column)
+        table_change_tracker.track(db, db_column.table_template_id, ENTITY_COLUMN, OP_DELETE, column_id)
         db.commit()
         return True
 
+    def update_configs(self, db: Session, config_by_id: Dict[int, Dict[str, Any]], commit: bool = True) -> int:
+        """Пакетный UPDATE config колонок по первичному ключу"""
+        if not config_by_id:
+            return 0
+        db.execute(update(TableColumn), [
+            {"id": column_id, "config": config} for column_id, config in config_by_id.items()
+        ])
+        if commit:
+            db.commit()
+        return len(config_by_id)
+
 class TableRecordRepository:
     def get_by_id(self, db: Session, record_id: int) -> Optional[TableRecord]:
         reco = db.query(TableRecord).filter(TableRecord.id == record_id).first()
@@ -112,18 +136,102 @@ class TableRecordRepository:
     def create(self, db: Session, record_create: TableRecordCreate) -> TableRecord:
         db_record = TableRecord(**record_create.model_dump())
         db.add(db_record)
+        db.flush()
+        table_change_tracker.track(
+            db, db_record.table_template_id, ENTITY_RECORD, OP_INSERT, db_record.id, db_record.data or {}
+        )
         db.commit()
         db.refresh(db_record)
         return db_record
     
+    def create_many(self, db: Session, template_id: int, records_data: List[Dict[str, Any]], commit: bool = True) -> int:
+        """Массовая вставка записей одним multi-row INSERT без загрузки ORM-объектов"""
+        if not records_data:
+            return 0
+        # id нужны ленте изменений; RETURNING в порядке параметров не добавляет запросов к multi-row INSERT
+        record_ids = db.execute(
+            insert(TableRecord).returning(TableRecord.id, sort_by_parameter_order=True),
+            [{"table_template_id": template_id, "data": data} for data in records_data]
+        ).scalars().all()
+        table_change_tracker.track_records(db, template_id, OP_INSERT, zip(record_ids, records_data))
+        if commit:
+            db.commit()
+        return len(records_data)
+    
+    def iter_data(self, db: Session, template_id: int, batch_size: int = 5000) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(id, data) всех записей таблицы порциями с сервера, без ORM-объектов"""
+        result = db.execute(
+            select(TableRecord.id, TableRecord.data)
+            .where(TableRecord.table_template_id == template_id)
+            .order_by(TableRecord.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for record_id, data in result:
+            yield record_id, data or {}
+    
+    def get_data_by_ids(self, db: Session, record_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        if not record_ids:
+            return {}
+        rows = db.execute(select(TableRecord.id, TableRecord.data).where(TableRecord.id.in_(record_ids)))
+        return {record_id: data or {} for record_id, data in rows}
+    
+    def lock_data_by_ids(self, db: Session, template_id: int, record_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """data записей таблицы с блокировкой строк до конца транзакции (SELECT ... FOR UPDATE)"""
+        if not record_ids:
+            return {}
+        rows = db.execute(
+            select(TableRecord.id, TableRecord.data)
+            .where(TableRecord.id.in_(record_ids), TableRecord.table_template_id == template_id)
+            .order_by(TableRecord.id)
+            .with_for_update()
+        )
+        return {record_id: data or {} for record_id, data in rows}
+    
+    def update_data_many(
+        self, db: Session, template_id: int, data_by_id: Dict[int, Dict[str, Any]], commit: bool = True,
+        patches: Optional[Dict[int, Dict[str, Any]]] = None
+    ) -> int:
+        """
+        Пакетный UPDATE data по первичному ключу (executemany).
+        patches - что именно изменилось в каждой записи (для ленты изменений); по умолчанию вся data
+        """
+        if not data_by_id:
+            return 0
+        db.execute(update(TableRecord), [
+            {"id": record_id, "data": data} for record_id, data in data_by_id.items()
+        ])
+        table_change_tracker.track_records(db, template_id, OP_UPDATE, (
+            (record_id, patches[record_id] if patches is not None else data) for record_id, data in data_by_id.items()
+        ))
+        if commit:
+            db.commit()
+        return len(data_by_id)
+    
+    def delete_many(self, db: Session, template_id: int, record_ids: List[int], commit: bool = True, batch_size: int = 1000) -> int:
+        for start in range(0, len(record_ids), batch_size):
+            db.execute(delete(TableRecord).where(
+                TableRecord.id.in_(record_ids[start:start + batch_size]), TableRecord.table_template_id == template_id
+            ))
+        table_change_tracker.track_records(db, template_id, OP_DELETE, ((record_id, None) for record_id in record_ids))
+        if commit:
+            db.commit()
+        return len(record_ids)
+    
     def update(self, db: Session, record_id: int, record_update: TableRecordUpdate) -> Optional[TableRecord]:
         db_record = self.get_by_id(db, record_id)
         if not db_record:
             return None
         
+        old_data = dict(db_record.data or {})
         update_data = record_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_record, field, value)
+        new_data = db_record.data or {}
+        changed = {key for key in old_data.keys() | new_data.keys() if old_data.get(key) != new_data.get(key)}
+        table_change_tracker.track(
+            db, db_record.table_template_id, ENTITY_RECORD, OP_UPDATE, record_id,
+            {key: new_data[key] for key in changed if key in new_data}, changed
+        )
         
         db.commit()
         db.refresh(db_record)
@@ -135,10 +243,82 @@ class TableRecordRepository:
             return False
         
         db.delete(db_record)
+        table_change_tracker.track(db, db_record.table_template_id, ENTITY_RECORD, OP_DELETE, record_id)
         db.commit()
         return True
 
+class TableVersionRepository:
+    def get(self, db: Session, table_id: int) -> int:
+        return db.execute(select(TableVersion.version).where(TableVersion.table_id == table_id)).scalar() or 0
+    
+    def bump(self, db: Session, table_id: int) -> int:
+        """
+        Следующая версия таблицы в текущей транзакции. Строка версии остается заблокированной до commit,
+        поэтому версии одной таблицы фиксируются строго по порядку
+        """
+        statement = (
+            update(TableVersion)
+            .where(TableVersion.table_id == table_id)
+            .values(version=TableVersion.version + 1)
+            .returning(TableVersion.version)
+        )
+        version = db.execute(statement).scalar()
+        if version is not None:
+            return version
+        try:
+            with db.begin_nested():
+                db.execute(insert(TableVersion).values(table_id=table_id, version=1))
+            return 1
+        except IntegrityError:
+            # Первую версию одновременно создал другой узел
+            return db.execute(statement).scalar()
+
+class TableChangeLogRepository:
+    # Старые версии удаляются не каждой транзакцией, а раз в столько версий таблицы
+    prune_every = 100
+
+    def __init__(self, retention_versions: int = settings.TABLE_CHANGE_LOG_RETENTION_VERSIONS):
+        self.retention_versions = retention_versions
+
+    def append(self, db: Session, table_id: int, version: int, changes: List[Dict[str, Any]]):
+        """Изменения версии в текущей транзакции; changes - entity, op, id и fields"""
+        if changes:
+            db.execute(insert(TableChange), [{
+                "table_id": table_id,
+                "version": version,
+                "entity": change["entity"],
+                "op": change["op"],
+                "entity_id": change.get("id"),
+                "fields": change.get("fields")
+            } for change in changes])
+        if version % self.prune_every == 0:
+            db.execute(delete(TableChange).where(
+                TableChange.table_id == table_id, TableChange.version <= version - self.retention_versions
+            ))
+
+    def oldest_version(self, db: Session, table_id: int) -> Optional[int]:
+        return db.execute(select(func.min(TableChange.version)).where(TableChange.table_id == table_id)).scalar()
+
+    def get_since(self, db: Session, table_id: int, since_version: int, until_version: int) -> List[Tuple[int, str, str, Optional[int], Optional[List[str]]]]:
+        """(version, entity, op, entity_id, fields) версий since_version < version <= until_version по порядку"""
+        rows = db.execute(
+            select(TableChange.version, TableChange.entity, TableChange.op, TableChange.entity_id, TableChange.fields)
+            .where(
+                TableChange.table_id == table_id,
+                TableChange.version > since_version,
+                TableChange.version <= until_version
+            )
+            .order_by(TableChange.version, TableChange.id)
+        )
+        return [tuple(row) for row in rows]
+
 # Создаем экземпляры репозиториев
 table_template_repository = TableTemplateRepository()
 table_column_repository = TableColumnRepository()
-table_record_repository = TableRecordRepository()
\ No newline at end of file
+table_record_repository = TableRecordRepository()
+table_version_repository = TableVersionRepository()
+table_change_log_repository = TableChangeLogRepository()
+
+# Изменения таблиц для подписчиков: версия выдается перед commit, событие уходит после
+table_change_tracker = TableChangeTracker(table_version_repository, table_change_log_repository)
+table_change_tracker.listen(SessionLocal)
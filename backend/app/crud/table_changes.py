@@ -0,0 +1,147 @@
+# crud/table_changes.py
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, SessionTransaction
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ENTITY_RECORD = "record"
+ENTITY_COLUMN = "column"
+ENTITY_TABLE = "table"
+
+OP_INSERT = "insert"
+OP_UPDATE = "update"
+OP_DELETE = "delete"
+# Запись журнала вместо поштучных изменений большой операции: клиенту, пропустившему ее, нужен снимок
+OP_RESET = "reset"
+
+# Ключ в session.info, под которым копятся изменения текущей транзакции
+_PENDING_KEY = "table_changes"
+
+
+class PendingTableChanges:
+    """Изменения одной таблицы в текущей транзакции"""
+    __slots__ = ("changes", "count", "truncated", "version")
+
+    def __init__(self):
+        self.changes: List[dict] = []
+        self.count = 0
+        self.truncated = False
+        self.version: Optional[int] = None
+
+
+class TableChangeTracker:
+    """
+    Изменения таблиц, зафиксированные в БД, для подписчиков таблицы.
+    Репозитории отмечают изменения записей и структуры (track); перед commit каждая измененная таблица получает
+    следующую версию и строки журнала изменений в той же транзакции, после commit событие с версией уходит издателям.
+    После rollback отмеченное забывается.
+    Записей в событии не больше max_records: для больших операций (импорт) остается только счетчик и признак truncated,
+    а в журнал вместо них пишется одна запись reset
+    """
+
+    def __init__(self, version_repository, log_repository, max_records: int = settings.WS_CHANGE_FEED_MAX_RECORDS):
+        self.version_repository = version_repository
+        self.log_repository = log_repository
+        self.max_records = max_records
+        self._publishers: List[Callable[[str, dict], None]] = []
+
+    def listen(self, session_factory):
+        event.listen(session_factory, "before_commit", self._before_commit)
+        event.listen(session_factory, "after_commit", self._after_commit)
+        event.listen(session_factory, "after_transaction_end", self._after_transaction_end)
+
+    def add_publisher(self, publisher: Callable[[str, dict], None]):
+        """publisher(table_id, message) вызывается после commit в потоке, где он произошел"""
+        self._publishers.append(publisher)
+
+    def track(
+        self, db: Session, table_id: int, entity: str, op: str, entity_id: Any,
+        data: Optional[Dict[str, Any]] = None, fields: Optional[Iterable[str]] = None
+    ):
+        """
+        Отметить изменение. data - новые значения (вставка - вся запись, изменение - только измененные поля),
+        fields - измененные поля, включая удаленные из data; по умолчанию ключи data
+        """
+        pending = self._pending(db, table_id)
+        pending.count += 1
+        if entity == ENTITY_RECORD and pending.count > self.max_records:
+            pending.truncated = True
+            # Список записей бесполезен без полноты: клиент все равно перечитает таблицу
+            pending.changes = [change for change in pending.changes if change["entity"] != ENTITY_RECORD]
+            return
+        change = {"entity": entity, "op": op, "id": entity_id}
+        if fields is not None or data is not None:
+            change["fields"] = sorted(fields if fields is not None else data)
+        if data is not None:
+            change["data"] = data
+        pending.changes.append(change)
+
+    def track_records(self, db: Session, table_id: int, op: str, records: Iterable[Tuple[int, Optional[Dict[str, Any]]]]):
+        for record_id, data in records:
+            self.track(db, table_id, ENTITY_RECORD, op, record_id, data)
+
+    def stamp(self, db: Session) -> Dict[int, int]:
+        """
+        Выдать версии таблицам, измененным в текущей транзакции (вызывается сам перед commit).
+        Строки версий блокируются до commit; таблицы обходятся по возрастанию id, чтобы транзакции не ждали друг друга по кругу
+        """
+        pending_tables: Dict[int, PendingTableChanges] = db.info.get(_PENDING_KEY, {})
+        for table_id in sorted(pending_tables):
+            pending = pending_tables[table_id]
+            if pending.version is None:
+                pending.version = self.version_repository.bump(db, table_id)
+        return {table_id: pending.version for table_id, pending in pending_tables.items()}
+
+    @staticmethod
+    def _pending(db: Session, table_id: int) -> PendingTableChanges:
+        return db.info.setdefault(_PENDING_KEY, {}).setdefault(table_id, PendingTableChanges())
+
+    def _before_commit(self, db: Session):
+        # Фиксация точки сохранения (begin_nested, в том числе внутри bump) - еще не commit транзакции;
+        # то же в _after_commit
+        pending_tables: Dict[int, PendingTableChanges] = db.info.get(_PENDING_KEY)
+        if not pending_tables or db.in_nested_transaction():
+            return
+        self.stamp(db)
+        for table_id in sorted(pending_tables):
+            pending = pending_tables[table_id]
+            entries = pending.changes
+            if pending.truncated:
+                entries = entries + [{"entity": ENTITY_TABLE, "op": OP_RESET, "id": table_id}]
+            self.log_repository.append(db, table_id, pending.version, entries)
+
+    def _after_commit(self, db: Session):
+        if db.in_nested_transaction():
+            return
+        pending_tables: Dict[int, PendingTableChanges] = db.info.pop(_PENDING_KEY, None)
+        if not pending_tables or not self._publishers:
+            return
+        timestamp = datetime.now().isoformat()
+        for table_id, pending in pending_tables.items():
+            message = {
+                "type": "table_changed",
+                "table_id": str(table_id),
+                "version": pending.version,
+                "count": pending.count,
+                "truncated": pending.truncated,
+                "changes": pending.changes,
+                "timestamp": timestamp
+            }
+            for publisher in self._publishers:
+                try:
+                    publisher(str(table_id), message)
+                except Exception as e:
+                    # Данные уже зафиксированы: сбой рассылки не должен превращаться в ошибку запроса
+                    logger.error(f"Не удалось разослать изменения таблицы {table_id}: {e}")
+
+    @staticmethod
+    def _after_transaction_end(db: Session, transaction: SessionTransaction):
+        # Откат внешней транзакции: отмеченные изменения не состоялись
+        if transaction.parent is None and not transaction.nested:
+            db.info.pop(_PENDING_KEY, None)
@@ -1,13 +1,17 @@
 from __future__ import annotations
 from fastapi import FastAPI
 from .database import init_db
-from .routes import user_router, auth_router, department_router, table_router, permission_router,excel_router
+from .routes import user_router, auth_router, department_router, table_router, permission_router,excel_router, ws_router
 from .middleware.AuthMiddleware import AuthMiddleware
+from .middleware.UploadLimitMiddleware import UploadLimitMiddleware
+from .services.excel_process_pool import excel_process_pool
+from .websockets import table_sync_manager
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(title="Table Constructor API", version="1.0.0")
 
 app.add_middleware(AuthMiddleware)
+app.add_middleware(UploadLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],  # или ["*"] для разработки
@@ -22,11 +26,19 @@ app.include_router(department_router)
 app.include_router(table_router)
 app.include_router(permission_router)
 app.include_router(excel_router)
+app.include_router(ws_router)
 
 # Инициализация БД при старте
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
+    # Канал синхронизации таблиц между воркерами (LISTEN/NOTIFY или в памяти)
+    await table_sync_manager.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    excel_process_pool.shutdown()
+    await table_sync_manager.stop()
 
 @app.get("/")
 def read_root():
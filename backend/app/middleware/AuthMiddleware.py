@@ -1,7 +1,7 @@
 from starlette.middleware.base import BaseHTTPMiddleware
 from fastapi import Request
 from jose import JWTError, jwt
-from ..database import get_db
+from ..database import SessionLocal
 from ..crud.user import user_repository as user_repo
 from ..core.config import settings
 from sqlalchemy.orm import Session
@@ -38,9 +38,12 @@ class AuthMiddleware(BaseHTTPMiddleware):
                 content={"detail": "Недействительный токен"}
             )
 
-        # Получаем пользователя
-        db: Session = next(get_db())
-        user = user_repo.get_by_id(db, int(user_id))
+        # Получаем пользователя (сессию закрываем сразу, иначе соединение висит до сборки мусора)
+        db: Session = SessionLocal()
+        try:
+            user = user_repo.get_by_id(db, int(user_id))
+        finally:
+            db.close()
         if not user:
             return JSONResponse(
                 status_code=401,
@@ -0,0 +1,25 @@
+# models/TableCellLocks.py
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from ..database import Base
+
+# Блокировки ячеек, строк и колонок при совместном редактировании - аренды со сроком; общие для всех воркеров и узлов
+class TableCellLock(Base):
+    __tablename__ = "table_cell_locks"
+    __table_args__ = (UniqueConstraint("table_id", "cell", name="uq_table_cell_locks_cell"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    table_id = Column(String(64), nullable=False, index=True)
+    # Ключ блокировки: адрес ячейки от клиента, row:<record_id> или column:<колонка>
+    cell = Column(String(255), nullable=False)
+    # Что покрывает блокировка: запись и колонка - ячейку, только запись - строку, только колонка - колонку
+    record_id = Column(Integer, nullable=True)
+    column_name = Column(String(255), nullable=True)
+    user_id = Column(String(64), nullable=False)
+    # Узел-владелец и pid его соединения LISTEN: блокировка умершего узла может быть перехвачена
+    node_id = Column(String(64), nullable=False, index=True)
+    owner_pid = Column(Integer, nullable=True)
+
+    locked_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Срок аренды: продлевается активностью владельца, истекшую снимает колесо таймеров узла
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
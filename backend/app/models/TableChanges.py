@@ -0,0 +1,23 @@
+# models/TableChanges.py
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, JSON, Index
+from sqlalchemy.sql import func
+from ..database import Base
+
+# Журнал изменений таблиц: что изменилось в каждой версии (без значений - их берут из table_records).
+# Хранится ограниченное число последних версий таблицы; клиент, отставший сильнее, получает снимок
+class TableChange(Base):
+    __tablename__ = "table_changes"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    table_id = Column(Integer, nullable=False)
+    version = Column(BigInteger, nullable=False)
+    entity = Column(String(16), nullable=False)  # record / column / table
+    op = Column(String(16), nullable=False)  # insert / update / delete / reset
+    entity_id = Column(Integer, nullable=True)
+    fields = Column(JSON, nullable=True)  # измененные ключи
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_table_changes_table_version", "table_id", "version"),
+    )
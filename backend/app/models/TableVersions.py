@@ -0,0 +1,13 @@
+# models/TableVersions.py
+from sqlalchemy import Column, Integer, BigInteger, DateTime
+from sqlalchemy.sql import func
+from ..database import Base
+
+# Версия данных таблицы: растет на единицу с каждым зафиксированным изменением записей
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+
+    table_id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(BigInteger, nullable=False, default=0)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
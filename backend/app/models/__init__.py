@@ -3,3 +3,6 @@ from .TableRecords import TableRecord
 from .TableTemplates import TableTemplate
 from .Users import User
 from .Departments import Department
+from .TableCellLocks import TableCellLock
+from .TableVersions import TableVersion
+from .TableChanges import TableChange
@@ -4,3 +4,4 @@ from .department import router as department_router
 from .table import router as table_router
 from .permission import router as permission_router
 from .excel import router as excel_router
+from .ws import router as ws_router
@@ -1,14 +1,41 @@
 # routers/excel.py
 from fastapi import APIRouter, Depends, HTTPException, Path, status, UploadFile, File, Form
-from typing import Dict, Any, List
+from fastapi.responses import FileResponse
+from pydantic import ValidationError
+from typing import Dict, Any, List, Optional
+import codecs
 import json
 
 from ..services.excel_import_service import ExcelImportService, get_excel_import_service
-from ..schemas.excel import ExcelImportResponse, ExcelPreviewResponse
+from ..services.excel_stream_service import IMPORT_COMMIT_MODES, COMMIT_MODE_ATOMIC
+from ..services.excel_validation import get_report_path, get_report_owner
+from ..services.permission_service import PermissionService
+from ..database import get_db
+from ..services.upload_cache import upload_cache
+from ..services.text_stream_service import CSV_EXTENSIONS, NDJSON_EXTENSIONS
+from ..schemas.excel import (
+    ExcelImportResponse, ExcelPreviewResponse, ExcelValidationReport, ExcelImportJobResponse,
+    ExcelImportBatchResponse, ExcelSheetsResponse, ExcelSheetImport
+)
 from ..dependencies import get_current_user, get_admin_user, check_add_rows_permission, check_edit_structure_permission
 
 router = APIRouter(prefix="/excel", tags=["excel"])
 
+def _check_excel_file(file: Optional[UploadFile]):
+    """Расширение проверяем только у нового файла; загрузка по upload_token уже проверена"""
+    if file is not None and (not file.filename or not file.filename.endswith(('.xlsx', '.xls'))):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Поддерживаются только Excel файлы (.xlsx, .xls)"
+        )
+
+def _check_commit_mode(commit_mode: str):
+    if commit_mode not in IMPORT_COMMIT_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Неверный режим фиксации. Допустимые значения: {', '.join(IMPORT_COMMIT_MODES)}"
+        )
+
 @router.post(
     "/preview-import/{table_id}",
     response_model=ExcelPreviewResponse,
@@ -17,20 +44,17 @@ router = APIRouter(prefix="/excel", tags=["excel"])
 )
 async def preview_excel_import(
     table_id: int,
-    file: UploadFile = File(..., description="Excel файл для импорта"),
+    file: Optional[UploadFile] = File(None, description="Excel файл для импорта; можно не передавать, если есть upload_token"),
+    upload_token: Optional[str] = Form(None, description="Токен файла, загруженного при превью"),
     skip_first_rows: int = Form(0, description="Количество строк для пропуска"),
     excel_service: ExcelImportService = Depends(get_excel_import_service),
     current_user = Depends(get_current_user),
     _ = Depends(check_add_rows_permission)
 ):
     print("Превью импорта Excel файла в существующую таблицу")
-    if not file.filename or not file.filename.endswith(('.xlsx', '.xls')):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Поддерживаются только Excel файлы (.xlsx, .xls)"
-        )
+    _check_excel_file(file)
     
-    return await excel_service.preview_excel_import(file, table_id, skip_first_rows)
+    return await excel_service.preview_excel_import(file, table_id, skip_first_rows, current_user.id, upload_token)
 
 @router.post(
     "/import/{table_id}",
@@ -40,20 +64,316 @@ async def preview_excel_import(
 )
 async def import_excel_data(
     table_id: int,
-    file: UploadFile = File(..., description="Excel файл для импорта"),
+    file: Optional[UploadFile] = File(None, description="Excel файл для импорта; можно не передавать, если есть upload_token"),
+    upload_token: Optional[str] = Form(None, description="Токен файла, загруженного при превью"),
     mapping: str = Form(..., description="JSON маппинг колонок"),
     skip_first_rows: int = Form(0, description="Количество строк для пропуска"),
+    commit_mode: str = Form(COMMIT_MODE_ATOMIC, description="atomic - все или ничего, partial - коммит после каждой пачки"),
+    full_report: bool = Form(False, description="Сохранить полный CSV-отчет об ошибках"),
+    key_columns: Optional[str] = Form(None, description="Ключевые колонки таблицы (JSON-список или через запятую): слияние вместо добавления"),
+    delete_missing: bool = Form(False, description="При слиянии удалить записи, которых нет в файле"),
     excel_service: ExcelImportService = Depends(get_excel_import_service),
     current_user = Depends(get_current_user),
     _ = Depends(check_add_rows_permission)
 ):
     """Импорт данных из Excel в существующую таблицу"""
-    if not file.filename or not file.filename.endswith(('.xlsx', '.xls')):
+    _check_excel_file(file)
+    
+    try:
+        mapping_dict = json.loads(mapping)
+    except json.JSONDecodeError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Поддерживаются только Excel файлы (.xlsx, .xls)"
+            detail="Неверный формат маппинга. Ожидается JSON строка."
+        )
+    
+    _check_commit_mode(commit_mode)
+    
+    return await excel_service.import_excel_data(
+        file, table_id, mapping_dict, skip_first_rows, commit_mode, full_report,
+        user_id=current_user.id, upload_token=upload_token,
+        key_columns=_parse_key_columns(key_columns), delete_missing=delete_missing
+    )
+
+def _parse_optional_mapping(mapping: Optional[str]) -> Optional[Dict[str, str]]:
+    """Пустой маппинг - определить автоматически по заголовку файла"""
+    if not mapping:
+        return None
+    try:
+        return json.loads(mapping)
+    except json.JSONDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Неверный формат маппинга. Ожидается JSON строка."
+        )
+
+def _parse_key_columns(key_columns: Optional[str]) -> Optional[List[str]]:
+    """Ключевые колонки: JSON-список имен или имена через запятую"""
+    if not key_columns or not key_columns.strip():
+        return None
+    if key_columns.lstrip().startswith('['):
+        try:
+            columns = json.loads(key_columns)
+        except json.JSONDecodeError:
+            columns = None
+        if not isinstance(columns, list) or not all(isinstance(column, str) for column in columns):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Неверный формат ключевых колонок. Ожидается JSON-список строк."
+            )
+    else:
+        columns = [column.strip() for column in key_columns.split(',')]
+    return [column for column in columns if column] or None
+
+@router.post(
+    "/import-csv/{table_id}",
+    response_model=ExcelImportResponse,
+    summary="Импорт CSV в таблицу",
+    description="Потоковый импорт CSV: кодировка и разделитель определяются автоматически, если не заданы"
+)
+async def import_csv_data(
+    table_id: int,
+    file: UploadFile = File(..., description="CSV файл для импорта"),
+    mapping: Optional[str] = Form(None, description="JSON маппинг колонок; без него - автоматический по заголовку"),
+    skip_first_rows: int = Form(0, description="Количество строк для пропуска"),
+    commit_mode: str = Form(COMMIT_MODE_ATOMIC, description="atomic - все или ничего, partial - коммит после каждой пачки"),
+    full_report: bool = Form(False, description="Сохранить полный CSV-отчет об ошибках"),
+    key_columns: Optional[str] = Form(None, description="Ключевые колонки таблицы (JSON-список или через запятую): слияние вместо добавления"),
+    delete_missing: bool = Form(False, description="При слиянии удалить записи, которых нет в файле"),
+    delimiter: Optional[str] = Form(None, description="Разделитель (по умолчанию определяется автоматически)"),
+    encoding: Optional[str] = Form(None, description="Кодировка (по умолчанию определяется автоматически)"),
+    excel_service: ExcelImportService = Depends(get_excel_import_service),
+    current_user = Depends(get_current_user),
+    _ = Depends(check_add_rows_permission)
+):
+    """Импорт данных из CSV в существующую таблицу"""
+    if not file.filename or not file.filename.lower().endswith(CSV_EXTENSIONS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Поддерживаются только CSV файлы ({', '.join(CSV_EXTENSIONS)})"
+        )
+    if delimiter:
+        # Табуляцию в форме удобнее передать двумя символами \\t
+        delimiter = delimiter.replace('\\t', '\t')
+        if len(delimiter) != 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Разделитель должен быть одним символом"
+            )
+    if encoding is not None:
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Неизвестная кодировка: {encoding}"
+            )
+    
+    mapping_dict = _parse_optional_mapping(mapping)
+    _check_commit_mode(commit_mode)
+    
+    return await excel_service.import_excel_data(
+        file, table_id, mapping_dict, skip_first_rows, commit_mode, full_report,
+        {'delimiter': delimiter or None, 'encoding': encoding},
+        user_id=current_user.id, key_columns=_parse_key_columns(key_columns), delete_missing=delete_missing
+    )
+
+@router.post(
+    "/import-ndjson/{table_id}",
+    response_model=ExcelImportResponse,
+    summary="Импорт NDJSON в таблицу",
+    description="Построчный импорт NDJSON (один JSON-объект на строку)"
+)
+async def import_ndjson_data(
+    table_id: int,
+    file: UploadFile = File(..., description="NDJSON файл для импорта"),
+    mapping: Optional[str] = Form(None, description="JSON маппинг колонок; без него - автоматический по ключам"),
+    skip_first_rows: int = Form(0, description="Количество строк для пропуска"),
+    commit_mode: str = Form(COMMIT_MODE_ATOMIC, description="atomic - все или ничего, partial - коммит после каждой пачки"),
+    full_report: bool = Form(False, description="Сохранить полный CSV-отчет об ошибках"),
+    key_columns: Optional[str] = Form(None, description="Ключевые колонки таблицы (JSON-список или через запятую): слияние вместо добавления"),
+    delete_missing: bool = Form(False, description="При слиянии удалить записи, которых нет в файле"),
+    excel_service: ExcelImportService = Depends(get_excel_import_service),
+    current_user = Depends(get_current_user),
+    _ = Depends(check_add_rows_permission)
+):
+    """Импорт данных из NDJSON в существующую таблицу"""
+    if not file.filename or not file.filename.lower().endswith(NDJSON_EXTENSIONS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Поддерживаются только NDJSON файлы ({', '.join(NDJSON_EXTENSIONS)})"
+        )
+    
+    mapping_dict = _parse_optional_mapping(mapping)
+    _check_commit_mode(commit_mode)
+    
+    return await excel_service.import_excel_data(
+        file, table_id, mapping_dict, skip_first_rows, commit_mode, full_report,
+        user_id=current_user.id, key_columns=_parse_key_columns(key_columns), delete_missing=delete_missing
+    )
+
+@router.post(
+    "/jobs/import/{table_id}",
+    response_model=ExcelImportJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Фоновый импорт Excel",
+    description="Поставить импорт в очередь; прогресс доступен по GET /excel/jobs/{job_id} и по WebSocket таблицы"
+)
+async def submit_import_job(
+    table_id: int,
+    file: Optional[UploadFile] = File(None, description="Excel файл для импорта; можно не передавать, если есть upload_token"),
+    upload_token: Optional[str] = Form(None, description="Токен файла, загруженного при превью"),
+    mapping: str = Form(..., description="JSON маппинг колонок"),
+    skip_first_rows: int = Form(0, description="Количество строк для пропуска"),
+    commit_mode: str = Form(COMMIT_MODE_ATOMIC, description="atomic - все или ничего, partial - коммит после каждой пачки"),
+    full_report: bool = Form(False, description="Сохранить полный CSV-отчет об ошибках"),
+    key_columns: Optional[str] = Form(None, description="Ключевые колонки таблицы (JSON-список или через запятую): слияние вместо добавления"),
+    delete_missing: bool = Form(False, description="При слиянии удалить записи, которых нет в файле"),
+    excel_service: ExcelImportService = Depends(get_excel_import_service),
+    current_user = Depends(get_current_user),
+    _ = Depends(check_add_rows_permission)
+):
+    """Фоновый импорт данных из Excel в существующую таблицу"""
+    _check_excel_file(file)
+    
+    try:
+        mapping_dict = json.loads(mapping)
+    except json.JSONDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Неверный формат маппинга. Ожидается JSON строка."
         )
     
+    _check_commit_mode(commit_mode)
+    
+    return await excel_service.submit_import_job(
+        file, table_id, mapping_dict, current_user.id, skip_first_rows, commit_mode, full_report, upload_token,
+        _parse_key_columns(key_columns), delete_missing
+    )
+
+@router.get(
+    "/jobs/{job_id}",
+    response_model=ExcelImportJobResponse,
+    summary="Статус фонового импорта",
+    description="Обработано строк, скорость, ошибки и оценка оставшегося времени"
+)
+async def get_import_job(
+    job_id: str,
+    excel_service: ExcelImportService = Depends(get_excel_import_service),
+    current_user = Depends(get_current_user)
+):
+    return excel_service.get_import_job(job_id, current_user).to_response()
+
+@router.post(
+    "/jobs/{job_id}/cancel",
+    response_model=ExcelImportJobResponse,
+    summary="Отменить фоновый импорт",
+    description="Импорт остановится на границе пачки: atomic откатывается целиком, partial сохраняет закоммиченные пачки"
+)
+async def cancel_import_job(
+    job_id: str,
+    excel_service: ExcelImportService = Depends(get_excel_import_service),
+    current_user = Depends(get_current_user)
+):
+    return excel_service.cancel_import_job(job_id, current_user)
+
+@router.post(
+    "/sheets",
+    response_model=ExcelSheetsResponse,
+    summary="Листы книги Excel",
+    description="Список листов с заголовками и числом строк (по метаданным, без разбора); возвращает upload_token"
+)
+async def list_workbook_sheets(
+    file: Optional[UploadFile] = File(None, description="Excel файл; можно не передавать, если есть upload_token"),
+    upload_token: Optional[str] = Form(None, description="Токен файла, загруженного ранее"),
+    excel_service: ExcelImportService = Depends(get_excel_import_service),
+    current_user = Depends(get_current_user)
+):
+    _check_excel_file(file)
+    return await excel_service.list_workbook_sheets(file, current_user.id, upload_token)
+
+@router.post(
+    "/jobs/import-sheets",
+    response_model=ExcelImportBatchResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Фоновый импорт нескольких листов",
+    description="Каждый лист импортируется в свою таблицу параллельно; суммарный прогресс - GET /excel/job-groups/{group_id}"
+)
+async def submit_sheets_import(
+    sheets: str = Form(..., description='JSON: {"Лист": {"table_id": 1, "mapping": {...}, "skip_first_rows": 0}} или {"Лист": 1}'),
+    file: Optional[UploadFile] = File(None, description="Excel файл; можно не передавать, если есть upload_token"),
+    upload_token: Optional[str] = Form(None, description="Токен файла, загруженного ранее"),
+    commit_mode: str = Form(COMMIT_MODE_ATOMIC, description="atomic - все или ничего, partial - коммит после каждой пачки"),
+    full_report: bool = Form(False, description="Сохранить полный CSV-отчет об ошибках"),
+    excel_service: ExcelImportService = Depends(get_excel_import_service),
+    current_user = Depends(get_current_user)
+):
+    """Права add_rows проверяются по каждой целевой таблице в сервисе"""
+    _check_excel_file(file)
+    _check_commit_mode(commit_mode)
+    try:
+        raw_sheets = json.loads(sheets)
+        if not isinstance(raw_sheets, dict):
+            raise ValueError("ожидается JSON-объект")
+        sheets_config = {
+            str(name): ExcelSheetImport(table_id=target) if isinstance(target, int) else ExcelSheetImport.model_validate(target)
+            for name, target in raw_sheets.items()
+        }
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Неверный формат листов: {str(e)}"
+        )
+    
+    return await excel_service.submit_sheets_import(
+        file, sheets_config, current_user.id, commit_mode, full_report, upload_token
+    )
+
+@router.get(
+    "/job-groups/{group_id}",
+    response_model=ExcelImportBatchResponse,
+    summary="Статус импорта нескольких листов",
+    description="Суммарный прогресс и статусы задач по листам"
+)
+async def get_import_group(
+    group_id: str,
+    excel_service: ExcelImportService = Depends(get_excel_import_service),
+    current_user = Depends(get_current_user)
+):
+    return excel_service.get_import_group(group_id, current_user)
+
+@router.post(
+    "/job-groups/{group_id}/cancel",
+    response_model=ExcelImportBatchResponse,
+    summary="Отменить импорт нескольких листов"
+)
+async def cancel_import_group(
+    group_id: str,
+    excel_service: ExcelImportService = Depends(get_excel_import_service),
+    current_user = Depends(get_current_user)
+):
+    return excel_service.cancel_import_group(group_id, current_user)
+
+@router.post(
+    "/validate/{table_id}",
+    response_model=ExcelValidationReport,
+    summary="Проверка Excel перед импортом",
+    description="Проверка всех строк файла по схеме таблицы без записи данных"
+)
+async def validate_excel_data(
+    table_id: int,
+    file: Optional[UploadFile] = File(None, description="Excel файл для проверки; можно не передавать, если есть upload_token"),
+    upload_token: Optional[str] = Form(None, description="Токен файла, загруженного при превью"),
+    mapping: str = Form(..., description="JSON маппинг колонок"),
+    skip_first_rows: int = Form(0, description="Количество строк для пропуска"),
+    full_report: bool = Form(False, description="Сохранить полный CSV-отчет об ошибках"),
+    excel_service: ExcelImportService = Depends(get_excel_import_service),
+    current_user = Depends(get_current_user),
+    _ = Depends(check_add_rows_permission)
+):
+    """Проверка данных Excel без импорта"""
+    _check_excel_file(file)
+    
     try:
         mapping_dict = json.loads(mapping)
     except json.JSONDecodeError:
@@ -62,7 +382,37 @@ async def import_excel_data(
             detail="Неверный формат маппинга. Ожидается JSON строка."
         )
     
-    return await excel_service.import_excel_data(file, table_id, mapping_dict, skip_first_rows)
+    return await excel_service.validate_excel_data(
+        file, table_id, mapping_dict, skip_first_rows, full_report, current_user.id, upload_token
+    )
+
+@router.get(
+    "/validation-reports/{report_id}",
+    summary="Полный отчет валидации",
+    description="Скачать CSV со всеми ошибками валидации"
+)
+async def download_validation_report(
+    report_id: str,
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    """
+    Полный отчет об ошибках, сохраненный при импорте или проверке. В нем значения ячеек чужой таблицы:
+    отчет отдается автору или тому, кто может просматривать таблицу; остальным - 404, как несуществующий
+    """
+    path = get_report_path(report_id)
+    owner = get_report_owner(report_id) if path is not None else None
+    allowed = owner is not None and (
+        owner.get('user_id') == current_user.id
+        or (owner.get('table_id') is not None
+            and PermissionService(db).check_permission(current_user.id, owner['table_id'], "view"))
+    )
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Отчет не найден или срок его хранения истек"
+        )
+    return FileResponse(path, media_type="text/csv", filename=f"validation_{report_id}.csv")
 
 @router.post(
     "/create-table",
@@ -70,20 +420,17 @@ async def import_excel_data(
     description="Создание новой таблицы из Excel файла"
 )
 async def create_table_from_excel(
-    file: UploadFile = File(..., description="Excel файл для создания таблицы"),
+    file: Optional[UploadFile] = File(None, description="Excel файл для создания таблицы; можно не передавать, если есть upload_token"),
+    upload_token: Optional[str] = Form(None, description="Токен файла, загруженного при превью"),
     table_name: str = Form(..., description="Название новой таблицы"),
     skip_first_rows: int = Form(0, description="Количество строк для пропуска"),
     excel_service: ExcelImportService = Depends(get_excel_import_service),
     current_user = Depends(get_admin_user)  # Только администратор может создавать таблицы
 ):
     """Создание новой таблицы из Excel файла"""
-    if not file.filename or not file.filename.endswith(('.xlsx', '.xls')):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Поддерживаются только Excel файлы (.xlsx, .xls)"
-        )
+    _check_excel_file(file)
     
-    return await excel_service.create_table_from_excel(file, table_name, skip_first_rows)
+    return await excel_service.create_table_from_excel(file, table_name, skip_first_rows, current_user.id, upload_token)
 
 @router.post(
     "/preview-create-table",
@@ -92,45 +439,29 @@ async def create_table_from_excel(
     description="Предварительный просмотр структуры таблицы из Excel файла"
 )
 async def preview_create_table_from_excel(
-    file: UploadFile = File(..., description="Excel файл для создания таблицы"),
+    file: Optional[UploadFile] = File(None, description="Excel файл для создания таблицы; можно не передавать, если есть upload_token"),
+    upload_token: Optional[str] = Form(None, description="Токен файла, загруженного при превью"),
     skip_first_rows: int = Form(0, description="Количество строк для пропуска"),
     excel_service: ExcelImportService = Depends(get_excel_import_service),
     current_user = Depends(get_current_user)
 ):
     """Превью создания таблицы из Excel файла"""
-    if not file.filename or not file.filename.endswith(('.xlsx', '.xls')):
+    _check_excel_file(file)
+    
+    return await excel_service.preview_create_table(file, skip_first_rows, current_user.id, upload_token)
+
+@router.delete(
+    "/uploads/{upload_token}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Удалить загрузку",
+    description="Освободить файл, сохраненный при превью, не дожидаясь истечения срока хранения"
+)
+async def delete_upload(
+    upload_token: str,
+    current_user = Depends(get_current_user)
+):
+    if not upload_cache.remove(upload_token, current_user.id):
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Поддерживаются только Excel файлы (.xlsx, .xls)"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Загрузка не найдена или срок ее хранения истек"
         )
-    
-    try:
-        file_content = await file.read()
-        
-        # Используем ExcelService для анализа файла
-        from ..services.excel_service import ExcelService
-        df = ExcelService.parse_excel_file(file_content)
-        
-        if skip_first_rows > 0:
-            df = df.iloc[skip_first_rows:].reset_index(drop=True)
-        
-        # Автоматически определяем структуру таблицы
-        table_template_data, records_data = ExcelService.create_table_from_excel(df, "preview_table")
-        
-        # Получаем превью данных
-        preview_data = ExcelService.get_preview_data(df)
-        
-        return {
-            "success": True,
-            "proposed_structure": table_template_data,
-            "preview_data": preview_data,
-            "total_rows": len(df),
-            "excel_columns": df.columns.tolist(),
-            "message": "Файл успешно проанализирован"
-        }
-        
-    except Exception as e:
-        return {
-            "success": False,
-            "message": f"Ошибка при анализе файла: {str(e)}"
-        }
\ No newline at end of file
@@ -7,7 +7,7 @@ from ..database import get_db
 from ..services.permission_service import PermissionService
 
 from ..schemas import table as schemas
-from ..services.table_service import TableTemplateService, TableColumnService, TableRecordService, get_table_template_service, get_table_column_service, get_table_record_service
+from ..services.table_service import TableTemplateService, TableColumnService, TableRecordService, TableChangeService, get_table_template_service, get_table_column_service, get_table_record_service, get_table_change_service
 from ..dependencies import (
     get_current_user, get_admin_user, check_view_permission, 
     check_add_rows_permission, check_edit_rows_permission, 
@@ -236,6 +236,21 @@ async def get_records(
 ):
     return record_service.get_records_by_template(table_id, skip, limit)
 
+@router.get(
+    "/{table_id}/changes",
+    response_model=schemas.TableChangesResponse,
+    summary="Изменения таблицы с версии",
+    description="Записи, измененные после since_version (удаленные - надгробиями); если журнал не покрывает версию - снимок таблицы"
+)
+async def get_changes(
+    table_id: int = Path(..., description="ID таблицы", gt=0),
+    since_version: int = Query(..., ge=0, description="Последняя версия, известная клиенту"),
+    change_service: TableChangeService = Depends(get_table_change_service),
+    current_user = Depends(get_current_user),
+    _ = Depends(check_view_permission)
+):
+    return change_service.get_changes(table_id, since_version)
+
 @router.get(
     "/{table_id}/records/{record_id}",
     response_model=schemas.TableRecordResponse,
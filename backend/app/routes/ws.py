@@ -0,0 +1,46 @@
+# routers/ws.py
+from typing import Optional
+from fastapi import APIRouter, WebSocket, Query, status
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+
+from ..database import SessionLocal
+from ..core.config import settings
+from ..services.permission_service import PermissionService
+from ..websockets.table_ws import handle_table_websocket
+
+router = APIRouter(tags=["websockets"])
+
+def _authorize(token: str, table_id: int):
+    """(id пользователя, можно ли сохранять правки), если токен валиден и есть право на просмотр таблицы"""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        user_id = int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
+        return None
+
+    db = SessionLocal()
+    try:
+        permission_service = PermissionService(db)
+        if not permission_service.check_permission(user_id, table_id, "view"):
+            return None
+        return user_id, permission_service.check_permission(user_id, table_id, "edit_rows")
+    finally:
+        db.close()
+
+@router.websocket("/ws/tables/{table_id}")
+async def table_websocket(
+    websocket: WebSocket,
+    table_id: int,
+    token: str = Query(..., description="JWT токен (браузер не передает заголовки в WebSocket)"),
+    since: Optional[int] = Query(None, ge=0, description="Последняя версия таблицы, известная клиенту (догон после переподключения)")
+):
+    """Синхронизация таблицы: правки, блокировки, курсоры и серверные события"""
+    # Запросы прав синхронные: в пуле потоков, чтобы волна переподключений не останавливала цикл событий
+    authorized = await run_in_threadpool(_authorize, token, table_id)
+    if authorized is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    user_id, can_edit_rows = authorized
+    await handle_table_websocket(websocket, str(table_id), str(user_id), can_edit_rows, since)
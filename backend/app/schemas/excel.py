@@ -1,23 +1,106 @@
 # schemas/excel.py
 from pydantic import BaseModel
 from typing import Dict, List, Any, Optional
+from datetime import datetime
 
 class ExcelImportRequest(BaseModel):
     table_template_id: int
     mapping: Dict[str, str]  # {column_name: excel_column_name}
     skip_first_rows: int = 0
 
+class ExcelColumnValidation(BaseModel):
+    column: str
+    excel_column: str
+    data_type: str
+    error_count: int
+    sample_errors: List[Dict[str, Any]] = []  # [{row, value}] - первые N проблемных строк
+
+class ExcelValidationReport(BaseModel):
+    total_rows: int = 0
+    invalid_rows: int = 0
+    error_count: int = 0
+    columns: List[ExcelColumnValidation] = []
+    report_id: Optional[str] = None  # полный отчет: GET /excel/validation-reports/{report_id}
+
+class ExcelMergeStats(BaseModel):
+    key_columns: List[str]
+    delete_missing: bool = False
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0  # строки, совпавшие с сохраненными, - в БД не пишутся
+    deleted: int = 0
+    skipped_rows: int = 0  # пустой ключ или повтор ключа в файле
+    key_errors: List[Dict[str, Any]] = []  # первые N пропущенных строк
+    delete_skipped: Optional[str] = None  # почему delete_missing не выполнен
+
 class ExcelImportResponse(BaseModel):
     success: bool
     imported_records: int
     errors: List[Dict[str, Any]] = []
     message: str = ""
+    validation_report: Optional[ExcelValidationReport] = None
+    mapping: Optional[Dict[str, str]] = None  # фактический маппинг (в т.ч. определенный автоматически)
+    merge_stats: Optional[ExcelMergeStats] = None  # только для импорта с ключевыми колонками
+
+class ExcelImportJobResponse(BaseModel):
+    job_id: str
+    table_template_id: int
+    filename: Optional[str] = None
+    sheet_name: Optional[str] = None
+    group_id: Optional[str] = None  # общий id задач импорта нескольких листов одной книги
+    status: str  # queued | running | completed | failed | cancelled
+    commit_mode: str
+    rows_processed: int = 0
+    total_rows: Optional[int] = None  # оценка по метаданным листа
+    imported_records: int = 0
+    rows_per_second: float = 0.0
+    eta_seconds: Optional[float] = None
+    errors: List[Dict[str, Any]] = []
+    message: str = ""
+    validation_report: Optional[ExcelValidationReport] = None
+    merge_stats: Optional[ExcelMergeStats] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ExcelImportBatchResponse(BaseModel):
+    """Импорт нескольких листов: суммарный прогресс и задачи по листам"""
+    group_id: str
+    status: str  # queued | running | completed | failed | cancelled
+    rows_processed: int = 0
+    total_rows: Optional[int] = None
+    imported_records: int = 0
+    jobs: List[ExcelImportJobResponse] = []
+
+class ExcelSheetInfo(BaseModel):
+    name: str
+    index: int
+    total_rows: Optional[int] = None  # по метаданным листа, без разбора
+    total_columns: Optional[int] = None
+    columns: List[str] = []  # заголовок (первая строка)
+
+class ExcelSheetsResponse(BaseModel):
+    sheets: List[ExcelSheetInfo]
+    upload_token: Optional[str] = None
+
+class ExcelSheetImport(BaseModel):
+    """Куда импортировать один лист книги"""
+    table_id: int
+    mapping: Optional[Dict[str, str]] = None  # без маппинга - автоматический по заголовку листа
+    skip_first_rows: int = 0
+    key_columns: Optional[List[str]] = None
+    delete_missing: bool = False
 
 class ExcelPreviewResponse(BaseModel):
     columns: List[str]
     preview_data: List[Dict[str, Any]]
     suggested_mapping: Dict[str, str]
     table_columns: List[Dict[str, Any]]
+    # Проверка первых EXCEL_PREVIEW_SAMPLE_ROWS строк; весь файл проверяет POST /excel/validate
+    validation_report: Optional[ExcelValidationReport] = None
+    total_rows: Optional[int] = None  # по метаданным листа
+    # Файл сохранен на сервере: импорт и create-table можно вызвать с этим токеном без повторной загрузки
+    upload_token: Optional[str] = None
 
 class ExcelCreateTableRequest(BaseModel):
     table_name: str
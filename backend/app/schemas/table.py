@@ -68,4 +68,20 @@ class TableRecordResponse(TableRecordBase):
     updated_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+# Журнал изменений (догон клиента после переподключения)
+class TableRecordChange(BaseModel):
+    record_id: int
+    op: str  # insert / update / delete (delete - надгробие, без data)
+    fields: List[str] = []  # измененные ключи; для снимка и вставки - все ключи записи
+    data: Optional[Dict[str, Any]] = None  # текущие данные записи
+
+class TableChangesResponse(BaseModel):
+    table_id: int
+    since_version: int
+    version: int
+    # snapshot - журнал не покрывает since_version: changes содержит все записи таблицы, остальные записи клиента удалены
+    snapshot: bool = False
+    changes: List[TableRecordChange] = []
+    # Текущие колонки, если с since_version менялась структура (и всегда в снимке)
+    columns: Optional[List[TableColumnResponse]] = None
@@ -0,0 +1,183 @@
+# services/column_mapping.py
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy.orm import Session
+
+from ..crud.table import table_column_repository
+
+logger = logging.getLogger(__name__)
+
+# Ключ конфигурации колонки, где хранятся заголовки файлов, подтвержденные при прошлых импортах
+ALIASES_CONFIG_KEY = 'import_aliases'
+MAX_ALIASES = 10
+# Минимальная похожесть (коэффициент Дайса по триграммам), ниже которой заголовок не предлагается
+MIN_SCORE = 0.5
+# Заголовок целиком содержит все слова имени колонки ("Имя" -> "Имя клиента")
+TOKEN_SUBSET_SCORE = 0.6
+CANDIDATES_PER_COLUMN = 5
+
+_LATIN_LOOKALIKES = 'aceopxykmhtb'
+_CYRILLIC_LOOKALIKES = 'асеорхукмнтв'
+_TO_CYRILLIC = str.maketrans(_LATIN_LOOKALIKES, _CYRILLIC_LOOKALIKES)
+_TO_LATIN = str.maketrans(_CYRILLIC_LOOKALIKES, _LATIN_LOOKALIKES)
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def _fix_homoglyphs(token: str) -> str:
+    """В слове из смеси алфавитов похожие буквы приводим к алфавиту большинства ("Cумма" с латинской C)"""
+    cyrillic = sum('а' <= ch <= 'я' for ch in token)
+    latin = sum('a' <= ch <= 'z' for ch in token)
+    if not cyrillic or not latin:
+        return token
+    return token.translate(_TO_CYRILLIC if cyrillic >= latin else _TO_LATIN)
+
+
+def normalize_header(value: Any) -> str:
+    """Регистр, ё/е, пробелы и знаки препинания, омоглифы - "  Сумма_(руб.) " и "сумма руб" совпадают"""
+    text = unicodedata.normalize('NFKC', str(value)).casefold().replace('ё', 'е')
+    return ' '.join(_fix_homoglyphs(token) for token in _SEPARATORS.sub(' ', text).split())
+
+
+def _exact_key(normalized: str) -> str:
+    # Для точного совпадения разделители не важны: "Col E", "col-e" и "cole" - один заголовок
+    return normalized.replace(' ', '')
+
+
+def _trigrams(normalized: str) -> List[str]:
+    grams = []
+    for token in normalized.split():
+        padded = f" {token} "
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class HeaderIndex:
+    """Индекс заголовков файла: точные совпадения по нормализованному виду и триграммы для похожих"""
+
+    def __init__(self, headers: Iterable[Any]):
+        self.headers = list(headers)
+        self.normalized = [normalize_header(header) for header in self.headers]
+        self._exact: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._sizes: List[int] = []
+        for position, normalized in enumerate(self.normalized):
+            self._exact.setdefault(_exact_key(normalized), position)
+            grams = set(_trigrams(normalized))
+            self._sizes.append(len(grams))
+            for gram in grams:
+                self._postings[gram].append(position)
+
+    def exact(self, name: Any) -> Optional[int]:
+        return self._exact.get(_exact_key(normalize_header(name)))
+
+    def candidates(self, name: Any, limit: int = CANDIDATES_PER_COLUMN) -> List[Tuple[float, int]]:
+        """(похожесть, позиция заголовка) по убыванию; смотрим только заголовки с общими триграммами"""
+        normalized = normalize_header(name)
+        grams = set(_trigrams(normalized))
+        if not grams:
+            return []
+        shared: Counter = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+
+        tokens = set(normalized.split())
+        scored = []
+        for position, count in shared.items():
+            score = 2 * count / (len(grams) + self._sizes[position])
+            if tokens <= set(self.normalized[position].split()):
+                score = max(score, TOKEN_SUBSET_SCORE)
+            if score >= MIN_SCORE:
+                scored.append((score, position))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return scored[:limit]
+
+
+def _aliases(column) -> List[str]:
+    config = getattr(column, 'config', None) or {}
+    return config.get(ALIASES_CONFIG_KEY) or []
+
+
+def map_columns(headers: Iterable[Any], table_columns: List) -> Dict[str, Any]:
+    """
+    Маппинг {колонка таблицы: заголовок файла}. По порядку: заголовки, подтвержденные для колонки при прошлых
+    импортах, точное совпадение после нормализации, похожие по триграммам (лучшие пары первыми),
+    оставшиеся колонки - по порядку свободных заголовков, как и раньше
+    """
+    index = HeaderIndex(headers)
+    mapping: Dict[str, Any] = {}
+    used = set()
+
+    def assign(column_name: str, position: int):
+        mapping[column_name] = index.headers[position]
+        used.add(position)
+
+    for column in table_columns:
+        for alias in _aliases(column):
+            position = index.exact(alias)
+            if position is not None and position not in used:
+                assign(column.name, position)
+                break
+
+    for column in table_columns:
+        if column.name in mapping:
+            continue
+        position = index.exact(column.name)
+        if position is not None and position not in used:
+            assign(column.name, position)
+
+    pairs = []
+    for order, column in enumerate(table_columns):
+        if column.name not in mapping:
+            pairs.extend((score, order, position) for score, position in index.candidates(column.name))
+    for score, order, position in sorted(pairs, key=lambda item: (-item[0], item[1], item[2])):
+        column_name = table_columns[order].name
+        if column_name not in mapping and position not in used:
+            assign(column_name, position)
+
+    free = (position for position in range(len(index.headers)) if position not in used)
+    for column in table_columns:
+        if column.name not in mapping:
+            position = next(free, None)
+            if position is None:
+                break
+            assign(column.name, position)
+
+    return mapping
+
+
+def learn_aliases(table_columns: List, mapping: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+    """
+    Новые config колонок с запомненными заголовками из подтвержденного маппинга.
+    Возвращает {id колонки: config} только для изменившихся; заголовок, совпадающий с именем, не храним
+    """
+    updates = {}
+    for column in table_columns:
+        header = mapping.get(column.name)
+        if header is None:
+            continue
+        alias = normalize_header(header)
+        if not alias or _exact_key(alias) == _exact_key(normalize_header(column.name)):
+            continue
+        aliases = _aliases(column)
+        if aliases[:1] == [alias]:
+            continue
+        # Последний подтвержденный заголовок - первым
+        config = dict(column.config or {})
+        config[ALIASES_CONFIG_KEY] = ([alias] + [known for known in aliases if known != alias])[:MAX_ALIASES]
+        updates[column.id] = config
+    return updates
+
+
+def remember_mapping(db: Session, table_columns: List, mapping: Optional[Dict[str, Any]]):
+    """Запоминает маппинг, подтвержденный пользователем при успешном импорте; сбой не влияет на результат импорта"""
+    if not mapping:
+        return
+    try:
+        table_column_repository.update_configs(db, learn_aliases(table_columns, mapping))
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Не удалось сохранить маппинг колонок: {e}")
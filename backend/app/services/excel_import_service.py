@@ -1,34 +1,76 @@
 # services/excel_import_service.py
-import pandas as pd
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
+import uuid
 
 from ..database import get_db
 
 from .excel_service import ExcelService
+from .excel_stream_service import ExcelStreamImporter, validate_file, list_sheets, COMMIT_MODE_ATOMIC
+from .excel_job_service import import_job_manager, ImportJob
+from .upload_cache import upload_cache, cached_upload
+from .record_merge import merge_summary
+from .column_mapping import remember_mapping
+from .permission_service import PermissionService
+from .excel_process_pool import (
+    excel_process_pool, column_specs, ExcelPoolBusy,
+    preview_import_task, preview_create_table_task, create_table_task
+)
 from ..crud.table import table_template_repository, table_column_repository, table_record_repository
-from ..schemas.table import TableRecordCreate, TableTemplateCreate, TableColumnCreate
-from ..schemas.excel import ExcelImportResponse
+from ..schemas.table import TableTemplateCreate, TableColumnCreate
+from ..schemas.excel import (
+    ExcelImportResponse, ExcelValidationReport, ExcelImportJobResponse,
+    ExcelImportBatchResponse, ExcelSheetsResponse, ExcelSheetImport
+)
 from fastapi import Depends, HTTPException, status, UploadFile
+from starlette.concurrency import run_in_threadpool
 
 logger = logging.getLogger(__name__)
 
+def _check_merge_permissions(db: Session, user_id: Optional[int], table_template_id: int, delete_missing: bool):
+    """Слияние обновляет существующие строки, а delete_missing еще и удаляет: одного add_rows мало"""
+    required = ['edit_rows', 'delete_rows'] if delete_missing else ['edit_rows']
+    permission_service = PermissionService(db)
+    for permission_type in required:
+        if user_id is None or not permission_service.check_permission(user_id, table_template_id, permission_type):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Недостаточно прав: требуется право '{permission_type}'"
+            )
+
+def _check_key_columns(key_columns: Optional[List[str]], table_columns: List):
+    if not key_columns:
+        return
+    names = {col.name for col in table_columns}
+    unknown = [column for column in key_columns if column not in names]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Ключевые колонки отсутствуют в таблице: {', '.join(unknown)}"
+        )
+
+def _pool_busy(e: ExcelPoolBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(e),
+        headers={"Retry-After": "5"}
+    )
+
 class ExcelImportService:
     def __init__(self, db: Session):
         self.db = db
     
     async def preview_excel_import(
         self, 
-        file: UploadFile, 
+        file: Optional[UploadFile], 
         table_template_id: int,
-        skip_first_rows: int = 0
+        skip_first_rows: int = 0,
+        user_id: Optional[int] = None,
+        upload_token: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Превью импорта из Excel"""
+        """Превью импорта из Excel; в ответе upload_token для импорта без повторной загрузки"""
         try:
-            # Читаем файл
-            file_content = await file.read()
-            
             # Получаем колонки таблицы
             table_columns = table_column_repository.get_by_template_id(self.db, table_template_id)
             if not table_columns:
@@ -37,11 +79,19 @@ class ExcelImportService:
                     detail="Шаблон таблицы не найден или не имеет колонок"
                 )
             
-            # Получаем превью
-            preview_data = ExcelService.get_excel_preview(file_content, table_columns, skip_first_rows)
+            # Файл копируется на диск кусками, процесс пула читает его по пути и сохраняет разбор в кэш загрузок
+            async with cached_upload(file, upload_token, user_id) as entry:
+                preview_data = await excel_process_pool.run_interactive(
+                    preview_import_task, entry.path, column_specs(table_columns), skip_first_rows
+                )
             
+            preview_data['upload_token'] = entry.token
             return preview_data
             
+        except ExcelPoolBusy as e:
+            raise _pool_busy(e)
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при preview импорта: {str(e)}")
             raise HTTPException(
@@ -51,16 +101,24 @@ class ExcelImportService:
     
     async def import_excel_data(
         self,
-        file: UploadFile,
+        file: Optional[UploadFile],
         table_template_id: int,
-        mapping: Dict[str, str],
-        skip_first_rows: int = 0
+        mapping: Optional[Dict[str, str]],
+        skip_first_rows: int = 0,
+        commit_mode: str = COMMIT_MODE_ATOMIC,
+        full_report: bool = False,
+        reader_options: Optional[Dict[str, Any]] = None,
+        user_id: Optional[int] = None,
+        upload_token: Optional[str] = None,
+        key_columns: Optional[List[str]] = None,
+        delete_missing: bool = False
     ) -> ExcelImportResponse:
-        """Импорт данных из Excel в таблицу"""
+        """
+        Импорт данных из Excel, CSV или NDJSON в таблицу (формат по расширению файла).
+        С upload_token файл берется из кэша загрузок вместе с листом, разобранным при превью.
+        С key_columns - слияние: новые строки добавляются, измененные обновляются, совпадающие не пишутся
+        """
         try:
-            # Читаем файл
-            file_content = await file.read()
-            
             # Получаем колонки таблицы
             table_columns = table_column_repository.get_by_template_id(self.db, table_template_id)
             if not table_columns:
@@ -81,53 +139,65 @@ class ExcelImportService:
                     message="Шаблон таблицы не найден"
                 )
             
-            # Обрабатываем импорт
-            records_count, errors = ExcelService.process_excel_import(
-                file_content, mapping, table_columns, skip_first_rows
-            )
-            
-            if errors:
-                return ExcelImportResponse(
-                    success=False,
-                    imported_records=0,
-                    errors=errors,
-                    message="Обнаружены ошибки валидации"
-                )
-            
-            # Если ошибок нет, создаем записи в БД
-            df = ExcelService.parse_excel_file(file_content)
-            if skip_first_rows > 0:
-                df = df.iloc[skip_first_rows:].reset_index(drop=True)
+            _check_key_columns(key_columns, table_columns)
+            if key_columns:
+                _check_merge_permissions(self.db, user_id, table_template_id, delete_missing)
             
-            records_data = ExcelService.transform_to_records(df, mapping, table_columns)
-            created_count = 0
-            errors = []
+            # Один разбор, одна трансформация и пакетные INSERT в рамках выбранной транзакционной схемы
+            importer = ExcelStreamImporter(
+                self.db, table_template_id, mapping, table_columns,
+                commit_mode=commit_mode, full_report=full_report,
+                key_columns=key_columns, delete_missing=delete_missing, user_id=user_id
+            )
             
-            for record_data in records_data:
-                try:
-                    # Создаем объект TableRecordCreate
-                    record_create = TableRecordCreate(
-                        table_template_id=table_template_id,
-                        data=record_data['data']
+            # Разбор и вставка блокирующие, поэтому уводим их из event loop
+            if upload_token:
+                async with cached_upload(None, upload_token, user_id) as entry:
+                    created_count, errors, report = await run_in_threadpool(
+                        importer.import_file, entry.path, skip_first_rows, entry.filename,
+                        parsed_path=entry.parsed_path, **(reader_options or {})
                     )
-                    table_record_repository.create(self.db, record_create)
-                    created_count += 1
-                except Exception as e:
-                    logger.error(f"Ошибка при создании записи: {str(e)}")
-                    errors.append({
-                        'type': 'creation_error',
-                        'message': f'Ошибка при создании записи: {str(e)}'
-                    })
+            elif file is not None:
+                created_count, errors, report = await run_in_threadpool(
+                    importer.import_file, file.file, skip_first_rows, file.filename, **(reader_options or {})
+                )
+            else:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Передайте файл или upload_token"
+                )
             
-            success = created_count > 0 and len(errors) == 0
+            merge_stats = importer.merge_stats
+            # Слияние без изменений - тоже успех: файл совпал с таблицей
+            success = (created_count > 0 or merge_stats is not None) and len(errors) == 0
+            if success:
+                # Маппинг, переданный явно, - подтвержденный: следующие файлы с теми же заголовками сопоставятся сами
+                remember_mapping(self.db, table_columns, mapping)
+            if success and merge_stats is not None:
+                message = merge_summary(merge_stats)
+            elif success and report.invalid_rows:
+                message = f"Импортировано {created_count} записей, пропущено строк с ошибками: {report.invalid_rows}"
+            elif success:
+                message = f"Успешно импортировано {created_count} записей"
+            elif errors and commit_mode == COMMIT_MODE_ATOMIC:
+                message = "Обнаружены ошибки, импорт отменен"
+            elif errors:
+                message = f"Обнаружены ошибки, импорт остановлен после {created_count} записей"
+            else:
+                message = "Произошли ошибки при импорте"
             
             return ExcelImportResponse(
                 success=success,
                 imported_records=created_count,
                 errors=errors,
-                message=f"Успешно импортировано {created_count} записей" if success else "Произошли ошибки при импорте"
+                message=message,
+                validation_report=report,
+                mapping=importer.mapping,
+                merge_stats=merge_stats
             )
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при импорте Excel: {str(e)}")
             return ExcelImportResponse(
@@ -137,61 +207,266 @@ class ExcelImportService:
                 message="Ошибка при импорте данных"
             )
     
+    async def submit_import_job(
+        self,
+        file: Optional[UploadFile],
+        table_template_id: int,
+        mapping: Dict[str, str],
+        user_id: int,
+        skip_first_rows: int = 0,
+        commit_mode: str = COMMIT_MODE_ATOMIC,
+        full_report: bool = False,
+        upload_token: Optional[str] = None,
+        key_columns: Optional[List[str]] = None,
+        delete_missing: bool = False
+    ) -> ExcelImportJobResponse:
+        """Фоновый импорт: сохраняем файл (или берем из кэша загрузок) и сразу возвращаем id задачи"""
+        table_columns = table_column_repository.get_by_template_id(self.db, table_template_id)
+        if not table_columns:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Шаблон таблицы не найден или не имеет колонок"
+            )
+        _check_key_columns(key_columns, table_columns)
+        if key_columns:
+            _check_merge_permissions(self.db, user_id, table_template_id, delete_missing)
+        
+        # Файл в кэше загрузок; lease снимет воркер после завершения задачи
+        async with cached_upload(file, upload_token, user_id) as entry:
+            entry = upload_cache.acquire(entry.token, user_id)
+        job = import_job_manager.submit(
+            entry.path, entry.filename, table_template_id, user_id,
+            mapping, skip_first_rows, commit_mode, full_report,
+            reader_options={'parsed_path': entry.parsed_path},
+            key_columns=key_columns, delete_missing=delete_missing,
+            release=lambda: upload_cache.release(entry)
+        )
+        return job.to_response()
+    
+    def get_import_job(self, job_id: str, current_user) -> ImportJob:
+        """Задачу видит только ее автор и администратор"""
+        job = import_job_manager.get(job_id)
+        if job is None or (job.user_id != current_user.id and current_user.role != 'admin'):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Задача импорта не найдена"
+            )
+        return job
+    
+    def cancel_import_job(self, job_id: str, current_user) -> ExcelImportJobResponse:
+        job = self.get_import_job(job_id, current_user)
+        import_job_manager.cancel(job.id)
+        return job.to_response()
+    
+    async def list_workbook_sheets(
+        self,
+        file: Optional[UploadFile],
+        user_id: int,
+        upload_token: Optional[str] = None
+    ) -> ExcelSheetsResponse:
+        """Листы книги с числом строк по метаданным; файл остается в кэше загрузок для импорта листов"""
+        try:
+            async with cached_upload(file, upload_token, user_id) as entry:
+                sheets = await excel_process_pool.run_interactive(list_sheets, entry.path, entry.filename)
+        except ExcelPoolBusy as e:
+            raise _pool_busy(e)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return ExcelSheetsResponse(sheets=sheets, upload_token=entry.token)
+    
+    async def submit_sheets_import(
+        self,
+        file: Optional[UploadFile],
+        sheets: Dict[str, ExcelSheetImport],
+        user_id: int,
+        commit_mode: str = COMMIT_MODE_ATOMIC,
+        full_report: bool = False,
+        upload_token: Optional[str] = None
+    ) -> ExcelImportBatchResponse:
+        """
+        Импорт нескольких листов книги в свои таблицы: по фоновой задаче на лист в общем пуле импорта,
+        у каждой своя сессия и пакетные INSERT; суммарный прогресс - по group_id
+        """
+        if not sheets:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Не выбрано ни одного листа для импорта"
+            )
+        
+        # Права и колонки проверяем до загрузки задач: либо стартуют все листы, либо ни один
+        permission_service = PermissionService(self.db)
+        for sheet_name, target in sheets.items():
+            if not permission_service.check_permission(user_id, target.table_id, 'add_rows'):
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail=f"Недостаточно прав: требуется право 'add_rows' на таблицу {target.table_id}"
+                )
+            table_columns = table_column_repository.get_by_template_id(self.db, target.table_id)
+            if not table_columns:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Шаблон таблицы {target.table_id} не найден или не имеет колонок"
+                )
+            _check_key_columns(target.key_columns, table_columns)
+            if target.key_columns:
+                _check_merge_permissions(self.db, user_id, target.table_id, target.delete_missing)
+        
+        try:
+            async with cached_upload(file, upload_token, user_id) as entry:
+                workbook_sheets = await excel_process_pool.run_interactive(list_sheets, entry.path, entry.filename)
+                sheet_rows = {sheet.name: sheet.total_rows for sheet in workbook_sheets}
+                unknown = [name for name in sheets if name not in sheet_rows]
+                if unknown:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Листы не найдены в книге: {', '.join(unknown)}"
+                    )
+                
+                group_id = uuid.uuid4().hex
+                jobs = []
+                for sheet_name, target in sheets.items():
+                    # Своя аренда файла на каждую задачу: файл живет, пока не закончится последний лист
+                    lease = upload_cache.acquire(entry.token, user_id)
+                    job = import_job_manager.submit(
+                        lease.path, lease.filename, target.table_id, user_id,
+                        target.mapping, target.skip_first_rows, commit_mode, full_report,
+                        reader_options={'sheet_name': sheet_name},
+                        release=lambda lease=lease: upload_cache.release(lease),
+                        key_columns=target.key_columns, delete_missing=target.delete_missing,
+                        group_id=group_id
+                    )
+                    # Оценка по метаданным листа, пока задача ждет в очереди: суммарный прогресс сразу с ETA
+                    if job.total_rows is None and sheet_rows[sheet_name] is not None:
+                        job.total_rows = max(sheet_rows[sheet_name] - target.skip_first_rows, 0)
+                    jobs.append(job)
+        except ExcelPoolBusy as e:
+            raise _pool_busy(e)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return import_job_manager.group_to_response(group_id, jobs)
+    
+    def get_import_group(self, group_id: str, current_user) -> ExcelImportBatchResponse:
+        """Группу видит только ее автор и администратор"""
+        jobs = import_job_manager.get_group(group_id)
+        if not jobs or (jobs[0].user_id != current_user.id and current_user.role != 'admin'):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Группа задач импорта не найдена"
+            )
+        return import_job_manager.group_to_response(group_id, jobs)
+    
+    def cancel_import_group(self, group_id: str, current_user) -> ExcelImportBatchResponse:
+        for job in self.get_import_group(group_id, current_user).jobs:
+            import_job_manager.cancel(job.job_id)
+        return import_job_manager.group_to_response(group_id, import_job_manager.get_group(group_id))
+    
+    async def validate_excel_data(
+        self,
+        file: Optional[UploadFile],
+        table_template_id: int,
+        mapping: Dict[str, str],
+        skip_first_rows: int = 0,
+        full_report: bool = False,
+        user_id: Optional[int] = None,
+        upload_token: Optional[str] = None
+    ) -> ExcelValidationReport:
+        """Проверка всех строк файла по схеме таблицы без импорта"""
+        table_columns = table_column_repository.get_by_template_id(self.db, table_template_id)
+        if not table_columns:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Шаблон таблицы не найден или не имеет колонок"
+            )
+        
+        try:
+            async with cached_upload(file, upload_token, user_id) as entry:
+                return await run_in_threadpool(
+                    validate_file, entry.path, mapping, table_columns, skip_first_rows, entry.filename,
+                    full_report, table_id=table_template_id, user_id=user_id, parsed_path=entry.parsed_path
+                )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Ошибка при обработке файла: {str(e)}"
+            )
+    
+    async def preview_create_table(
+        self,
+        file: Optional[UploadFile],
+        skip_first_rows: int = 0,
+        user_id: Optional[int] = None,
+        upload_token: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Превью структуры новой таблицы из Excel файла; определенные типы запоминаются для create-table"""
+        try:
+            async with cached_upload(file, upload_token, user_id) as entry:
+                # Типы кэшируются в записи загрузки (ключ - sha256 файла): повторное превью и create-table их не пересчитывают
+                preview = await excel_process_pool.run_interactive(
+                    preview_create_table_task, entry.path, skip_first_rows,
+                    entry.inferred_columns.get(skip_first_rows)
+                )
+                entry.inferred_columns[skip_first_rows] = preview['proposed_structure']['columns']
+            return {
+                "success": True,
+                **preview,
+                "upload_token": entry.token,
+                "message": "Файл успешно проанализирован"
+            }
+        except ExcelPoolBusy as e:
+            raise _pool_busy(e)
+        except HTTPException:
+            raise
+        except Exception as e:
+            return {
+                "success": False,
+                "message": f"Ошибка при анализе файла: {str(e)}"
+            }
+    
     async def create_table_from_excel(
         self,
-        file: UploadFile,
+        file: Optional[UploadFile],
         table_name: str,
-        skip_first_rows: int = 0
+        skip_first_rows: int = 0,
+        user_id: Optional[int] = None,
+        upload_token: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Создание новой таблицы из Excel файла"""
+        """Создание новой таблицы из Excel файла (или загрузки из превью по upload_token)"""
         try:
-            file_content = await file.read()
-            df = ExcelService.parse_excel_file(file_content)
-            
-            if skip_first_rows > 0:
-                df = df.iloc[skip_first_rows:].reset_index(drop=True)
-            
-            # Создаем структуру таблицы и данные
-            table_template_data, records_data = ExcelService.create_table_from_excel(df, table_name)
+            # Разбор в пуле процессов (или из кэша разбора); типы, определенные в превью, переиспользуются
+            async with cached_upload(file, upload_token, user_id) as entry:
+                columns_data, columns, arrays = await excel_process_pool.run_bulk(
+                    create_table_task, entry.path, skip_first_rows, entry.parsed_path,
+                    entry.inferred_columns.get(skip_first_rows)
+                )
+            records_data = await run_in_threadpool(ExcelService.columns_to_data, columns, arrays)
             
             # Создаем шаблон таблицы
-            template_create = TableTemplateCreate(name=table_template_data['name'])
+            template_create = TableTemplateCreate(name=table_name)
             db_template = table_template_repository.create(self.db, template_create)
             
             # Создаем колонки
-            for column_data in table_template_data['columns']:
+            for column_data in columns_data:
                 column_create = TableColumnCreate(
                     table_template_id=db_template.id,
                     **column_data
                 )
                 table_column_repository.create(self.db, column_create)
             
-            # Создаем записи
-            created_records = 0
-            for record_data in records_data:
-                # Конвертируем значения в правильные типы для записи
-                converted_data = {}
-                for col_name, value in record_data['data'].items():
-                    if pd.isna(value):
-                        converted_data[col_name] = None
-                    else:
-                        converted_data[col_name] = value
-                
-                record_create = TableRecordCreate(
-                    table_template_id=db_template.id,
-                    data=converted_data
-                )
-                table_record_repository.create(self.db, record_create)
-                created_records += 1
+            # Создаем записи одним пакетным INSERT
+            created_records = table_record_repository.create_many(self.db, db_template.id, records_data)
             
             return {
                 'success': True,
                 'table_template_id': db_template.id,
-                'created_columns': len(table_template_data['columns']),
+                'created_columns': len(columns_data),
                 'created_records': created_records,
                 'message': f'Таблица "{table_name}" успешно создана'
             }
             
+        except ExcelPoolBusy as e:
+            raise _pool_busy(e)
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при создании таблицы из Excel: {str(e)}")
             return {
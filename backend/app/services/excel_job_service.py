@@ -0,0 +1,301 @@
+# services/excel_job_service.py
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+from .excel_stream_service import ExcelStreamImporter, COMMIT_MODE_ATOMIC
+from .upload_spool import remove_spooled
+from .record_merge import merge_summary
+from .column_mapping import remember_mapping
+from ..database import SessionLocal
+from ..crud.table import table_column_repository
+from ..core.config import settings
+from ..schemas.excel import ExcelImportJobResponse, ExcelImportBatchResponse, ExcelValidationReport, ExcelMergeStats
+from ..websockets import table_sync_manager
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+JOB_FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class ImportJob:
+    """Состояние одной фоновой задачи импорта; пишет воркер, читают HTTP и WebSocket"""
+
+    def __init__(
+        self,
+        table_template_id: int,
+        user_id: int,
+        file_path: str,
+        filename: Optional[str],
+        mapping: Dict[str, str],
+        skip_first_rows: int,
+        commit_mode: str,
+        full_report: bool,
+        reader_options: Optional[Dict[str, Any]] = None,
+        release: Optional[Callable[[], None]] = None,
+        key_columns: Optional[List[str]] = None,
+        delete_missing: bool = False,
+        group_id: Optional[str] = None
+    ):
+        self.id = uuid.uuid4().hex
+        self.group_id = group_id
+        self.table_template_id = table_template_id
+        self.user_id = user_id
+        self.file_path = file_path
+        self.filename = filename
+        self.mapping = mapping
+        self.skip_first_rows = skip_first_rows
+        self.commit_mode = commit_mode
+        self.full_report = full_report
+        self.reader_options = reader_options or {}
+        # Как освободить файл по завершении: по умолчанию он удаляется
+        self.release = release
+        self.key_columns = key_columns
+        self.delete_missing = delete_missing
+
+        self.status = JOB_QUEUED
+        self.rows_processed = 0
+        self.total_rows: Optional[int] = None
+        self.imported_records = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.message = "Задача поставлена в очередь"
+        self.validation_report: Optional[ExcelValidationReport] = None
+        self.merge_stats: Optional[ExcelMergeStats] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.cancel_event = threading.Event()
+        self._started_monotonic: Optional[float] = None
+        self._finished_monotonic: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in JOB_FINISHED_STATUSES
+
+    def to_response(self) -> ExcelImportJobResponse:
+        rows_per_second = 0.0
+        eta_seconds = None
+        if self._started_monotonic is not None:
+            elapsed = (self._finished_monotonic or time.monotonic()) - self._started_monotonic
+            if elapsed > 0:
+                rows_per_second = self.rows_processed / elapsed
+            if not self.finished and self.total_rows and rows_per_second > 0:
+                eta_seconds = max(self.total_rows - self.rows_processed, 0) / rows_per_second
+
+        return ExcelImportJobResponse(
+            job_id=self.id,
+            table_template_id=self.table_template_id,
+            filename=self.filename,
+            sheet_name=self.reader_options.get('sheet_name'),
+            group_id=self.group_id,
+            status=self.status,
+            commit_mode=self.commit_mode,
+            rows_processed=self.rows_processed,
+            total_rows=self.total_rows,
+            imported_records=self.imported_records,
+            rows_per_second=round(rows_per_second, 1),
+            eta_seconds=round(eta_seconds, 1) if eta_seconds is not None else None,
+            errors=self.errors,
+            message=self.message,
+            validation_report=self.validation_report,
+            merge_stats=self.merge_stats,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at
+        )
+
+
+class ImportJobManager:
+    """
+    Очередь фоновых импортов: файл уже сохранен на диск (upload_spool), пул потоков импортирует его пачками,
+    прогресс доступен по id задачи и рассылается подписчикам таблицы через TableSyncManager
+    """
+
+    def __init__(self, max_workers: int = settings.EXCEL_IMPORT_WORKERS):
+        self.max_workers = max_workers
+        self.jobs: Dict[str, ImportJob] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="excel-import")
+        return self._executor
+
+    def submit(
+        self,
+        file_path: str,
+        filename: Optional[str],
+        table_template_id: int,
+        user_id: int,
+        mapping: Dict[str, str],
+        skip_first_rows: int = 0,
+        commit_mode: str = COMMIT_MODE_ATOMIC,
+        full_report: bool = False,
+        reader_options: Optional[Dict[str, Any]] = None,
+        release: Optional[Callable[[], None]] = None,
+        key_columns: Optional[List[str]] = None,
+        delete_missing: bool = False,
+        group_id: Optional[str] = None
+    ) -> ImportJob:
+        """Ставит импорт в очередь; вызывать из event loop, чтобы прогресс можно было рассылать по WebSocket"""
+        self._loop = asyncio.get_running_loop()
+        self._cleanup_finished()
+
+        job = ImportJob(
+            table_template_id, user_id, file_path, filename,
+            mapping, skip_first_rows, commit_mode, full_report, reader_options, release,
+            key_columns, delete_missing, group_id
+        )
+        with self._lock:
+            self.jobs[job.id] = job
+        self._get_executor().submit(self._run, job)
+        self._notify(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        return self.jobs.get(job_id)
+
+    def get_group(self, group_id: str) -> List[ImportJob]:
+        with self._lock:
+            return [job for job in self.jobs.values() if job.group_id == group_id]
+
+    def cancel(self, job_id: str) -> Optional[ImportJob]:
+        """Запрос отмены; воркер остановится на границе пачки"""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_event.set()
+        job.message = "Запрошена отмена импорта"
+        return job
+
+    @staticmethod
+    def group_to_response(group_id: str, jobs: List[ImportJob]) -> ExcelImportBatchResponse:
+        """Суммарный прогресс задач группы (листов одной книги)"""
+        responses = [job.to_response() for job in jobs]
+        statuses = {job.status for job in jobs}
+        if statuses & {JOB_RUNNING, JOB_QUEUED}:
+            status = JOB_QUEUED if statuses == {JOB_QUEUED} else JOB_RUNNING
+        elif JOB_FAILED in statuses:
+            status = JOB_FAILED
+        elif JOB_CANCELLED in statuses:
+            status = JOB_CANCELLED
+        else:
+            status = JOB_COMPLETED
+        totals = [job.total_rows for job in jobs]
+        return ExcelImportBatchResponse(
+            group_id=group_id,
+            status=status,
+            rows_processed=sum(job.rows_processed for job in jobs),
+            total_rows=sum(totals) if totals and None not in totals else None,
+            imported_records=sum(job.imported_records for job in jobs),
+            jobs=responses
+        )
+
+    def _run(self, job: ImportJob):
+        try:
+            if job.cancel_event.is_set():
+                self._finish(job, JOB_CANCELLED, "Импорт отменен до начала обработки")
+            else:
+                self._import(job)
+        finally:
+            if job.release is not None:
+                job.release()
+            else:
+                remove_spooled(job.file_path)
+
+    def _import(self, job: ImportJob):
+        job.status = JOB_RUNNING
+        job.started_at = datetime.now()
+        job._started_monotonic = time.monotonic()
+        job.message = "Импорт выполняется"
+        self._notify(job)
+
+        db = SessionLocal()
+        try:
+            table_columns = table_column_repository.get_by_template_id(db, job.table_template_id)
+            if not table_columns:
+                self._finish(job, JOB_FAILED, "Шаблон таблицы не найден или не имеет колонок")
+                return
+
+            def on_progress(rows_read: int, created_count: int, total_rows: Optional[int]):
+                job.rows_processed = rows_read
+                job.imported_records = created_count
+                job.total_rows = total_rows
+                self._notify(job)
+
+            importer = ExcelStreamImporter(
+                db, job.table_template_id, job.mapping, table_columns,
+                commit_mode=job.commit_mode, full_report=job.full_report,
+                progress=on_progress, cancel_event=job.cancel_event,
+                key_columns=job.key_columns, delete_missing=job.delete_missing, user_id=job.user_id
+            )
+            created_count, errors, report = importer.import_file(
+                job.file_path, job.skip_first_rows, job.filename, **job.reader_options
+            )
+
+            job.imported_records = created_count
+            job.errors = errors
+            job.validation_report = report
+            job.merge_stats = importer.merge_stats
+            if any(error.get('type') == 'cancelled' for error in errors):
+                self._finish(job, JOB_CANCELLED, f"Импорт отменен, сохранено записей: {created_count}")
+            elif errors:
+                self._finish(job, JOB_FAILED, "Обнаружены ошибки при импорте")
+            else:
+                remember_mapping(db, table_columns, job.mapping)
+                if importer.merge_stats is not None:
+                    self._finish(job, JOB_COMPLETED, merge_summary(importer.merge_stats))
+                else:
+                    self._finish(job, JOB_COMPLETED, f"Импортировано {created_count} записей")
+        except Exception as e:
+            logger.error(f"Ошибка фонового импорта {job.id}: {str(e)}")
+            job.errors = [{'type': 'import_error', 'message': str(e)}]
+            self._finish(job, JOB_FAILED, f"Ошибка при импорте: {str(e)}")
+        finally:
+            db.close()
+
+    def _finish(self, job: ImportJob, status: str, message: str):
+        job.status = status
+        job.message = message
+        job.finished_at = datetime.now()
+        job._finished_monotonic = time.monotonic()
+        self._notify(job)
+
+    def _notify(self, job: ImportJob):
+        """Прогресс подписчикам таблицы; вызывается из потока воркера"""
+        if self._loop is None or self._loop.is_closed():
+            return
+        message = {
+            "type": "import_progress",
+            **job.to_response().model_dump(mode="json", exclude={"errors", "validation_report", "merge_stats"})
+        }
+        asyncio.run_coroutine_threadsafe(
+            table_sync_manager.broadcast_to_table(str(job.table_template_id), message), self._loop
+        )
+
+    def _cleanup_finished(self):
+        """Забывает завершенные задачи старше EXCEL_JOB_TTL_SECONDS"""
+        deadline = time.monotonic() - settings.EXCEL_JOB_TTL_SECONDS
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self.jobs.items()
+                if job.finished and job._finished_monotonic < deadline
+            ]
+            for job_id in expired:
+                del self.jobs[job_id]
+
+
+# Глобальный экземпляр
+import_job_manager = ImportJobManager()
@@ -0,0 +1,174 @@
+# services/excel_process_pool.py
+import asyncio
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from .excel_service import ExcelService
+from .upload_cache import read_parsed, write_parsed
+from .type_inference import infer_columns, complete_select_options
+from .excel_stream_service import read_head
+from ..core.config import settings
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# ORM-объекты колонок в процесс не передаем: достаточно имени, типа и config (в нем запомненные заголовки)
+ColumnSpec = namedtuple('ColumnSpec', ['name', 'data_type', 'config'], defaults=(None,))
+
+LANE_INTERACTIVE = 'interactive'
+LANE_BULK = 'bulk'
+
+
+class ExcelPoolBusy(Exception):
+    """Очередь разбора файлов переполнена"""
+
+
+# Функции, которые выполняются в дочерних процессах. Принимают путь к сохраненной загрузке (а не байты,
+# которые пришлось бы копировать в процесс), возвращают словари и колоночные массивы, а не DataFrame
+
+def _read_frame(file_path: str, skip_first_rows: int, parsed_path: Optional[str] = None):
+    """Лист целиком; если передан parsed_path, разбор берется из кэша или сохраняется туда"""
+    if parsed_path and os.path.exists(parsed_path):
+        df = ExcelService.from_columns(*read_parsed(parsed_path))
+    else:
+        df = ExcelService.parse_excel_file(file_path)
+        if parsed_path:
+            # В кэш - исходные массивы pandas (с dtype), а не JSON-представление: импорт конвертирует их сам
+            write_parsed(parsed_path, [str(col) for col in df.columns], [df[col].to_numpy() for col in df.columns])
+    if skip_first_rows > 0:
+        df = df.iloc[skip_first_rows:].reset_index(drop=True)
+    return df
+
+
+# Превью читает только заголовок и первые EXCEL_PREVIEW_SAMPLE_ROWS строк: время не зависит от размера файла,
+# число строк берется из метаданных листа. Путь к файлу в кэше загрузок сохраняет расширение, по нему выбирается reader
+
+def preview_import_task(
+    file_path: str,
+    column_specs: List[ColumnSpec],
+    skip_first_rows: int = 0
+) -> Dict[str, Any]:
+    df, total_rows = read_head(file_path, file_path, settings.EXCEL_PREVIEW_SAMPLE_ROWS, skip_first_rows)
+    return {**ExcelService.get_excel_preview(df, column_specs), 'total_rows': total_rows}
+
+
+def preview_create_table_task(
+    file_path: str,
+    skip_first_rows: int = 0,
+    inferred_columns: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    df, total_rows = read_head(file_path, file_path, settings.EXCEL_PREVIEW_SAMPLE_ROWS, skip_first_rows)
+    return {
+        'proposed_structure': {'name': 'preview_table', 'columns': inferred_columns or infer_columns(df)},
+        'preview_data': ExcelService.get_preview_data(df),
+        'total_rows': total_rows,
+        'excel_columns': df.columns.tolist()
+    }
+
+
+def create_table_task(
+    file_path: str,
+    skip_first_rows: int = 0,
+    parsed_path: Optional[str] = None,
+    inferred_columns: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[List[Dict[str, Any]], List[str], List[np.ndarray]]:
+    """
+    Структура новой таблицы и данные колонками. Типы из превью повторно не определяются,
+    только варианты select дополняются по всему листу: превью видело лишь первые строки
+    """
+    df = _read_frame(file_path, skip_first_rows, parsed_path)
+    columns, arrays = ExcelService.to_columns(df)
+    if inferred_columns:
+        inferred_columns = complete_select_options(inferred_columns, df)
+    return inferred_columns or infer_columns(df), columns, arrays
+
+
+class _Lane:
+    """Ограничение на число одновременно выполняемых и ожидающих задач одного класса"""
+
+    def __init__(self, slots: int, max_waiting: int):
+        self.slots = max(slots, 1)
+        self.max_waiting = max_waiting
+        self.pending = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.slots)
+        return self._semaphore
+
+
+class ExcelProcessPool:
+    """
+    Пул процессов для CPU-тяжелого разбора Excel и определения типов, чтобы не держать GIL
+    и event loop. Две полосы: interactive (превью) может занять все процессы,
+    bulk (создание таблиц) - не больше EXCEL_PARSE_BULK_SLOTS и всегда на один меньше, чем процессов,
+    поэтому превью не ждет за импортами. При одном процессе bulk выполняется в потоке, процесс остается превью
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.EXCEL_PARSE_WORKERS,
+        bulk_slots: int = settings.EXCEL_PARSE_BULK_SLOTS,
+        max_waiting: int = settings.EXCEL_PARSE_MAX_QUEUE
+    ):
+        self.workers = workers
+        # Единственный процесс не отдаем полосе bulk: превью встало бы в очередь за разбором целого файла
+        self._bulk_in_thread = workers == 1
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lanes = {
+            LANE_INTERACTIVE: _Lane(workers, max_waiting),
+            LANE_BULK: _Lane(min(bulk_slots, max(workers - 1, 1)), max_waiting),
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: в процессе уже есть потоки (пул импорта, threadpool starlette), fork с ними небезопасен
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    async def run(self, lane: str, fn: Callable, *args) -> Any:
+        """Выполнить функцию в пуле; ExcelPoolBusy, если очередь полосы заполнена"""
+        lane_state = self._lanes[lane]
+        if lane_state.pending >= lane_state.slots + lane_state.max_waiting:
+            raise ExcelPoolBusy(f"Слишком много файлов в обработке ({lane_state.pending}), повторите позже")
+
+        lane_state.pending += 1
+        try:
+            async with lane_state.semaphore:
+                # EXCEL_PARSE_WORKERS=0 - без процессов, в потоке (отладка, платформы без spawn)
+                if self.workers <= 0 or (lane == LANE_BULK and self._bulk_in_thread):
+                    return await run_in_threadpool(fn, *args)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            lane_state.pending -= 1
+
+    async def run_interactive(self, fn: Callable, *args) -> Any:
+        return await self.run(LANE_INTERACTIVE, fn, *args)
+
+    async def run_bulk(self, fn: Callable, *args) -> Any:
+        return await self.run(LANE_BULK, fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def column_specs(table_columns: List) -> List[ColumnSpec]:
+    return [ColumnSpec(col.name, col.data_type, col.config) for col in table_columns]
+
+
+# Глобальный экземпляр
+excel_process_pool = ExcelProcessPool()
@@ -1,249 +1,323 @@
 # services/excel_service.py
 import pandas as pd
-from typing import Dict, List, Any, Tuple
+import numpy as np
+from typing import Dict, List, Any, Tuple, Union
 import io  # Добавляем импорт io
-from datetime import datetime
+from datetime import datetime, date
 import json
 
+from .excel_validation import ExcelValidationCollector
+from .column_mapping import map_columns
+
+# Словари и форматы, общие для построчной и поколоночной конвертации
+TRUE_VALUES = ['true', '1', 'yes', 'да', 'истина']
+FALSE_VALUES = ['false', '0', 'no', 'нет', 'ложь']
+DATE_FORMATS = ['%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y', '%Y.%m.%d']
+DATETIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%d.%m.%Y %H:%M', '%Y-%m-%dT%H:%M:%S']
+# Пробелы-разделители разрядов, которые встречаются в выгрузках (обычный, неразрывный, узкий)
+NUMBER_SPACES = ' \u00a0\u202f'
+
 class ExcelService:
     @staticmethod
-    def parse_excel_file(file_content: bytes) -> pd.DataFrame:
-        """Парсинг Excel файла из памяти (без временных файлов)"""
+    def parse_excel_file(source: Union[bytes, str]) -> pd.DataFrame:
+        """Парсинг Excel файла из памяти или с диска (путь к сохраненной загрузке)"""
         try:
+            if isinstance(source, str):
+                # С диска читаем напрямую: лишней копии файла в памяти нет
+                return pd.read_excel(source)
             # Используем BytesIO для чтения из памяти
-            with io.BytesIO(file_content) as buffer:
+            with io.BytesIO(source) as buffer:
                 df = pd.read_excel(buffer)
             return df
         except Exception as e:
             raise ValueError(f"Ошибка при чтении Excel файла: {str(e)}")
     
-    @staticmethod
-    def _convert_value(value: Any, data_type: str) -> Any:
-        """Конвертирует значение в нужный тип данных"""
-        if pd.isna(value) or value is None:
-            return None
-            
-        try:
-            if data_type == 'text':
-                return str(value)
-            elif data_type == 'number':
-                if isinstance(value, (int, float)):
-                    return float(value)
-                elif isinstance(value, str):
-                    cleaned = value.replace(' ', '').replace(',', '.')
-                    return float(cleaned)
-                else:
-                    return float(value)
-            elif data_type == 'boolean':
-                if isinstance(value, bool):
-                    return value
-                elif isinstance(value, (int, float)):
-                    return bool(value)
-                elif isinstance(value, str):
-                    return value.lower() in ['true', '1', 'yes', 'да', 'истина']
-                else:
-                    return bool(value)
-            elif data_type == 'date':
-                if isinstance(value, datetime):
-                    return value.strftime('%Y-%m-%d')
-                elif isinstance(value, str):
-                    for fmt in ['%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y', '%Y.%m.%d']:
-                        try:
-                            dt = datetime.strptime(value, fmt)
-                            return dt.strftime('%Y-%m-%d')
-                        except ValueError:
-                            continue
-                return str(value)
-            elif data_type == 'datetime':
-                if isinstance(value, datetime):
-                    return value.isoformat()
-                elif isinstance(value, str):
-                    for fmt in ['%Y-%m-%d %H:%M:%S', '%d.%m.%Y %H:%M', '%Y-%m-%dT%H:%M:%S']:
-                        try:
-                            dt = datetime.strptime(value, fmt)
-                            return dt.isoformat()
-                        except ValueError:
-                            continue
-                return str(value)
-            elif data_type == 'select':
-                return str(value)
-            else:
-                return str(value)
-        except (ValueError, TypeError) as e:
-            print(f"Ошибка конвертации значения {value} в тип {data_type}: {e}")
-            return str(value)
-
     @staticmethod
     def auto_detect_mapping(df: pd.DataFrame, table_columns: List) -> Dict[str, str]:
-        """Автоматическое определение маппинга колонок по имени"""
-        mapping = {}
-        excel_columns = df.columns.tolist()
-        used_excel_columns = set()
-        
-        # Сначала пытаемся найти точное совпадение по имени
-        for col in table_columns:
-            col_name_lower = col.name.lower()
-            
-            for excel_col in excel_columns:
-                excel_col_lower = str(excel_col).lower()
-                if col_name_lower == excel_col_lower and excel_col not in used_excel_columns:
-                    mapping[col.name] = excel_col
-                    used_excel_columns.add(excel_col)
-                    break
-        
-        # Затем частичные совпадения
-        for col in table_columns:
-            if col.name in mapping:
-                continue
-                
-            col_name_lower = col.name.lower()
-            best_match = None
-            best_score = 0
-            
-            for excel_col in excel_columns:
-                if excel_col in used_excel_columns:
-                    continue
-                    
-                excel_col_lower = str(excel_col).lower()
-                
-                if col_name_lower in excel_col_lower or excel_col_lower in col_name_lower:
-                    score = len(set(col_name_lower) & set(excel_col_lower))
-                    if score > best_score:
-                        best_score = score
-                        best_match = excel_col
-            
-            if best_match:
-                mapping[col.name] = best_match
-                used_excel_columns.add(best_match)
-        
-        # Заполняем оставшиеся колонки по порядку
-        for col in table_columns:
-            if col.name not in mapping:
-                for excel_col in excel_columns:
-                    if excel_col not in used_excel_columns:
-                        mapping[col.name] = excel_col
-                        used_excel_columns.add(excel_col)
-                        break
-        
-        return mapping
-    
+        """
+        Автоматическое определение маппинга колонок по имени: запомненные заголовки колонок,
+        совпадение после нормализации, похожие по триграммам, остальные по порядку (см. column_mapping)
+        """
+        return map_columns(df.columns.tolist(), table_columns)
+
     @staticmethod
     def get_preview_data(df: pd.DataFrame, rows: int = 10) -> List[Dict]:
         """Возвращает превью данных для отображения пользователю"""
         preview_df = df.head(rows)
-        preview_data = []
-        
-        for _, row in preview_df.iterrows():
-            record = {}
-            for col in df.columns:
-                value = row[col]
-                if pd.isna(value):
-                    record[col] = None
-                else:
-                    # Для превью оставляем строковое представление
-                    record[col] = str(value) if not isinstance(value, (int, float, bool)) else value
-            preview_data.append(record)
-        
-        return preview_data
+        records = preview_df.astype(object).where(preview_df.notna(), None).to_dict('records')
+        for record in records:
+            for col, value in record.items():
+                # Для превью оставляем строковое представление
+                if value is not None and not isinstance(value, (int, float, bool)):
+                    record[col] = str(value)
+        return records
     
     @staticmethod
     def validate_data_with_schema(df: pd.DataFrame, mapping: Dict[str, str], table_columns: List) -> Tuple[bool, List[Dict]]:
-        """Упрощенная валидация данных по схеме таблицы (без обязательных полей)"""
-        errors = []
-        
-        # Проверяем только типы данных в первых 10 строках для примера
-        sample_size = min(10, len(df))
-        for i in range(sample_size):
-            for col in table_columns:
-                if col.name in mapping:
-                    excel_col = mapping[col.name]
-                    if excel_col in df.columns:
-                        value = df.iloc[i][excel_col]
-                        
-                        # Пропускаем пустые значения
-                        if pd.isna(value):
-                            continue
-                            
-                        try:
-                            ExcelService._convert_value(value, col.data_type)
-                        except Exception as e:
-                            errors.append({
-                                'type': 'type_conversion_error',
-                                'message': f'Строка {i+1}: неверный тип данных в поле "{col.name}" - {str(e)}',
-                                'row': i + 1,
-                                'column': col.name,
-                                'value': str(value)
-                            })
-        
-        return len(errors) == 0, errors
+        """Валидация всех строк по схеме таблицы (без обязательных полей)"""
+        collector = ExcelValidationCollector(mapping, table_columns)
+        collector.add_chunk(df, ExcelService.convert_columns(df, mapping, table_columns))
+        return collector.error_count == 0, collector.errors()
+
+    # Поколоночная (векторная) конвертация
+
+    @staticmethod
+    def convert_column(series: pd.Series, data_type: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Конвертирует колонку целиком в тип колонки таблицы.
+        Возвращает (значения как object-массив с None для пустых, маска значений, которые не удалось сконвертировать)
+        """
+        series = series.reset_index(drop=True)
+        notna = series.notna().to_numpy()
+        result = np.full(len(series), None, dtype=object)
+        invalid = np.zeros(len(series), dtype=bool)
+        if not notna.any():
+            return result, invalid
+
+        if data_type == 'number':
+            ExcelService._convert_number_column(series, notna, result, invalid)
+        elif data_type == 'boolean':
+            ExcelService._convert_boolean_column(series, notna, result, invalid)
+        elif data_type == 'date':
+            ExcelService._convert_datetime_column(series, notna, result, invalid, DATE_FORMATS, True)
+        elif data_type == 'datetime':
+            ExcelService._convert_datetime_column(series, notna, result, invalid, DATETIME_FORMATS, False)
+        else:
+            ExcelService._convert_text_column(series, notna, result)
+
+        return result, invalid
+
+    @staticmethod
+    def _as_text(series: pd.Series) -> pd.Series:
+        """str(value) для каждого значения; у дат формат как у str(Timestamp)"""
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series.dt.strftime('%Y-%m-%d %H:%M:%S')
+        return series.astype(str)
+
+    @staticmethod
+    def _convert_text_column(series: pd.Series, notna: np.ndarray, result: np.ndarray):
+        result[notna] = ExcelService._as_text(series[notna]).to_numpy(dtype=object)
+
+    @staticmethod
+    def _convert_number_column(series: pd.Series, notna: np.ndarray, result: np.ndarray, invalid: np.ndarray):
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            result[notna] = series[notna].astype(float).to_numpy()
+            return
+
+        values = series[notna]
+        kinds = values.map(type)
+        is_str = kinds.eq(str).to_numpy()
+        numbers = np.full(len(values), np.nan)
+        # Разделители нормализуем только у строк, числа из Excel разбираем как есть
+        if is_str.any():
+            normalized = (
+                values[is_str]
+                .str.replace(f'[{NUMBER_SPACES}]', '', regex=True)
+                .str.replace(',', '.', regex=False)
+            )
+            numbers[is_str] = pd.to_numeric(normalized, errors='coerce').to_numpy(dtype=float)
+        if not is_str.all():
+            # bool - подкласс int, float(True) == 1.0
+            others = values[~is_str]
+            is_bool = kinds[~is_str].eq(bool).to_numpy()
+            others_numbers = pd.to_numeric(others.where(~is_bool, others.astype(bool).astype(int)), errors='coerce')
+            numbers[~is_str] = others_numbers.to_numpy(dtype=float)
+
+        converted = ~np.isnan(numbers)
+        positions = np.flatnonzero(notna)
+        result[positions[converted]] = numbers[converted]
+        # Как и раньше, неконвертируемое значение сохраняется строкой
+        result[positions[~converted]] = values[~converted].astype(str).to_numpy(dtype=object)
+        invalid[positions[~converted]] = True
+
+    @staticmethod
+    def _convert_boolean_column(series: pd.Series, notna: np.ndarray, result: np.ndarray, invalid: np.ndarray):
+        if pd.api.types.is_bool_dtype(series):
+            result[notna] = series[notna].to_numpy(dtype=bool)
+            return
+        if pd.api.types.is_numeric_dtype(series):
+            result[notna] = (series[notna] != 0).to_numpy()
+            return
+
+        values = series[notna]
+        positions = np.flatnonzero(notna)
+        is_str = values.map(type).eq(str).to_numpy()
+
+        lowered = values[is_str].str.lower()
+        result[positions[is_str]] = lowered.isin(TRUE_VALUES).to_numpy()
+        invalid[positions[is_str]] = ~lowered.isin(TRUE_VALUES + FALSE_VALUES).to_numpy()
+
+        others = values[~is_str]
+        if len(others):
+            numbers = pd.to_numeric(others, errors='coerce')
+            is_number = numbers.notna().to_numpy()
+            result[positions[~is_str][is_number]] = (numbers[is_number] != 0).to_numpy()
+            # Остальные объекты (bool, даты и т.п.) - как bool(value)
+            rest = others[~is_number]
+            result[positions[~is_str][~is_number]] = np.array([bool(v) for v in rest], dtype=bool)
+
+    @staticmethod
+    def _detect_formats(strings: pd.Series, formats: List[str], sample_size: int = 20) -> List[str]:
+        """Порядок форматов по тому, сколько значений из выборки они разбирают"""
+        sample = strings.head(sample_size)
+        scores = {
+            fmt: int(pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum())
+            for fmt in formats
+        }
+        return sorted(formats, key=lambda fmt: -scores[fmt])
+
+    @staticmethod
+    def _format_datetimes(parsed: pd.Series, date_only: bool) -> np.ndarray:
+        """strftime('%Y-%m-%d') для дат или isoformat() для даты-времени, без построчного Python"""
+        if getattr(parsed.dt, 'tz', None) is not None:
+            # Редкий случай с часовым поясом - isoformat с указанием смещения
+            return np.array([
+                value.strftime('%Y-%m-%d') if date_only else value.isoformat() for value in parsed
+            ], dtype=object)
+
+        values = parsed.to_numpy(dtype='datetime64[us]')
+        if date_only:
+            return np.datetime_as_string(values, unit='D').astype(object)
+
+        seconds = values.astype('datetime64[s]')
+        text = np.datetime_as_string(seconds, unit='s').astype(object)
+        # isoformat() добавляет микросекунды, только если они не нулевые
+        has_micro = seconds != values
+        if has_micro.any():
+            text[has_micro] = np.datetime_as_string(values[has_micro], unit='us').astype(object)
+        return text
+
+    @staticmethod
+    def _convert_datetime_column(
+        series: pd.Series,
+        notna: np.ndarray,
+        result: np.ndarray,
+        invalid: np.ndarray,
+        formats: List[str],
+        date_only: bool
+    ):
+        if pd.api.types.is_datetime64_any_dtype(series):
+            result[notna] = ExcelService._format_datetimes(series[notna], date_only)
+            return
+
+        values = series[notna]
+        positions = np.flatnonzero(notna)
+        kinds = values.map(type)
+        # Проверяем подклассы по уникальным типам, а не по каждому значению
+        unique_kinds = kinds.unique()
+        is_datetime = kinds.isin([t for t in unique_kinds if issubclass(t, datetime)]).to_numpy()
+        is_plain_date = kinds.isin([t for t in unique_kinds if issubclass(t, date)]).to_numpy()
+        is_str = kinds.eq(str).to_numpy()
+
+        if is_datetime.any():
+            parsed = pd.to_datetime(values[is_datetime], errors='coerce')
+            result[positions[is_datetime]] = ExcelService._format_datetimes(parsed, date_only)
+
+        unparsed = ~is_datetime
+        if is_str.any():
+            strings = values[is_str]
+            pending = np.ones(len(strings), dtype=bool)
+            parsed_text = np.full(len(strings), None, dtype=object)
+            # Формат определяем по выборке один раз, дальше разбираем колонку целиком
+            for fmt in ExcelService._detect_formats(strings, formats):
+                parsed = pd.to_datetime(strings[pending], format=fmt, errors='coerce')
+                ok = parsed.notna().to_numpy()
+                if ok.any():
+                    idx = np.flatnonzero(pending)[ok]
+                    parsed_text[idx] = ExcelService._format_datetimes(parsed[ok], date_only)
+                    pending[idx] = False
+                if not pending.any():
+                    break
+            str_positions = np.flatnonzero(is_str)
+            done = ~pending
+            result[positions[str_positions[done]]] = parsed_text[done]
+            unparsed[str_positions[done]] = False
+
+        # Остальное (числа, нераспознанные строки) сохраняется строкой, как раньше
+        if unparsed.any():
+            result[positions[unparsed]] = values[unparsed].astype(str).to_numpy(dtype=object)
+            # date без времени - не ошибка, str(date) уже в нужном формате
+            invalid[positions[unparsed]] = ~is_plain_date[unparsed]
+
+    @staticmethod
+    def convert_columns(df: pd.DataFrame, mapping: Dict[str, str], table_columns: List) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """Конвертирует все колонки маппинга: {имя колонки таблицы: (значения, маска ошибок)}"""
+        column_types = {col.name: col.data_type for col in table_columns}
+        converted = {}
+        for column_name, excel_column in mapping.items():
+            if excel_column in df.columns:
+                converted[column_name] = ExcelService.convert_column(
+                    df[excel_column], column_types.get(column_name, 'text')
+                )
+        return converted
+
+    @staticmethod
+    def build_data(converted: Dict[str, Tuple[np.ndarray, np.ndarray]], row_mask: np.ndarray = None) -> List[Dict[str, Any]]:
+        """Собирает словари data из сконвертированных колонок; пустые строки отбрасываются"""
+        if not converted:
+            return []
+        names = list(converted)
+        columns = [values for values, _ in converted.values()]
+
+        # Полностью пустые строки отсекаем маской, а не проверкой каждой строки
+        keep = np.zeros(len(columns[0]), dtype=bool)
+        for values in columns:
+            keep |= values != None  # noqa: E711 - поэлементное сравнение numpy
+        if row_mask is not None:
+            keep &= row_mask
+        if not keep.all():
+            columns = [values[keep] for values in columns]
+
+        return [dict(zip(names, row)) for row in zip(*(values.tolist() for values in columns))]
+
+    @staticmethod
+    def convert_to_data(df: pd.DataFrame, mapping: Dict[str, str], table_columns: List) -> List[Dict[str, Any]]:
+        """Поколоночная конвертация в словари data для вставки"""
+        return ExcelService.build_data(ExcelService.convert_columns(df, mapping, table_columns))
 
     @staticmethod
     def transform_to_records(df: pd.DataFrame, mapping: Dict[str, str], table_columns: List) -> List[Dict[str, Any]]:
         """Трансформация данных Excel в записи с учетом типов данных"""
-        records = []
-        
-        # Создаем словарь колонок для быстрого доступа
-        column_dict = {col.name: col for col in table_columns}
-        print(f"column_dict {df}")
-        for index, row in df.iterrows():
-            record_data = {}
-            print(record_data)
-            for column_name, excel_column in mapping.items():
-                print(f"column_name {column_name}, column {excel_column}")
-                if excel_column in df.columns:
-                    value = row[excel_column]
-                    print(f"value {value}, column {excel_column}")
-                    # Получаем информацию о типе данных колонки
-                    col_info = column_dict.get(column_name)
-                    data_type = col_info.data_type if col_info else 'text'
-                    
-                    # Конвертируем значение
-                    converted_value = ExcelService._convert_value(value, data_type)
-                    record_data[column_name] = converted_value
-            
-            # Добавляем только если есть хотя бы одно непустое поле
-            if any(v is not None for v in record_data.values()):
-                records.append({'data': record_data})
-        
-        return records
+        return [{'data': data} for data in ExcelService.convert_to_data(df, mapping, table_columns)]
     
+    # Колоночное представление для передачи между процессами: вместо DataFrame - имена и массивы
+
+    @staticmethod
+    def _json_safe_column(series: pd.Series) -> np.ndarray:
+        """Значения колонки как object-массив: None вместо NaN, даты строками ISO"""
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = np.array([value.isoformat() if not pd.isna(value) else None for value in series], dtype=object)
+            return values
+        values = series.to_numpy(dtype=object, copy=True)
+        values[pd.isna(series).to_numpy()] = None
+        return values
+
+    @staticmethod
+    def to_columns(df: pd.DataFrame) -> Tuple[List[str], List[np.ndarray]]:
+        return [str(col) for col in df.columns], [ExcelService._json_safe_column(df[col]) for col in df.columns]
+
+    @staticmethod
+    def from_columns(columns: List[str], arrays: List[np.ndarray]) -> pd.DataFrame:
+        return pd.DataFrame({name: values for name, values in zip(columns, arrays)}, columns=columns)
+
+    @staticmethod
+    def columns_to_data(columns: List[str], arrays: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """Словари data по строкам из колоночного представления"""
+        return [dict(zip(columns, row)) for row in zip(*(values.tolist() for values in arrays))]
+
+    @staticmethod
+    def infer_columns(df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Определение типов колонок для новой таблицы (по выборке, см. type_inference)"""
+        from .type_inference import infer_columns  # type_inference сам импортирует константы этого модуля
+        return infer_columns(df)
+
     @staticmethod
     def create_table_from_excel(df: pd.DataFrame, table_name: str) -> Tuple[Dict, List[Dict]]:
         """Создает структуру таблицы и данные из Excel файла"""
-        columns = []
-        for col_name in df.columns:
-            col_data = df[col_name]
-            
-            # Определяем тип данных на основе первых непустых значений
-            data_type = 'text'  # по умолчанию
-            
-            numeric_values = pd.to_numeric(col_data, errors='coerce')
-            if numeric_values.notna().sum() > len(col_data) * 0.8:
-                data_type = 'number'
-            elif pd.to_datetime(col_data, errors='coerce').notna().sum() > len(col_data) * 0.8:
-                data_type = 'datetime'
-            elif col_data.dropna().apply(lambda x: str(x).lower() in ['true', 'false', '0', '1', 'да', 'нет']).all():
-                data_type = 'boolean'
-            
-            columns.append({
-                'name': str(col_name),
-                'data_type': data_type,
-                'order_index': len(columns),
-                'config': {}
-            })
+        columns = ExcelService.infer_columns(df)
         
-        # Трансформируем данные
-        records_data = []
-        for _, row in df.iterrows():
-            record = {}
-            for col in df.columns:
-                value = row[col]
-                if pd.isna(value):
-                    record[str(col)] = None
-                else:
-                    # Для создания таблицы сохраняем оригинальные типы
-                    record[str(col)] = value
-            records_data.append({'data': record})
+        # Для создания таблицы сохраняем оригинальные значения (даты - строками ISO)
+        records_data = [{'data': data} for data in ExcelService.columns_to_data(*ExcelService.to_columns(df))]
         
         table_template = {
             'name': table_name,
@@ -252,46 +326,15 @@ class ExcelService:
         
         return table_template, records_data
 
-    @staticmethod
-    def process_excel_import(
-        file_content: bytes,
-        mapping: Dict[str, str],
-        table_columns: List,
-        skip_first_rows: int = 0
-    ) -> Tuple[int, List[Dict[str, Any]]]:
-        """Основной метод для импорта данных из Excel"""
-        try:
-            # Парсим Excel
-            df = ExcelService.parse_excel_file(file_content)
-            
-            # Пропускаем указанное количество строк
-            if skip_first_rows > 0:
-                df = df.iloc[skip_first_rows:].reset_index(drop=True)
-            
-            # Валидируем данные
-            is_valid, errors = ExcelService.validate_data_with_schema(df, mapping, table_columns)
-            if not is_valid:
-                return 0, errors
-            
-            # Трансформируем в записи
-            print(f"df in {df}, {mapping}, {table_columns}")
-            records = ExcelService.transform_to_records(df, mapping, table_columns)
-            
-            return len(records), []
-            
-        except Exception as e:
-            print(e)
-            return 0, [{'type': 'processing_error', 'message': str(e)}]
-
     @staticmethod
     def get_excel_preview(
-        file_content: bytes, 
+        source: Union[bytes, str, pd.DataFrame], 
         table_columns: List,
         skip_first_rows: int = 0
     ) -> Dict[str, Any]:
-        """Получение превью Excel файла и предложенного маппинга"""
+        """Получение превью Excel файла (или уже разобранного листа) и предложенного маппинга"""
         try:
-            df = ExcelService.parse_excel_file(file_content)
+            df = source if isinstance(source, pd.DataFrame) else ExcelService.parse_excel_file(source)
             
             # Пропускаем строки если нужно
             if skip_first_rows > 0:
@@ -303,11 +346,16 @@ class ExcelService:
             # Превью данных
             preview_data = ExcelService.get_preview_data(df)
             
+            # Проверка всех переданных строк по предложенному маппингу (в превью это первые строки файла)
+            collector = ExcelValidationCollector(suggested_mapping, table_columns)
+            collector.add_chunk(df, ExcelService.convert_columns(df, suggested_mapping, table_columns))
+            
             return {
                 'columns': df.columns.tolist(),
                 'preview_data': preview_data,
                 'suggested_mapping': suggested_mapping,
-                'table_columns': [{'name': col.name, 'data_type': col.data_type} for col in table_columns]
+                'table_columns': [{'name': col.name, 'data_type': col.data_type} for col in table_columns],
+                'validation_report': collector.build()
             }
             
         except Exception as e:
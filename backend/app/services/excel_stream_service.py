@@ -0,0 +1,499 @@
+# services/excel_stream_service.py
+import os
+import threading
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+import logging
+
+from .excel_service import ExcelService
+from .excel_validation import ExcelValidationCollector
+from .record_merge import RecordMerger
+from .upload_cache import read_parsed
+from .text_stream_service import CsvStreamReader, NdjsonStreamReader, CSV_EXTENSIONS, NDJSON_EXTENSIONS
+from ..crud.table import table_record_repository
+from ..core.config import settings
+from ..schemas.excel import ExcelValidationReport, ExcelMergeStats, ExcelSheetInfo
+
+logger = logging.getLogger(__name__)
+
+ExcelSource = Union[str, BinaryIO]
+
+# atomic - все или ничего в одной транзакции, partial - коммит после каждой пачки
+COMMIT_MODE_ATOMIC = 'atomic'
+COMMIT_MODE_PARTIAL = 'partial'
+IMPORT_COMMIT_MODES = (COMMIT_MODE_ATOMIC, COMMIT_MODE_PARTIAL)
+
+# progress(rows_read, created_count, total_rows) - вызывается после каждой пачки
+ProgressCallback = Callable[[int, int, Optional[int]], None]
+
+
+class ExcelStreamReader:
+    """Потоковое чтение xlsx через openpyxl read_only: в памяти только текущая пачка строк"""
+
+    STREAMABLE_EXTENSIONS = ('.xlsx', '.xlsm')
+
+    def __init__(
+        self,
+        source: ExcelSource,
+        chunk_size: int = settings.EXCEL_IMPORT_CHUNK_SIZE,
+        skip_first_rows: int = 0,
+        sheet_name: Optional[str] = None
+    ):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.skip_first_rows = skip_first_rows
+        self.sheet_name = sheet_name
+        self.columns: List[str] = []
+        self.total_rows: Optional[int] = None
+        self._workbook = None
+        self._rows: Optional[Iterator[tuple]] = None
+
+    @classmethod
+    def supports(cls, filename: Optional[str]) -> bool:
+        """openpyxl умеет читать только формат Office Open XML"""
+        return bool(filename) and filename.lower().endswith(cls.STREAMABLE_EXTENSIONS)
+
+    def __enter__(self) -> "ExcelStreamReader":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def open(self):
+        if hasattr(self.source, 'seek'):
+            self.source.seek(0)
+        try:
+            self._workbook = load_workbook(self.source, read_only=True, data_only=True)
+        except Exception as e:
+            raise ValueError(f"Ошибка при чтении Excel файла: {str(e)}")
+
+        sheet = self._workbook[self.sheet_name] if self.sheet_name else self._workbook.worksheets[0]
+        self._rows = sheet.iter_rows(values_only=True)
+        # Оценка по размеру листа из метаданных; без нее прогресс считается без ETA
+        if sheet.max_row:
+            self.total_rows = max(sheet.max_row - 1 - self.skip_first_rows, 0)
+
+        header = next(self._rows, None) or ()
+        self.columns = self._normalize_header(header)
+
+        # Как и df.iloc[skip_first_rows:]: пропускаем строки данных после заголовка
+        for _ in range(self.skip_first_rows):
+            if next(self._rows, None) is None:
+                break
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        self._rows = None
+
+    @staticmethod
+    def _normalize_header(header: tuple) -> List[str]:
+        """Имена колонок по правилам pd.read_excel: пустые -> 'Unnamed: i', дубли -> 'name.1'"""
+        # Отбрасываем пустой хвост заголовка
+        last = len(header)
+        while last > 0 and header[last - 1] is None:
+            last -= 1
+
+        columns = []
+        seen: Dict[str, int] = {}
+        for i, value in enumerate(header[:last]):
+            name = f"Unnamed: {i}" if value is None else str(value)
+            if name in seen:
+                seen[name] += 1
+                name = f"{name}.{seen[name]}"
+            else:
+                seen[name] = 0
+            columns.append(name)
+        return columns
+
+    def iter_chunks(self) -> Iterator[List[tuple]]:
+        """Отдает строки пачками по chunk_size, выровненными по ширине заголовка"""
+        if self._rows is None:
+            raise RuntimeError("Reader is not opened")
+
+        width = len(self.columns)
+        chunk: List[tuple] = []
+        for row in self._rows:
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            elif len(row) > width:
+                row = row[:width]
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def iter_dataframes(self) -> Iterator[pd.DataFrame]:
+        """Те же пачки в виде небольших DataFrame для переиспользования ExcelService"""
+        for chunk in self.iter_chunks():
+            yield pd.DataFrame.from_records(chunk, columns=self.columns)
+
+
+class ExcelFrameReader:
+    """
+    Чтение форматов, которые openpyxl не понимает (.xls), или уже разобранного листа из кэша загрузок:
+    один разбор через pandas, дальше те же пачки
+    """
+
+    def __init__(
+        self,
+        source: ExcelSource,
+        chunk_size: int = settings.EXCEL_IMPORT_CHUNK_SIZE,
+        skip_first_rows: int = 0,
+        parsed_path: Optional[str] = None,
+        sheet_name: Optional[str] = None
+    ):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.skip_first_rows = skip_first_rows
+        self.parsed_path = parsed_path
+        self.sheet_name = sheet_name
+        self.columns: List[str] = []
+        self.total_rows: Optional[int] = None
+        self._df: Optional[pd.DataFrame] = None
+
+    def __enter__(self) -> "ExcelFrameReader":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def open(self):
+        if self.parsed_path:
+            df = ExcelService.from_columns(*read_parsed(self.parsed_path))
+        else:
+            if hasattr(self.source, 'seek'):
+                self.source.seek(0)
+            try:
+                df = pd.read_excel(self.source, sheet_name=self.sheet_name or 0)
+            except Exception as e:
+                raise ValueError(f"Ошибка при чтении Excel файла: {str(e)}")
+        if self.skip_first_rows > 0:
+            df = df.iloc[self.skip_first_rows:].reset_index(drop=True)
+        df.columns = [str(col) for col in df.columns]
+        self.columns = df.columns.tolist()
+        self.total_rows = len(df)
+        self._df = df
+
+    def close(self):
+        self._df = None
+
+    def iter_dataframes(self) -> Iterator[pd.DataFrame]:
+        for start in range(0, len(self._df), self.chunk_size):
+            yield self._df.iloc[start:start + self.chunk_size]
+
+
+def open_excel_reader(
+    source: ExcelSource,
+    filename: Optional[str] = None,
+    chunk_size: int = settings.EXCEL_IMPORT_CHUNK_SIZE,
+    skip_first_rows: int = 0,
+    sheet_name: Optional[str] = None
+) -> Union[ExcelStreamReader, ExcelFrameReader]:
+    """Выбирает потоковый reader для xlsx и pandas для остального; без sheet_name - первый лист"""
+    if filename is None or ExcelStreamReader.supports(filename):
+        return ExcelStreamReader(source, chunk_size, skip_first_rows, sheet_name)
+    return ExcelFrameReader(source, chunk_size, skip_first_rows, sheet_name=sheet_name)
+
+
+def read_head(
+    source: ExcelSource,
+    filename: Optional[str] = None,
+    rows: int = settings.EXCEL_PREVIEW_SAMPLE_ROWS,
+    skip_first_rows: int = 0,
+    sheet_name: Optional[str] = None
+) -> Tuple[pd.DataFrame, Optional[int]]:
+    """
+    Заголовок и первые rows строк без разбора всего файла (xlsx - openpyxl read_only, CSV - одна пачка).
+    Возвращает (DataFrame, число строк по метаданным или None, если формат его не хранит)
+    """
+    with open_reader(source, filename, rows, skip_first_rows, sheet_name=sheet_name) as reader:
+        head = next(reader.iter_dataframes(), None)
+        if head is None:
+            head = pd.DataFrame(columns=reader.columns)
+        total_rows = reader.total_rows
+    return head.reset_index(drop=True), total_rows
+
+
+def list_sheets(source: ExcelSource, filename: Optional[str] = None) -> List[ExcelSheetInfo]:
+    """
+    Листы книги с заголовком и числом строк. Для xlsx размер берется из метаданных листа (dimension)
+    и читается только первая строка; для остальных форматов число строк неизвестно
+    """
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    sheets = []
+    try:
+        if filename is None or ExcelStreamReader.supports(filename):
+            workbook = load_workbook(source, read_only=True, data_only=True)
+            try:
+                for index, sheet in enumerate(workbook.worksheets):
+                    header = next(sheet.iter_rows(max_row=1, values_only=True), None) or ()
+                    sheets.append(ExcelSheetInfo(
+                        name=sheet.title,
+                        index=index,
+                        total_rows=max(sheet.max_row - 1, 0) if sheet.max_row else None,
+                        total_columns=sheet.max_column,
+                        columns=ExcelStreamReader._normalize_header(header)
+                    ))
+            finally:
+                workbook.close()
+        else:
+            with pd.ExcelFile(source) as workbook:
+                for index, name in enumerate(workbook.sheet_names):
+                    columns = [str(col) for col in workbook.parse(name, nrows=0).columns]
+                    sheets.append(ExcelSheetInfo(
+                        name=str(name), index=index, total_columns=len(columns), columns=columns
+                    ))
+    except Exception as e:
+        raise ValueError(f"Ошибка при чтении Excel файла: {str(e)}")
+    return sheets
+
+
+def open_reader(
+    source: ExcelSource,
+    filename: Optional[str] = None,
+    chunk_size: int = settings.EXCEL_IMPORT_CHUNK_SIZE,
+    skip_first_rows: int = 0,
+    delimiter: Optional[str] = None,
+    encoding: Optional[str] = None,
+    parsed_path: Optional[str] = None,
+    sheet_name: Optional[str] = None
+):
+    """
+    Reader по расширению файла: CSV, NDJSON или Excel; у всех одинаковый интерфейс пачек.
+    parsed_path - первый лист, уже разобранный при превью (кэш загрузок), читается вместо исходного файла.
+    sheet_name - лист книги Excel (кэш разбора к нему не относится)
+    """
+    if sheet_name is not None:
+        return open_excel_reader(source, filename, chunk_size, skip_first_rows, sheet_name)
+    if parsed_path and os.path.exists(parsed_path):
+        return ExcelFrameReader(source, chunk_size, skip_first_rows, parsed_path)
+    name = (filename or '').lower()
+    if name.endswith(CSV_EXTENSIONS):
+        return CsvStreamReader(source, chunk_size, skip_first_rows, delimiter, encoding)
+    if name.endswith(NDJSON_EXTENSIONS):
+        return NdjsonStreamReader(source, chunk_size, skip_first_rows, encoding)
+    return open_excel_reader(source, filename, chunk_size, skip_first_rows)
+
+
+class ExcelStreamImporter:
+    """Импорт за один проход: прочитали пачку -> сконвертировали и проверили -> вставили -> следующая пачка"""
+
+    def __init__(
+        self,
+        db: Session,
+        table_template_id: int,
+        mapping: Optional[Dict[str, str]],
+        table_columns: List,
+        chunk_size: int = settings.EXCEL_IMPORT_CHUNK_SIZE,
+        commit_mode: str = COMMIT_MODE_ATOMIC,
+        full_report: bool = False,
+        progress: Optional[ProgressCallback] = None,
+        cancel_event: Optional[threading.Event] = None,
+        key_columns: Optional[List[str]] = None,
+        delete_missing: bool = False,
+        user_id: Optional[int] = None
+    ):
+        """
+        key_columns - слияние по ключу вместо добавления: пишутся только новые и измененные строки.
+        user_id - автор импорта, владелец полного отчета
+        """
+        if commit_mode not in IMPORT_COMMIT_MODES:
+            raise ValueError(f"Неизвестный режим фиксации: {commit_mode}")
+        self.db = db
+        self.table_template_id = table_template_id
+        self.mapping = mapping
+        self.table_columns = table_columns
+        self.chunk_size = chunk_size
+        self.commit_mode = commit_mode
+        self.full_report = full_report
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.key_columns = key_columns
+        self.delete_missing = delete_missing
+        self.user_id = user_id
+        # Итоги слияния после импорта с key_columns
+        self.merge_stats: Optional[ExcelMergeStats] = None
+
+    def import_file(
+        self,
+        source: ExcelSource,
+        skip_first_rows: int = 0,
+        filename: Optional[str] = None,
+        **reader_options
+    ) -> Tuple[int, List[Dict[str, Any]], ExcelValidationReport]:
+        """
+        Возвращает (количество сохраненных записей, ошибки, отчет валидации).
+        Без маппинга он определяется по заголовку файла, как в превью.
+        """
+        with open_reader(source, filename, self.chunk_size, skip_first_rows, **reader_options) as reader:
+            if self.mapping is None:
+                self.mapping = ExcelService.auto_detect_mapping(
+                    pd.DataFrame(columns=reader.columns), self.table_columns
+                )
+            return self.import_dataframes(reader.iter_dataframes(), reader.total_rows)
+
+    def import_dataframes(
+        self,
+        chunks: Iterator[pd.DataFrame],
+        total_rows: Optional[int] = None
+    ) -> Tuple[int, List[Dict[str, Any]], ExcelValidationReport]:
+        """
+        Общий конвейер для любого источника пачек.
+        atomic: при первой ошибке валидации все откатывается, но файл проверяется до конца ради полного отчета.
+        partial: строки с ошибками пропускаются, остальные сохраняются пачками.
+        Отмена через cancel_event проверяется между пачками: atomic откатывает все, partial сохраняет закоммиченное.
+        С key_columns строки сливаются с существующими записями; удаление отсутствующих (delete_missing)
+        выполняется только после успешного прохода по всему файлу.
+        """
+        atomic = self.commit_mode == COMMIT_MODE_ATOMIC
+        collector = ExcelValidationCollector(
+            self.mapping, self.table_columns, full_report=self.full_report,
+            table_id=self.table_template_id, user_id=self.user_id
+        )
+        merger = self._create_merger()
+        created_count = 0
+        rows_read = 0
+        failed = False
+        cancelled = False
+
+        try:
+            if merger is not None:
+                merger.load()
+
+            for df in chunks:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    cancelled = True
+                    break
+
+                converted = ExcelService.convert_columns(df, self.mapping, self.table_columns)
+                invalid_rows = collector.add_chunk(df, converted, rows_read)
+                rows_read += len(df)
+
+                if invalid_rows.any() and atomic and not failed:
+                    failed = True
+                    self.db.rollback()
+                if failed:
+                    self._report_progress(rows_read, 0, total_rows)
+                    continue
+
+                if merger is not None and invalid_rows.any():
+                    self._protect_invalid_keys(merger, converted, invalid_rows)
+                records_data = ExcelService.build_data(converted, ~invalid_rows)
+                # В атомарном режиме только flush: INSERT уходит в БД, но коммит один в конце
+                if merger is not None:
+                    created_count += merger.merge_chunk(records_data, commit=not atomic)
+                else:
+                    created_count += table_record_repository.create_many(
+                        self.db, self.table_template_id, records_data, commit=not atomic
+                    )
+                logger.info(f"Импорт в таблицу {self.table_template_id}: обработано {rows_read} строк")
+                self._report_progress(rows_read, created_count, total_rows)
+
+            if cancelled:
+                if atomic:
+                    self.db.rollback()
+                    created_count = 0
+                elif merger is not None:
+                    self.merge_stats = merger.stats
+                return created_count, [{
+                    'type': 'cancelled',
+                    'message': f'Импорт отменен после {rows_read} строк',
+                    'row': rows_read
+                }], collector.build()
+
+            if merger is not None and not failed:
+                merger.finish(commit=not atomic)
+                self.merge_stats = merger.stats
+            if atomic and not failed:
+                self.db.commit()
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка при сохранении записей: {str(e)}")
+            self.db.rollback()
+            self.merge_stats = merger.stats if merger is not None and not atomic else None
+            return (0 if atomic else created_count), [{
+                'type': 'creation_error',
+                'message': f'Ошибка при создании записей: {str(e)}',
+                'row': rows_read
+            }], collector.build()
+        except Exception:
+            self.db.rollback()
+            collector.build()
+            raise
+
+        report = collector.build()
+        if failed:
+            return 0, collector.errors(), report
+        # В режиме partial пропущенные строки - не ошибка импорта, они описаны в отчете
+        return created_count, [], report
+
+    def _create_merger(self) -> Optional[RecordMerger]:
+        if not self.key_columns:
+            return None
+        unmapped = [column for column in self.key_columns if column not in self.mapping]
+        if unmapped:
+            raise ValueError(f"Ключевые колонки не сопоставлены с колонками файла: {', '.join(unmapped)}")
+        value_columns = [col.name for col in self.table_columns if col.name in self.mapping]
+        return RecordMerger(
+            self.db, self.table_template_id, self.key_columns, value_columns, self.delete_missing
+        )
+
+    @staticmethod
+    def _protect_invalid_keys(merger: RecordMerger, converted, invalid_rows):
+        """
+        Строки с ошибками пропускаются, но их ключи есть в файле: при delete_missing записи с этими ключами
+        не удаляются. Если ошибка в самой ключевой колонке, ключ неизвестен - удаление отменяется целиком
+        """
+        if not merger.delete_missing:
+            return
+        for column in merger.key_columns:
+            values = converted.get(column)
+            if values is not None and (values[1] & invalid_rows).any():
+                merger.keep_missing("в файле есть строки с ошибкой в ключевой колонке")
+                return
+        merger.mark_seen(ExcelService.build_data(converted, invalid_rows))
+
+    def _report_progress(self, rows_read: int, created_count: int, total_rows: Optional[int]):
+        if self.progress is None:
+            return
+        try:
+            self.progress(rows_read, created_count, total_rows)
+        except Exception as e:
+            # Ошибка в обработчике прогресса не должна ронять импорт
+            logger.warning(f"Ошибка при отправке прогресса импорта: {e}")
+
+
+def validate_file(
+    source: ExcelSource,
+    mapping: Dict[str, str],
+    table_columns: List,
+    skip_first_rows: int = 0,
+    filename: Optional[str] = None,
+    full_report: bool = False,
+    chunk_size: int = settings.EXCEL_IMPORT_CHUNK_SIZE,
+    table_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    **reader_options
+) -> ExcelValidationReport:
+    """Проверка всего файла пачками без записи в БД; table_id и user_id - владельцы полного отчета"""
+    collector = ExcelValidationCollector(
+        mapping, table_columns, full_report=full_report, table_id=table_id, user_id=user_id
+    )
+    rows_read = 0
+    try:
+        with open_reader(source, filename, chunk_size, skip_first_rows, **reader_options) as reader:
+            for df in reader.iter_dataframes():
+                collector.add_chunk(df, ExcelService.convert_columns(df, mapping, table_columns), rows_read)
+                rows_read += len(df)
+    finally:
+        report = collector.build()
+    return report
@@ -0,0 +1,192 @@
+# services/excel_validation.py
+import csv
+import json
+import os
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from ..core.config import settings
+from ..schemas.excel import ExcelValidationReport, ExcelColumnValidation
+
+logger = logging.getLogger(__name__)
+
+REPORT_FIELDS = ['row', 'column', 'excel_column', 'data_type', 'value']
+
+
+class ExcelValidationCollector:
+    """
+    Накапливает результаты валидации по пачкам: счетчики, первые N проблемных строк
+    по каждой колонке и, по запросу, полный CSV-отчет на диске
+    """
+
+    def __init__(
+        self,
+        mapping: Dict[str, str],
+        table_columns: List,
+        max_samples: int = settings.EXCEL_VALIDATION_SAMPLE_ERRORS,
+        full_report: bool = False,
+        table_id: Optional[int] = None,
+        user_id: Optional[int] = None
+    ):
+        """table_id и user_id сохраняются рядом с полным отчетом: скачать его может только автор или тот, кто видит таблицу"""
+        self.mapping = mapping
+        self.table_id = table_id
+        self.user_id = user_id
+        self.column_types = {col.name: col.data_type for col in table_columns}
+        self.max_samples = max_samples
+        self.total_rows = 0
+        self.invalid_rows = 0
+        self.error_count = 0
+        self._columns: Dict[str, ExcelColumnValidation] = {}
+        self._report_id: Optional[str] = None
+        self._report_file = None
+        self._report_writer = None
+        if full_report:
+            self._open_report()
+
+    def _open_report(self):
+        os.makedirs(settings.EXCEL_REPORTS_DIR, exist_ok=True)
+        cleanup_expired_reports()
+        self._report_id = uuid.uuid4().hex
+        with open(owner_path(self._report_id), 'w', encoding='utf-8') as owner_file:
+            json.dump({'table_id': self.table_id, 'user_id': self.user_id}, owner_file)
+        self._report_file = open(report_path(self._report_id), 'w', newline='', encoding='utf-8-sig')
+        self._report_writer = csv.writer(self._report_file)
+        self._report_writer.writerow(REPORT_FIELDS)
+
+    def add_chunk(
+        self,
+        df: pd.DataFrame,
+        converted: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        row_offset: int = 0
+    ) -> np.ndarray:
+        """Учитывает пачку; возвращает маску строк с хотя бы одной ошибкой"""
+        invalid_rows = np.zeros(len(df), dtype=bool)
+
+        for column_name, (_, invalid) in converted.items():
+            # Валидируем только колонки таблицы, как и раньше
+            if column_name not in self.column_types:
+                continue
+            count = int(invalid.sum())
+            if not count:
+                continue
+
+            excel_column = self.mapping[column_name]
+            data_type = self.column_types[column_name]
+            positions = np.flatnonzero(invalid)
+            invalid_rows |= invalid
+
+            info = self._columns.get(column_name)
+            if info is None:
+                info = self._columns[column_name] = ExcelColumnValidation(
+                    column=column_name, excel_column=str(excel_column), data_type=data_type, error_count=0
+                )
+            info.error_count += count
+
+            source = df[excel_column]
+            free = self.max_samples - len(info.sample_errors)
+            if free > 0:
+                for position in positions[:free]:
+                    info.sample_errors.append({
+                        'row': row_offset + int(position) + 1,
+                        'value': str(source.iloc[position])
+                    })
+
+            if self._report_writer is not None:
+                values = source.iloc[positions].astype(str).tolist()
+                self._report_writer.writerows(
+                    (row_offset + int(position) + 1, column_name, excel_column, data_type, value)
+                    for position, value in zip(positions, values)
+                )
+
+        self.total_rows += len(df)
+        self.invalid_rows += int(invalid_rows.sum())
+        self.error_count = sum(info.error_count for info in self._columns.values())
+        return invalid_rows
+
+    def errors(self) -> List[Dict[str, Any]]:
+        """Ошибки в прежнем формате списка (только первые N по каждой колонке)"""
+        errors = []
+        for info in self._columns.values():
+            for sample in info.sample_errors:
+                errors.append({
+                    'type': 'type_conversion_error',
+                    'message': f'Строка {sample["row"]}: неверный тип данных в поле "{info.column}" - '
+                               f'значение "{sample["value"]}" не является {info.data_type}',
+                    'row': sample['row'],
+                    'column': info.column,
+                    'value': sample['value']
+                })
+        return errors
+
+    def build(self) -> ExcelValidationReport:
+        """Закрывает полный отчет (если был) и возвращает сводку"""
+        if self._report_file is not None:
+            self._report_file.close()
+            self._report_file = None
+            self._report_writer = None
+            if not self.error_count:
+                os.remove(report_path(self._report_id))
+                os.remove(owner_path(self._report_id))
+
+        return ExcelValidationReport(
+            total_rows=self.total_rows,
+            invalid_rows=self.invalid_rows,
+            error_count=self.error_count,
+            columns=list(self._columns.values()),
+            report_id=self._report_id if self.error_count else None
+        )
+
+
+def report_path(report_id: str) -> str:
+    return os.path.join(settings.EXCEL_REPORTS_DIR, f"{report_id}.csv")
+
+
+def owner_path(report_id: str) -> str:
+    return os.path.join(settings.EXCEL_REPORTS_DIR, f"{report_id}.owner.json")
+
+
+def _valid_report_id(report_id: str) -> bool:
+    # report_id приходит от клиента и становится частью пути, поэтому проверяем формат
+    try:
+        return uuid.UUID(hex=report_id).hex == report_id
+    except ValueError:
+        return False
+
+
+def get_report_path(report_id: str) -> Optional[str]:
+    """Путь к полному отчету или None"""
+    if not _valid_report_id(report_id):
+        return None
+    path = report_path(report_id)
+    return path if os.path.exists(path) else None
+
+
+def get_report_owner(report_id: str) -> Optional[Dict[str, Optional[int]]]:
+    """{'table_id', 'user_id'} полного отчета или None, если отчета нет или владелец не записан"""
+    if not _valid_report_id(report_id):
+        return None
+    try:
+        with open(owner_path(report_id), encoding='utf-8') as owner_file:
+            return json.load(owner_file)
+    except (OSError, ValueError):
+        return None
+
+
+def cleanup_expired_reports():
+    """Удаляет полные отчеты старше EXCEL_REPORT_TTL_SECONDS"""
+    deadline = time.time() - settings.EXCEL_REPORT_TTL_SECONDS
+    try:
+        entries = list(os.scandir(settings.EXCEL_REPORTS_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < deadline:
+                os.remove(entry.path)
+        except OSError as e:
+            logger.warning(f"Не удалось удалить отчет {entry.path}: {e}")
@@ -0,0 +1,168 @@
+# services/record_merge.py
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Set, Tuple
+import logging
+
+from sqlalchemy.orm import Session
+
+from ..crud.table import table_record_repository
+from ..core.config import settings
+from ..schemas.excel import ExcelMergeStats
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value: Any) -> Any:
+    # В JSON 5 и 5.0 - одно и то же число; без приведения запись, сохраненная через API целым, считалась бы измененной
+    if isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def _dumps(values: List[Any]) -> bytes:
+    return json.dumps(
+        [_normalize(value) for value in values], ensure_ascii=False, separators=(',', ':'), default=str
+    ).encode('utf-8')
+
+
+class RecordMerger:
+    """
+    Слияние импорта с записями таблицы по ключевым колонкам (upsert).
+    Перед импортом один раз строится индекс ключ -> (id, хэш значений) по всем записям таблицы,
+    затем каждая пачка сравнивается с ним в памяти: новые строки вставляются пачкой, измененные
+    обновляются пачкой, совпадающие не пишутся вовсе
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        table_template_id: int,
+        key_columns: List[str],
+        value_columns: List[str],
+        delete_missing: bool = False,
+        max_samples: int = settings.EXCEL_VALIDATION_SAMPLE_ERRORS
+    ):
+        self.db = db
+        self.table_template_id = table_template_id
+        self.key_columns = key_columns
+        self.value_columns = value_columns
+        self.delete_missing = delete_missing
+        self.max_samples = max_samples
+        self.stats = ExcelMergeStats(key_columns=key_columns, delete_missing=delete_missing)
+        self._index: Dict[bytes, Tuple[int, bytes]] = {}
+        # Записи без ключа и повторы ключа в таблице: файлу они не сопоставляются
+        self._unmatched_ids: List[int] = []
+        self._seen: Set[bytes] = set()
+        # Причина не удалять отсутствующие записи: в файле есть строки, чей ключ не удалось прочитать
+        self._keep_missing: Optional[str] = None
+
+    def row_key(self, data: Dict[str, Any]) -> Optional[bytes]:
+        values = [data.get(column) for column in self.key_columns]
+        if all(value is None or value == '' for value in values):
+            return None
+        return _dumps(values)
+
+    def row_hash(self, data: Dict[str, Any]) -> bytes:
+        """Хэш только импортируемых колонок: остальные поля записи импорт не меняет"""
+        return hashlib.blake2b(_dumps([data.get(column) for column in self.value_columns]), digest_size=16).digest()
+
+    def load(self):
+        for record_id, data in table_record_repository.iter_data(self.db, self.table_template_id):
+            key = self.row_key(data)
+            if key is None or key in self._index:
+                self._unmatched_ids.append(record_id)
+                continue
+            self._index[key] = (record_id, self.row_hash(data))
+        logger.info(f"Слияние с таблицей {self.table_template_id}: в индексе {len(self._index)} ключей")
+
+    def merge_chunk(self, records_data: List[Dict[str, Any]], commit: bool = True) -> int:
+        """Пишет новые и измененные строки пачки; возвращает число записанных"""
+        inserts = []
+        changed: Dict[int, Dict[str, Any]] = {}
+        for data in records_data:
+            key = self.row_key(data)
+            if key is None:
+                self._skip(data, 'missing_key', 'Пустое значение ключа')
+                continue
+            if key in self._seen:
+                self._skip(data, 'duplicate_key', 'Ключ повторяется в файле, строка пропущена')
+                continue
+            self._seen.add(key)
+
+            existing = self._index.get(key)
+            if existing is None:
+                inserts.append(data)
+            elif existing[1] == self.row_hash(data):
+                self.stats.unchanged += 1
+            else:
+                changed[existing[0]] = data
+
+        patches: Dict[int, Dict[str, Any]] = {}
+        if changed:
+            # Поля записи, которых нет в файле, сохраняются
+            stored = table_record_repository.get_data_by_ids(self.db, list(changed))
+            patches = {
+                record_id: {key: value for key, value in data.items() if stored.get(record_id, {}).get(key) != value}
+                for record_id, data in changed.items()
+            }
+            changed = {record_id: {**stored.get(record_id, {}), **data} for record_id, data in changed.items()}
+
+        self.stats.inserted += table_record_repository.create_many(
+            self.db, self.table_template_id, inserts, commit=False
+        )
+        self.stats.updated += table_record_repository.update_data_many(
+            self.db, self.table_template_id, changed, commit=False, patches=patches
+        )
+        if commit:
+            self.db.commit()
+        return len(inserts) + len(changed)
+
+    def mark_seen(self, records_data: List[Dict[str, Any]]):
+        """
+        Строки файла, не прошедшие проверку: они не пишутся, но их ключи есть в файле,
+        и записи с этими ключами не должны удаляться как отсутствующие
+        """
+        for data in records_data:
+            key = self.row_key(data)
+            if key is not None:
+                self._seen.add(key)
+
+    def keep_missing(self, reason: str):
+        """Отказаться от удаления отсутствующих записей: неизвестно, какие из них есть в файле"""
+        if self._keep_missing is None:
+            self._keep_missing = reason
+
+    def finish(self, commit: bool = True) -> int:
+        """Удаляет записи, которых не было в файле (если задано delete_missing)"""
+        if not self.delete_missing:
+            return 0
+        if self._keep_missing is not None:
+            self.stats.delete_skipped = self._keep_missing
+            logger.warning(f"Слияние с таблицей {self.table_template_id}: удаление отменено - {self._keep_missing}")
+            return 0
+        missing = [record_id for key, (record_id, _) in self._index.items() if key not in self._seen]
+        missing.extend(self._unmatched_ids)
+        self.stats.deleted = table_record_repository.delete_many(self.db, self.table_template_id, missing, commit=commit)
+        return self.stats.deleted
+
+    def _skip(self, data: Dict[str, Any], error_type: str, message: str):
+        self.stats.skipped_rows += 1
+        if len(self.stats.key_errors) < self.max_samples:
+            self.stats.key_errors.append({
+                'type': error_type,
+                'message': message,
+                'key': {column: data.get(column) for column in self.key_columns}
+            })
+
+
+def merge_summary(stats: ExcelMergeStats) -> str:
+    message = (
+        f"Слияние завершено: добавлено {stats.inserted}, обновлено {stats.updated}, "
+        f"без изменений {stats.unchanged}, удалено {stats.deleted}"
+    )
+    if stats.skipped_rows:
+        message += f", пропущено строк без ключа или с повтором ключа: {stats.skipped_rows}"
+    if stats.delete_skipped:
+        message += f"; отсутствующие в файле записи не удалены: {stats.delete_skipped}"
+    return message
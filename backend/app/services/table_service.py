@@ -3,7 +3,11 @@ from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 
 from ..database import get_db
-from ..crud.table import table_template_repository, table_column_repository, table_record_repository
+from ..crud.table import (
+    table_template_repository, table_column_repository, table_record_repository,
+    table_version_repository, table_change_log_repository
+)
+from ..crud.table_changes import ENTITY_RECORD, OP_INSERT, OP_UPDATE, OP_DELETE, OP_RESET
 from ..schemas import table as schemas
 from fastapi import Depends, HTTPException, status
 
@@ -105,6 +109,93 @@ class TableRecordService:
     def delete_record(self, record_id: int) -> bool:
         return table_record_repository.delete(self.db, record_id)
 
+class TableChangeService:
+    # Сколько записей читается одним запросом при сборке изменений
+    batch_size = 1000
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_changes(self, template_id: int, since_version: int) -> schemas.TableChangesResponse:
+        """
+        Что изменилось в таблице после since_version: по каждой записи итоговая операция и текущие данные,
+        удаленные - надгробием. Если журнал не покрывает since_version (слишком старая, из будущего или между ними
+        большая операция) - снимок всей таблицы
+        """
+        if not table_template_repository.get_by_id(self.db, template_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Шаблон таблицы не найден"
+            )
+        version = table_version_repository.get(self.db, template_id)
+        if since_version == version:
+            return schemas.TableChangesResponse(table_id=template_id, since_version=since_version, version=version)
+
+        oldest = table_change_log_repository.oldest_version(self.db, template_id)
+        if since_version > version or oldest is None or since_version < oldest - 1:
+            return self._snapshot(template_id, since_version, version)
+        entries = table_change_log_repository.get_since(self.db, template_id, since_version, version)
+        if any(op == OP_RESET for _, _, op, _, _ in entries):
+            return self._snapshot(template_id, since_version, version)
+
+        # {record_id: [первая операция, последняя операция, измененные ключи]}
+        records: Dict[int, list] = {}
+        structure_changed = False
+        for _, entity, op, entity_id, fields in entries:
+            if entity != ENTITY_RECORD:
+                structure_changed = True
+                continue
+            state = records.get(entity_id)
+            if state is None:
+                records[entity_id] = [op, op, set(fields or ())]
+            else:
+                state[1] = op
+                state[2].update(fields or ())
+
+        alive = [record_id for record_id, (_, last_op, _) in records.items() if last_op != OP_DELETE]
+        current: Dict[int, Dict[str, Any]] = {}
+        for start in range(0, len(alive), self.batch_size):
+            current.update(table_record_repository.get_data_by_ids(self.db, alive[start:start + self.batch_size]))
+
+        changes = []
+        for record_id, (first_op, _, fields) in records.items():
+            data = current.get(record_id)
+            if data is None:
+                # Запись, созданная и удаленная после since_version, клиенту не известна
+                if first_op != OP_INSERT:
+                    changes.append(schemas.TableRecordChange(record_id=record_id, op=OP_DELETE))
+            elif first_op == OP_INSERT:
+                changes.append(schemas.TableRecordChange(record_id=record_id, op=OP_INSERT, fields=sorted(data), data=data))
+            else:
+                changes.append(schemas.TableRecordChange(record_id=record_id, op=OP_UPDATE, fields=sorted(fields), data=data))
+
+        return schemas.TableChangesResponse(
+            table_id=template_id,
+            since_version=since_version,
+            version=version,
+            changes=changes,
+            columns=self._columns(template_id) if structure_changed else None
+        )
+
+    def _snapshot(self, template_id: int, since_version: int, version: int) -> schemas.TableChangesResponse:
+        return schemas.TableChangesResponse(
+            table_id=template_id,
+            since_version=since_version,
+            version=version,
+            snapshot=True,
+            changes=[
+                schemas.TableRecordChange(record_id=record_id, op=OP_INSERT, fields=sorted(data), data=data)
+                for record_id, data in table_record_repository.iter_data(self.db, template_id, self.batch_size)
+            ],
+            columns=self._columns(template_id)
+        )
+
+    def _columns(self, template_id: int) -> List[schemas.TableColumnResponse]:
+        return [
+            schemas.TableColumnResponse.model_validate(column)
+            for column in table_column_repository.get_by_template_id(self.db, template_id)
+        ]
+
 # Фабрики для dependency injection
 def get_table_template_service(db: Session = Depends(get_db)):
     return TableTemplateService(db)
@@ -114,3 +205,6 @@ def get_table_column_service(db: Session = Depends(get_db)):
 
 def get_table_record_service(db: Session = Depends(get_db)):
     return TableRecordService(db)
+
+def get_table_change_service(db: Session = Depends(get_db)):
+    return TableChangeService(db)
@@ -0,0 +1,227 @@
+# services/text_stream_service.py
+import csv
+import json
+import pandas as pd
+from charset_normalizer import from_bytes
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Union
+import logging
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TextSource = Union[str, BinaryIO]
+
+CSV_EXTENSIONS = ('.csv', '.tsv', '.txt')
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+CSV_DELIMITERS = ',;\t|'
+# Сколько байт начала файла смотрим для определения кодировки и разделителя
+SNIFF_BYTES = 64 * 1024
+# Кодировки, из которых выбираем, если файл не в utf-8 (выгрузки из 1С, старого Excel, DOS)
+FALLBACK_ENCODINGS = ['cp1251', 'koi8_r', 'cp866', 'latin_1']
+
+
+def _open_binary(source: TextSource):
+    if isinstance(source, str):
+        return open(source, 'rb'), True
+    source.seek(0)
+    return source, False
+
+
+def detect_encoding(sample: bytes) -> str:
+    """utf-8 (с BOM или без), иначе лучшая из FALLBACK_ENCODINGS по оценке charset_normalizer"""
+    if sample.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    try:
+        # Образец мог оборваться посреди многобайтного символа
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        if e.start >= len(sample) - 3:
+            return 'utf-8'
+    match = from_bytes(sample, cp_isolation=FALLBACK_ENCODINGS).best()
+    return match.encoding if match is not None else FALLBACK_ENCODINGS[0]
+
+
+def detect_delimiter(text: str) -> str:
+    """Разделитель по первым строкам; если не определился - запятая"""
+    lines = text.splitlines()[:50]
+    try:
+        return csv.Sniffer().sniff('\n'.join(lines), delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        return ','
+
+
+class CsvStreamReader:
+    """CSV пачками через C-движок pandas: в памяти только текущая пачка"""
+
+    def __init__(
+        self,
+        source: TextSource,
+        chunk_size: int = settings.EXCEL_IMPORT_CHUNK_SIZE,
+        skip_first_rows: int = 0,
+        delimiter: Optional[str] = None,
+        encoding: Optional[str] = None
+    ):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.skip_first_rows = skip_first_rows
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.columns: List[str] = []
+        self.total_rows: Optional[int] = None
+        self._file = None
+        self._owns_file = False
+        self._reader = None
+        self._first: Optional[pd.DataFrame] = None
+
+    def __enter__(self) -> "CsvStreamReader":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def open(self):
+        self._file, self._owns_file = _open_binary(self.source)
+        sample = self._file.read(SNIFF_BYTES)
+        self._file.seek(0)
+
+        if self.encoding is None:
+            self.encoding = detect_encoding(sample)
+        if self.delimiter is None:
+            self.delimiter = detect_delimiter(sample.decode(self.encoding, errors='ignore'))
+
+        try:
+            self._reader = pd.read_csv(
+                # Файл на диске отдаем путем: C-движок отображает его в память (memory_map) без копии
+                self.source if self._owns_file else self._file,
+                memory_map=self._owns_file,
+                sep=self.delimiter,
+                encoding=self.encoding,
+                engine='c',
+                dtype=str,  # типы приводит ExcelService.convert_column по схеме таблицы
+                skiprows=range(1, self.skip_first_rows + 1) if self.skip_first_rows else None,
+                chunksize=self.chunk_size
+            )
+            # Первая пачка читается сразу, чтобы знать заголовок до импорта
+            self._first = next(self._reader, None)
+        except (pd.errors.ParserError, UnicodeDecodeError, ValueError) as e:
+            raise ValueError(f"Ошибка при чтении CSV файла: {str(e)}")
+
+        if self._first is not None:
+            self._first.columns = [str(col) for col in self._first.columns]
+            self.columns = self._first.columns.tolist()
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._owns_file and self._file is not None:
+            self._file.close()
+        self._file = None
+
+    def iter_dataframes(self) -> Iterator[pd.DataFrame]:
+        if self._first is None:
+            return
+        first, self._first = self._first, None
+        yield first
+        try:
+            for df in self._reader:
+                df.columns = self.columns
+                yield df
+        except (pd.errors.ParserError, UnicodeDecodeError) as e:
+            raise ValueError(f"Ошибка при чтении CSV файла: {str(e)}")
+
+
+class NdjsonStreamReader:
+    """NDJSON построчно: одна строка - один JSON-объект, колонки - ключи в порядке появления"""
+
+    def __init__(
+        self,
+        source: TextSource,
+        chunk_size: int = settings.EXCEL_IMPORT_CHUNK_SIZE,
+        skip_first_rows: int = 0,
+        encoding: Optional[str] = None
+    ):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.skip_first_rows = skip_first_rows
+        self.encoding = encoding or 'utf-8-sig'
+        self.columns: List[str] = []
+        self.total_rows: Optional[int] = None
+        self._file = None
+        self._owns_file = False
+        self._lines: Optional[Iterator[bytes]] = None
+        self._line_number = 0
+        self._first: Optional[List[Dict[str, Any]]] = None
+
+    def __enter__(self) -> "NdjsonStreamReader":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def open(self):
+        self._file, self._owns_file = _open_binary(self.source)
+        self._lines = iter(self._file)
+        skipped = 0
+        while skipped < self.skip_first_rows and self._next_record() is not None:
+            skipped += 1
+        # Первая пачка нужна заранее: по ней определяются колонки для маппинга
+        self._first = self._read_chunk()
+        self._register_columns(self._first)
+
+    def close(self):
+        if self._owns_file and self._file is not None:
+            self._file.close()
+        self._file = None
+        self._lines = None
+
+    def _next_record(self) -> Optional[Dict[str, Any]]:
+        for line in self._lines:
+            self._line_number += 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line.decode(self.encoding))
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                raise ValueError(f"Строка {self._line_number}: некорректный JSON ({str(e)})")
+            if not isinstance(record, dict):
+                raise ValueError(f"Строка {self._line_number}: ожидается JSON-объект")
+            return record
+        return None
+
+    def _read_chunk(self) -> List[Dict[str, Any]]:
+        chunk = []
+        while len(chunk) < self.chunk_size:
+            record = self._next_record()
+            if record is None:
+                break
+            chunk.append(record)
+        return chunk
+
+    def _register_columns(self, chunk: List[Dict[str, Any]]):
+        known = set(self.columns)
+        for record in chunk:
+            for key in record:
+                if key not in known:
+                    known.add(key)
+                    self.columns.append(key)
+
+    def _to_dataframe(self, chunk: List[Dict[str, Any]]) -> pd.DataFrame:
+        self._register_columns(chunk)
+        for record in chunk:
+            for key, value in record.items():
+                # Вложенные объекты и массивы сохраняем как JSON-текст
+                if isinstance(value, (dict, list)):
+                    record[key] = json.dumps(value, ensure_ascii=False)
+        return pd.DataFrame.from_records(chunk, columns=self.columns)
+
+    def iter_dataframes(self) -> Iterator[pd.DataFrame]:
+        chunk, self._first = self._first, None
+        while chunk:
+            yield self._to_dataframe(chunk)
+            chunk = self._read_chunk()
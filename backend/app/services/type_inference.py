@@ -0,0 +1,202 @@
+# services/type_inference.py
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+
+from .excel_service import TRUE_VALUES, FALSE_VALUES, DATE_FORMATS, DATETIME_FORMATS, NUMBER_SPACES
+from ..core.config import settings
+
+# Доля непустых значений выборки, которые должны подойти под тип
+MATCH_THRESHOLD = 0.8
+# Выборка проверяется блоками: как только несовпадений больше допустимого, тип отбрасывается
+SAMPLE_BLOCK = 100
+# Сколько первых строк всегда попадает в выборку (заголовочные и "типичные" строки обычно в начале)
+SAMPLE_HEAD = 200
+# Число знаков после запятой, при котором дробные числа считаем денежными (decimal)
+DECIMAL_MAX_PLACES = 4
+
+NUMBER_INTEGER = 'integer'
+NUMBER_FLOAT = 'float'
+NUMBER_DECIMAL = 'decimal'
+
+
+def stratified_sample(values: pd.Series, size: int = settings.EXCEL_INFER_SAMPLE_ROWS) -> pd.Series:
+    """Начало колонки плюс равномерно распределенные по всей длине строки, чтобы не смотреть только в голову файла"""
+    if len(values) <= size:
+        return values
+    head = min(SAMPLE_HEAD, size // 2)
+    spread = np.linspace(head, len(values) - 1, size - head).astype(int)
+    positions = np.unique(np.concatenate([np.arange(head), spread]))
+    return values.iloc[positions]
+
+
+def _share_matches(sample: pd.Series, check) -> Tuple[bool, Any]:
+    """
+    check(block) -> (маска совпадений, доп. сведения блока). Блоки проверяются по порядку,
+    проверка прекращается, как только несовпадений больше, чем допускает MATCH_THRESHOLD
+    """
+    allowed_misses = int(len(sample) * (1 - MATCH_THRESHOLD))
+    misses = 0
+    details = []
+    for start in range(0, len(sample), SAMPLE_BLOCK):
+        matched, detail = check(sample.iloc[start:start + SAMPLE_BLOCK])
+        misses += int((~matched).sum())
+        if misses > allowed_misses:
+            return False, None
+        details.append(detail)
+    return True, details
+
+
+def _normalize_numbers(strings: pd.Series) -> pd.Series:
+    return strings.str.strip().str.replace(f'[{NUMBER_SPACES}]', '', regex=True).str.replace(',', '.', regex=False)
+
+
+class ColumnTypeInferrer:
+    """
+    Определение типа колонки по выборке: boolean, number (integer/float/decimal), date/datetime
+    с форматом, определенным один раз на колонку, select для колонок с немногими значениями, иначе text.
+    Кандидаты проверяются от самых строгих, каждый - с ранним выходом
+    """
+
+    def __init__(
+        self,
+        sample_size: int = settings.EXCEL_INFER_SAMPLE_ROWS,
+        select_max_options: int = settings.EXCEL_INFER_SELECT_MAX_OPTIONS
+    ):
+        self.sample_size = sample_size
+        self.select_max_options = select_max_options
+
+    def infer(self, series: pd.Series) -> Tuple[str, Dict[str, Any]]:
+        """(data_type, config) для одной колонки"""
+        values = series.dropna()
+        if values.empty:
+            return 'text', {}
+
+        if pd.api.types.is_bool_dtype(values):
+            return 'boolean', {}
+        if pd.api.types.is_numeric_dtype(values):
+            return 'number', self._native_number_config(stratified_sample(values, self.sample_size))
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return self._native_datetime_type(values), {}
+
+        sample = stratified_sample(values, self.sample_size)
+        for detect in (self._detect_boolean, self._detect_number, self._detect_datetime):
+            detected = detect(sample)
+            if detected is not None:
+                return detected
+        return self._detect_select(values, sample) or ('text', {})
+
+    # Колонки, которые pandas уже привел к типу при чтении листа
+
+    @staticmethod
+    def _native_number_config(sample: pd.Series) -> Dict[str, Any]:
+        numbers = sample.to_numpy(dtype=float)
+        numbers = numbers[np.isfinite(numbers)]
+        if pd.api.types.is_integer_dtype(sample) or np.all(numbers == np.round(numbers)):
+            return {'number_format': NUMBER_INTEGER}
+        # Excel хранит суммы в float: 12.5 и 99.99 - деньги, 0.333333 - нет
+        for places in range(1, DECIMAL_MAX_PLACES + 1):
+            if np.allclose(numbers, np.round(numbers, places), rtol=0, atol=1e-9):
+                return {'number_format': NUMBER_DECIMAL, 'decimal_places': places}
+        return {'number_format': NUMBER_FLOAT}
+
+    @staticmethod
+    def _native_datetime_type(values: pd.Series) -> str:
+        if getattr(values.dt, 'tz', None) is None and (values == values.dt.normalize()).all():
+            return 'date'
+        return 'datetime'
+
+    # Колонки object: строки и смешанные значения
+
+    @staticmethod
+    def _as_strings(sample: pd.Series) -> pd.Series:
+        return sample.astype(str).str.strip()
+
+    def _detect_boolean(self, sample: pd.Series) -> Optional[Tuple[str, Dict[str, Any]]]:
+        # Как и раньше, булевой считаем колонку, где все значения из словаря (0/1 - это числа, их ловит number)
+        lowered = self._as_strings(sample).str.lower()
+        known = lowered.isin(TRUE_VALUES + FALSE_VALUES)
+        if known.all() and not lowered.isin(['0', '1']).all():
+            return 'boolean', {}
+        return None
+
+    def _detect_number(self, sample: pd.Series) -> Optional[Tuple[str, Dict[str, Any]]]:
+        def check(block: pd.Series):
+            normalized = _normalize_numbers(self._as_strings(block))
+            numbers = pd.to_numeric(normalized, errors='coerce')
+            matched = numbers.notna().to_numpy()
+            return matched, (normalized[matched], numbers[matched])
+
+        ok, details = _share_matches(sample, check)
+        if not ok:
+            return None
+        strings = pd.concat([normalized for normalized, _ in details])
+        numbers = pd.concat([numbers for _, numbers in details]).to_numpy(dtype=float)
+        return 'number', self._text_number_config(strings, numbers)
+
+    @staticmethod
+    def _text_number_config(strings: pd.Series, numbers: np.ndarray) -> Dict[str, Any]:
+        fraction = strings.str.extract(r'\.(\d+)$', expand=False)
+        if fraction.isna().all() and np.all(numbers == np.round(numbers)):
+            return {'number_format': NUMBER_INTEGER}
+        places = fraction.str.len()
+        # Одинаковое число знаков после запятой у всех дробных значений ("12,50", "3,00") - это decimal
+        if places.notna().all() and places.nunique() == 1 and int(places.iloc[0]) <= DECIMAL_MAX_PLACES:
+            return {'number_format': NUMBER_DECIMAL, 'decimal_places': int(places.iloc[0])}
+        return {'number_format': NUMBER_FLOAT}
+
+    def _detect_datetime(self, sample: pd.Series) -> Optional[Tuple[str, Dict[str, Any]]]:
+        strings = self._as_strings(sample)
+        # Формат определяется один раз на колонку по голове выборки, дальше проверяется только он (без dateutil)
+        head = strings.head(SAMPLE_BLOCK)
+        scored = []
+        for data_type, formats in (('date', DATE_FORMATS), ('datetime', DATETIME_FORMATS)):
+            for fmt in formats:
+                parsed = int(pd.to_datetime(head, format=fmt, errors='coerce').notna().sum())
+                if parsed:
+                    scored.append((parsed, data_type, fmt))
+        # Самый подходящий формат первым; при равенстве - более специфичный datetime
+        for _, data_type, fmt in sorted(scored, key=lambda item: (-item[0], item[1] != 'datetime')):
+            ok, _ = _share_matches(
+                strings, lambda block: (pd.to_datetime(block, format=fmt, errors='coerce').notna().to_numpy(), None)
+            )
+            if ok:
+                return data_type, {'format': fmt}
+        return None
+
+    def _detect_select(self, values: pd.Series, sample: pd.Series) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Немного повторяющихся значений; варианты берем по всей колонке, чтобы не потерять редкие"""
+        if len(values) < self.select_max_options * 2:
+            return None
+        if self._as_strings(sample).nunique() > self.select_max_options:
+            return None
+        options = self._as_strings(values).unique()
+        if len(options) > self.select_max_options or len(options) * 2 > len(values):
+            return None
+        return 'select', {'options': sorted(options.tolist())}
+
+
+def complete_select_options(columns: List[Dict[str, Any]], df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Варианты select по всей колонке, если типы определялись по части листа"""
+    completed = []
+    for column in columns:
+        if column['data_type'] == 'select' and column['name'] in df.columns:
+            values = df[column['name']].dropna().astype(str).str.strip().unique()
+            column = {**column, 'config': {**column.get('config', {}), 'options': sorted(values.tolist())}}
+        completed.append(column)
+    return completed
+
+
+def infer_columns(df: pd.DataFrame, inferrer: Optional[ColumnTypeInferrer] = None) -> List[Dict[str, Any]]:
+    """Колонки новой таблицы с типами и конфигурацией типа"""
+    inferrer = inferrer or ColumnTypeInferrer()
+    columns = []
+    for col_name in df.columns:
+        data_type, config = inferrer.infer(df[col_name])
+        columns.append({
+            'name': str(col_name),
+            'data_type': data_type,
+            'order_index': len(columns),
+            'config': config
+        })
+    return columns
@@ -0,0 +1,218 @@
+# services/upload_cache.py
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+import logging
+
+import numpy as np
+from fastapi import HTTPException, UploadFile, status
+
+from .upload_spool import remove_spooled, spool_upload
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def write_parsed(path: str, columns: List[str], arrays: List[np.ndarray]):
+    """Сохраняет разобранный лист колонками; запись атомарная, чтобы параллельный читатель не увидел половину"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            pickle.dump((columns, arrays), target, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        remove_spooled(tmp_path)
+        raise
+
+
+def read_parsed(path: str) -> Tuple[List[str], List[np.ndarray]]:
+    # Файлы пишет только сервер (write_parsed), поэтому pickle здесь безопасен
+    with open(path, 'rb') as source:
+        return pickle.load(source)
+
+
+class UploadEntry:
+    """Один загруженный файл: копия на диске, кэш разбора и определенных типов"""
+
+    def __init__(self, token: str, path: str, filename: Optional[str], size: int):
+        self.token = token
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.parsed_path = os.path.join(os.path.dirname(path), f"{token}.columns.pkl")
+        self.parsed_size = 0
+        # {skip_first_rows: [колонки с типами]} - результат определения типов для create-table
+        self.inferred_columns: Dict[int, List[Dict[str, Any]]] = {}
+        self.owners: Set[int] = set()
+        self.leases = 0
+        self.last_access = time.monotonic()
+
+    @property
+    def total_size(self) -> int:
+        return self.size + self.parsed_size
+
+
+class UploadCache:
+    """
+    Загрузи один раз - используй в превью, импорте и создании таблицы.
+    Токен - sha256 содержимого: повторная загрузка того же файла не создает вторую копию.
+    Записи вытесняются по TTL и по суммарному размеру (LRU); занятые (lease) не трогаем.
+    Кэш живет в процессе: при нескольких воркерах токен действителен в том, что принял загрузку
+    """
+
+    def __init__(
+        self,
+        directory: str = settings.UPLOAD_CACHE_DIR,
+        ttl_seconds: int = settings.UPLOAD_CACHE_TTL_SECONDS,
+        max_bytes: int = settings.UPLOAD_CACHE_MAX_BYTES
+    ):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, UploadEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_digest():
+        return hashlib.sha256()
+
+    def put(self, spooled_path: str, digest, filename: Optional[str], user_id: int) -> UploadEntry:
+        """
+        Забирает сохраненную загрузку в кэш (файл перемещается, исходный путь больше не действителен).
+        Запись возвращается уже с lease, вызывающий снимает его через release
+        """
+        token = digest.hexdigest()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and os.path.exists(entry.path):
+                remove_spooled(spooled_path)
+            else:
+                os.makedirs(self.directory, exist_ok=True)
+                suffix = os.path.splitext(filename or "")[1].lower()
+                path = os.path.join(self.directory, f"{token}{suffix}")
+                os.replace(spooled_path, path)
+                entry = UploadEntry(token, path, filename, os.path.getsize(path))
+                self._entries[token] = entry
+            entry.owners.add(user_id)
+            entry.leases += 1
+            self._touch(entry)
+            self._evict()
+            self._remove_orphans()
+            return entry
+
+    def acquire(self, token: str, user_id: int) -> Optional[UploadEntry]:
+        """Запись для пользователя, загрузившего файл; пока lease не снят, запись не вытесняется"""
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(token)
+            if entry is None or user_id not in entry.owners:
+                return None
+            entry.leases += 1
+            self._touch(entry)
+            return entry
+
+    def release(self, entry: UploadEntry):
+        with self._lock:
+            entry.leases = max(entry.leases - 1, 0)
+            if os.path.exists(entry.parsed_path):
+                entry.parsed_size = os.path.getsize(entry.parsed_path)
+            self._evict()
+
+    def remove(self, token: str, user_id: int) -> bool:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or user_id not in entry.owners:
+                return False
+            entry.owners.discard(user_id)
+            if not entry.owners and not entry.leases:
+                self._drop(entry)
+            return True
+
+    def _touch(self, entry: UploadEntry):
+        entry.last_access = time.monotonic()
+        self._entries.move_to_end(entry.token)
+        # mtime - признак жизни файла для других процессов (см. _remove_orphans)
+        try:
+            os.utime(entry.path)
+        except OSError:
+            pass
+
+    def _drop(self, entry: UploadEntry):
+        self._entries.pop(entry.token, None)
+        remove_spooled(entry.path)
+        remove_spooled(entry.parsed_path)
+
+    def _remove_orphans(self):
+        """
+        Файлы, оставшиеся после перезапуска или от других воркеров: записей о них в этом процессе нет.
+        Удаляем только не тронутые дольше TTL, чтобы не задеть живые загрузки соседних процессов
+        """
+        known = {os.path.basename(entry.path) for entry in self._entries.values()}
+        known.update(os.path.basename(entry.parsed_path) for entry in self._entries.values())
+        deadline = time.time() - self.ttl_seconds
+        try:
+            files = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for file in files:
+            try:
+                if file.name not in known and file.is_file() and file.stat().st_mtime < deadline:
+                    remove_spooled(file.path)
+            except OSError as e:
+                logger.warning(f"Не удалось проверить файл кэша загрузок {file.path}: {e}")
+
+    def _evict(self):
+        deadline = time.monotonic() - self.ttl_seconds
+        for entry in list(self._entries.values()):
+            if not entry.leases and (entry.last_access < deadline or not entry.owners):
+                self._drop(entry)
+
+        total = sum(entry.total_size for entry in self._entries.values())
+        # OrderedDict в порядке последнего обращения: сначала вытесняем самые старые
+        for entry in list(self._entries.values()):
+            if total <= self.max_bytes:
+                break
+            if entry.leases:
+                continue
+            total -= entry.total_size
+            self._drop(entry)
+
+
+# Глобальный экземпляр
+upload_cache = UploadCache()
+
+
+@asynccontextmanager
+async def cached_upload(
+    file: Optional[UploadFile],
+    upload_token: Optional[str],
+    user_id: int
+) -> AsyncIterator[UploadEntry]:
+    """Файл из кэша по токену или новая загрузка, которая сразу попадает в кэш; lease держится до выхода из блока"""
+    if upload_token:
+        entry = upload_cache.acquire(upload_token, user_id)
+        if entry is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Загрузка не найдена или срок ее хранения истек, загрузите файл заново"
+            )
+    elif file is not None:
+        digest = upload_cache.new_digest()
+        path = await spool_upload(file, digest)
+        entry = upload_cache.put(path, digest, file.filename, user_id)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Передайте файл или upload_token"
+        )
+
+    try:
+        yield entry
+    finally:
+        upload_cache.release(entry)
@@ -0,0 +1,91 @@
+# services/upload_spool.py
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, BinaryIO, Optional
+import logging
+
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLarge(Exception):
+    """Загруженный файл больше UPLOAD_MAX_BYTES"""
+
+
+def upload_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Файл больше допустимого размера ({settings.UPLOAD_MAX_BYTES // (1024 * 1024)} МБ)"
+    )
+
+
+def spool_to_disk(
+    source: BinaryIO,
+    filename: Optional[str] = None,
+    max_bytes: int = settings.UPLOAD_MAX_BYTES,
+    digest=None
+) -> str:
+    """
+    Копирует поток во временный файл кусками по UPLOAD_SPOOL_CHUNK_BYTES и возвращает путь.
+    Файл целиком в память не попадает; при превышении лимита файл удаляется и поднимается UploadTooLarge.
+    digest (объект hashlib) по пути обновляется содержимым, чтобы не читать файл второй раз
+    """
+    os.makedirs(settings.EXCEL_UPLOADS_DIR, exist_ok=True)
+    suffix = os.path.splitext(filename or "")[1]
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=settings.EXCEL_UPLOADS_DIR)
+    try:
+        written = 0
+        with os.fdopen(fd, 'wb') as target:
+            source.seek(0)
+            while True:
+                chunk = source.read(settings.UPLOAD_SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge()
+                target.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+    except BaseException:
+        remove_spooled(path)
+        raise
+    return path
+
+
+def remove_spooled(path: Optional[str]):
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Не удалось удалить временный файл {path}: {e}")
+
+
+async def spool_upload(file: UploadFile, digest=None) -> str:
+    """Сохраняет UploadFile на диск; путь принадлежит вызывающему (удалить через remove_spooled)"""
+    if file.size is not None and file.size > settings.UPLOAD_MAX_BYTES:
+        raise upload_too_large()
+    try:
+        return await run_in_threadpool(
+            spool_to_disk, file.file, file.filename, settings.UPLOAD_MAX_BYTES, digest
+        )
+    except UploadTooLarge:
+        raise upload_too_large()
+
+
+@asynccontextmanager
+async def spooled_upload(file: UploadFile) -> AsyncIterator[str]:
+    """Путь к копии загрузки на диске, которая гарантированно удаляется по выходу из блока"""
+    path = await spool_upload(file)
+    try:
+        yield path
+    finally:
+        remove_spooled(path)
@@ -1,5 +1,5 @@
 # app/websockets/__init__.py
-from .connection_manager import manager
+from .connection_manager import table_sync_manager, TableSyncManager
 
-# Экспортируем manager для использования в других модулях
-__all__ = ["manager"]
\ No newline at end of file
+# Экспортируем table_sync_manager для использования в других модулях
+__all__ = ["table_sync_manager", "TableSyncManager"]
\ No newline at end of file
@@ -0,0 +1,142 @@
+# app/websockets/cell_writer.py
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import logging
+
+from starlette.concurrency import run_in_threadpool
+
+from ..core.config import settings
+from ..crud.table import table_change_tracker, table_record_repository
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CellEdit:
+    """Правка ячейки, ожидающая записи: по ней после commit соединению-автору уходит подтверждение или ошибка"""
+    connection_id: str
+    cell: str
+    record_id: int
+    column: str
+    seq: Any = None
+
+
+@dataclass
+class WriteResult:
+    table_id: str
+    edits: List[CellEdit]
+    version: Optional[int] = None
+    failed_records: Set[int] = field(default_factory=set)
+    error: Optional[str] = None
+
+
+class CellWriteBuffer:
+    """
+    Отложенная запись правок ячеек из WebSocket в table_records.data.
+    Правки копятся по записям (несколько правок одной записи - один патч, побеждает последнее значение)
+    и раз в flush_interval или при max_records записях пишутся одной транзакцией на таблицу:
+    SELECT ... FOR UPDATE, пакетный UPDATE и новая версия таблицы (лента изменений). Результат отдается в on_result после commit
+    """
+
+    def __init__(
+        self,
+        on_result: Callable[[WriteResult], Awaitable[None]],
+        flush_interval: float = settings.WS_CELL_FLUSH_MS / 1000,
+        max_records: int = settings.WS_CELL_FLUSH_MAX_RECORDS
+    ):
+        self.on_result = on_result
+        self.flush_interval = flush_interval
+        self.max_records = max(max_records, 1)
+        # {table_id: {record_id: {column: value}}}
+        self._patches: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._edits: Dict[str, List[CellEdit]] = {}
+        self._pending_records = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+    @property
+    def pending_records(self) -> int:
+        return self._pending_records
+
+    def submit(self, table_id: str, edit: CellEdit, value: Any):
+        record_patch = self._patches.setdefault(table_id, {}).setdefault(edit.record_id, {})
+        if not record_patch:
+            self._pending_records += 1
+        record_patch[edit.column] = value
+        self._edits.setdefault(table_id, []).append(edit)
+        if self._pending_records >= self.max_records:
+            self._wakeup.set()
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Дописать все накопленное (остановка приложения)"""
+        # Не отменяем писателя: отмена посреди записи потеряла бы уже снятую порцию
+        flusher = self._flusher
+        if flusher is not None:
+            self._wakeup.set()
+            await flusher
+        await self.flush()
+
+    async def _flush_loop(self):
+        try:
+            while self._patches:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+        finally:
+            if self._flusher is asyncio.current_task():
+                self._flusher = None
+
+    async def flush(self):
+        # Под замком: следующая порция пишется только после фиксации предыдущей, порядок правок сохраняется
+        async with self._flush_lock:
+            patches, edits = self._patches, self._edits
+            self._patches, self._edits, self._pending_records = {}, {}, 0
+            if not patches:
+                return
+            results = await asyncio.gather(*[
+                self._write_table(table_id, table_patches, edits.get(table_id, []))
+                for table_id, table_patches in patches.items()
+            ])
+            for result in results:
+                try:
+                    await self.on_result(result)
+                except Exception as e:
+                    logger.error(f"Ошибка подтверждения правок таблицы {result.table_id}: {e}")
+
+    async def _write_table(self, table_id: str, patches: Dict[int, Dict[str, Any]], edits: List[CellEdit]) -> WriteResult:
+        try:
+            version, failed = await run_in_threadpool(self._write, int(table_id), patches)
+            return WriteResult(table_id, edits, version, failed)
+        except Exception as e:
+            logger.error(f"Не удалось записать правки таблицы {table_id}: {e}")
+            return WriteResult(table_id, edits, None, set(patches), str(e))
+
+    @staticmethod
+    def _write(table_id: int, patches: Dict[int, Dict[str, Any]]) -> Tuple[Optional[int], Set[int]]:
+        """(новая версия таблицы, записи, которых нет в таблице)"""
+        db = SessionLocal()
+        try:
+            current = table_record_repository.lock_data_by_ids(db, table_id, list(patches))
+            missing = set(patches) - set(current)
+            if not current:
+                return None, missing
+            table_record_repository.update_data_many(db, table_id, {
+                record_id: {**data, **patches[record_id]} for record_id, data in current.items()
+            }, commit=False, patches=patches)
+            # Версию выдает лента изменений: она же после commit разошлет правки с этой версией
+            version = table_change_tracker.stamp(db)[table_id]
+            db.commit()
+            return version, missing
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
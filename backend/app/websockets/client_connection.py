@@ -0,0 +1,136 @@
+# app/websockets/client_connection.py
+import asyncio
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple, Union
+import logging
+
+from fastapi import WebSocket, status
+
+from ..core.config import settings
+from .protocol import JSON_CODEC, OutboundMessage
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_DROP_CURSORS = 'drop_cursors'
+OVERFLOW_DISCONNECT = 'disconnect'
+
+
+class ClientConnection:
+    """
+    Соединение с ограниченной очередью исходящих сообщений и собственной задачей-писателем.
+    Рассылка только кладет готовую строку в очереди и не ждет сети: медленный клиент задерживает только себя.
+    При переполнении сначала выбрасываются сообщения, которые можно потерять (курсоры), затем клиент отключается.
+    Сообщения кодируются протоколом соединения (codec); бинарным клиентам накопившиеся события уходят одним кадром
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: str,
+        on_closed: Callable[["ClientConnection"], None],
+        codec=JSON_CODEC,
+        max_queue: int = settings.WS_SEND_QUEUE_SIZE,
+        close_timeout: float = settings.WS_CLOSE_TIMEOUT_SECONDS,
+        overflow_policy: str = settings.WS_OVERFLOW_POLICY,
+        max_batch: int = settings.WS_BATCH_MAX_MESSAGES,
+        connection_id: Optional[str] = None
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.connection_id = connection_id
+        self.max_queue = max(max_queue, 1)
+        self.close_timeout = close_timeout
+        self.overflow_policy = overflow_policy
+        self.codec = codec
+        self.max_batch = max(max_batch, 1)
+        self.closed = False
+        self.dropped_messages = 0
+        self._on_closed = on_closed
+        # (закодированное сообщение, можно ли выбросить при переполнении)
+        self._queue: Deque[Tuple[Union[str, bytes], bool]] = deque()
+        self._wakeup = asyncio.Event()
+        # Взводится писателем после каждой отправки: по нему ждут места в очереди
+        self._sent = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, message: OutboundMessage, droppable: bool = False) -> bool:
+        """Поставить сообщение в очередь; False, если оно не будет доставлено"""
+        if self.closed:
+            return False
+        if len(self._queue) >= self.max_queue and not self._make_room(droppable):
+            return False
+        self._queue.append((message.encode(self.codec), droppable))
+        self._wakeup.set()
+        return True
+
+    async def wait_for_room(self):
+        """
+        Дождаться, пока очередь освободится хотя бы наполовину: длинный ответ одному соединению (догон таблицы)
+        отправляется частями и не переполняет очередь, оставляя место рассылкам
+        """
+        while not self.closed and len(self._queue) > self.max_queue // 2:
+            self._sent.clear()
+            await self._sent.wait()
+
+    def close(self):
+        """Остановить писателя; сокет закрывает обработчик соединения"""
+        self.closed = True
+        self._queue.clear()
+        self._sent.set()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    def _make_room(self, droppable: bool) -> bool:
+        if self.overflow_policy == OVERFLOW_DROP_CURSORS:
+            for index, (_, queued_droppable) in enumerate(self._queue):
+                if queued_droppable:
+                    del self._queue[index]
+                    self.dropped_messages += 1
+                    return True
+            if droppable:
+                self.dropped_messages += 1
+                return False
+        logger.warning(f"Send queue overflow for {self.user_id}, disconnecting")
+        self._fail(status.WS_1013_TRY_AGAIN_LATER)
+        return False
+
+    async def _write_loop(self):
+        try:
+            while True:
+                while not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                # Без таймаута на каждую отправку: зависший клиент переполнит очередь и будет отключен
+                if self.codec.binary:
+                    count = min(len(self._queue), self.max_batch)
+                    events = [self._queue.popleft()[0] for _ in range(count)]
+                    await self.websocket.send_bytes(self.codec.frame(events))
+                else:
+                    payload, _ = self._queue.popleft()
+                    await self.websocket.send_text(payload)
+                self._sent.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending to {self.user_id}: {e}")
+            self._fail(status.WS_1011_INTERNAL_ERROR)
+
+    def _fail(self, code: int):
+        if self.closed:
+            return
+        self.close()
+        asyncio.create_task(self._close_socket(code))
+        self._on_closed(self)
+
+    async def _close_socket(self, code: int):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), self.close_timeout)
+        except Exception:
+            pass
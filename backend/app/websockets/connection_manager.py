@@ -1,121 +1,293 @@
 # app/websockets/table_sync_manager.py
 from fastapi import WebSocket
-from typing import Dict, Set, List, Optional
+from typing import Callable, Dict, Set, List, Optional, Tuple
 import json
+import time
+import uuid
 from datetime import datetime
 import logging
 import asyncio
 
+from starlette.concurrency import run_in_threadpool
+
+from .cell_writer import CellEdit, CellWriteBuffer, WriteResult
+from .client_connection import ClientConnection
+from .protocol import JSON_CODEC, OutboundMessage
+from .pubsub import PubSubBackend, PostgresPubSub, create_pubsub
+from .lock_store import MemoryLockStore, PostgresLockStore, RANGE_COLUMN, RANGE_ROW, lock_target
+from .timer_wheel import TimerWheel
+from ..core.config import settings
+from ..crud.table import table_change_tracker
+
 logger = logging.getLogger(__name__)
 
+# Сообщения, которые можно выбросить из очереди медленного клиента: следующее все равно их заменит
+DROPPABLE_MESSAGE_TYPES = {"cursors_moved"}
+# Сообщения других узлов, по которым обновляется локальное представление таблицы
+STATEFUL_MESSAGE_TYPES = {"user_joined", "user_left", "cursors_moved", "cell_locked", "cell_unlocked"}
+
+# Виды конвертов в канале таблицы
+ENVELOPE_MESSAGE = "message"
+ENVELOPE_PRESENCE = "presence"
+ENVELOPE_PRESENCE_REQUEST = "presence_request"
+
 class TableSyncManager:
     """
-    Специализированный менеджер для синхронизации таблиц
+    Специализированный менеджер для синхронизации таблиц.
+    Соединения живут в своем воркере, а события таблицы идут через канал pub/sub, общий для всех воркеров и узлов:
+    каждый узел доставляет их своим подписчикам. Блокировки ячеек хранятся в общем хранилище (lock_store),
+    присутствие пользователей других узлов собирается из их объявлений
     """
     
-    def __init__(self):
-        # {user_id: WebSocket} - активные соединения
-        self.active_connections: Dict[str, WebSocket] = {}
+    def __init__(
+        self,
+        pubsub: Optional[PubSubBackend] = None,
+        lock_store=None,
+        node_id: Optional[str] = None,
+        heartbeat_seconds: float = settings.WS_PRESENCE_HEARTBEAT_SECONDS,
+        cursor_flush_hz: float = settings.WS_CURSOR_FLUSH_HZ,
+        lock_ttl: float = settings.WS_LOCK_TTL_SECONDS,
+        lock_reaper_tick: float = settings.WS_LOCK_REAPER_TICK_SECONDS
+    ):
+        self.node_id = node_id or uuid.uuid4().hex
+        self.pubsub = pubsub
+        self.lock_store = lock_store
+        self.heartbeat_seconds = heartbeat_seconds
+        self.cursor_flush_interval = 1 / cursor_flush_hz
+        self.lock_ttl = lock_ttl
+
+        # Реестр сессий узла. У пользователя может быть сколько угодно соединений (вкладок);
+        # прямые и обратные индексы делают подключение, отключение и поиск O(1)
+        # {connection_id: ClientConnection} - активные соединения с очередями отправки
+        self.connections: Dict[str, ClientConnection] = {}
+        # {connection_id: Set[table_id]}, {user_id: Set[connection_id]}, {table_id: Set[connection_id]}
+        self.connection_tables: Dict[str, Set[str]] = {}
+        self.user_connections: Dict[str, Set[str]] = {}
+        self.table_connections: Dict[str, Set[str]] = {}
         
-        # {table_id: Set[user_id]} - кто на какой таблице
-        self.table_subscriptions: Dict[str, Set[str]] = {}
+        # {table_id: {user_id: число соединений}} - кто на какой таблице (в этом узле)
+        self.table_subscriptions: Dict[str, Dict[str, int]] = {}
         
-        # {table_id: {cell: user_id}} - блокировки ячеек
+        # {table_id: {cell: user_id}} - блокировки ячеек: копия по событиям, решения принимает lock_store
         self.cell_locks: Dict[str, Dict[str, str]] = {}
+
+        # Блокировки - аренды со сроком lock_ttl. Сроки известных узлу аренд (своих и чужих) лежат в колесе таймеров,
+        # по истечении срок сверяется с хранилищем: продленная аренда переносится, истекшая снимается и рассылается
+        self.lease_wheel = TimerWheel(tick=lock_reaper_tick, now=time.monotonic())
+        # {(table_id, user_id): Set[cell]} и время последнего продления аренд пользователя в таблице
+        self._user_leases: Dict[Tuple[str, str], Set[str]] = {}
+        self._leases_renewed: Dict[Tuple[str, str], float] = {}
+        # Идущее освобождение аренд ушедшего пользователя: его новые захваты ждут конца, иначе release_user снял бы и их
+        self._releasing_leases: Dict[Tuple[str, str], asyncio.Event] = {}
+        self._lease_reaper: Optional[asyncio.Task] = None
         
         # {table_id: {user_id: cursor_data}} - позиции курсоров
         self.user_cursors: Dict[str, Dict[str, dict]] = {}
 
-    async def connect_to_table(self, websocket: WebSocket, user_id: str, table_id: str):
-        """Подключиться к конкретной таблице"""
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        
+        # {table_id: {user_id: cursor_data}} - курсоры, сдвинутые с последней рассылки; рассылаются раз в такт
+        self._pending_cursors: Dict[str, Dict[str, dict]] = {}
+        self._cursor_flushers: Dict[str, asyncio.Task] = {}
+
+        # {table_id: {node_id: (время последнего объявления, пользователи)}} - присутствие на других узлах
+        self.remote_presence: Dict[str, Dict[str, Tuple[float, Set[str]]]] = {}
+
+        self._channel_handlers: Dict[str, Callable[[str], None]] = {}
+        self._started = False
+        self._start_lock = asyncio.Lock()
+        self._heartbeat: Optional[asyncio.Task] = None
+        # Цикл событий узла: изменения из REST и импорта приходят из потоков-воркеров
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._change_tasks: Set[asyncio.Task] = set()
+
+        # Правки ячеек с адресом записи копятся и пишутся в БД пачками; после commit авторам уходит версия
+        self.cell_writer = CellWriteBuffer(self._on_cells_written)
+
+    # 🔌 ЗАПУСК И ОСТАНОВКА
+
+    async def start(self):
+        """Подключить транспорт и хранилище блокировок; вызывается при старте приложения или при первом соединении"""
+        async with self._start_lock:
+            if self._started:
+                return
+            if self.pubsub is None:
+                self.pubsub = create_pubsub()
+            await self.pubsub.start()
+            if self.lock_store is None:
+                self.lock_store = self._create_lock_store()
+            self._loop = asyncio.get_running_loop()
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+            self._lease_reaper = asyncio.create_task(self._lease_reaper_loop())
+            self._started = True
+
+    async def stop(self):
+        if not self._started:
+            return
+        self._started = False
+        for task in (self._heartbeat, self._lease_reaper):
+            if task is not None:
+                task.cancel()
+        await self.cell_writer.stop()
+        # Другие узлы сразу забывают наших пользователей, не дожидаясь устаревания объявлений
+        for table_id in list(self._channel_handlers):
+            await self._publish(table_id, {"kind": ENVELOPE_PRESENCE, "users": [], "cursors": {}})
+        await self.pubsub.stop()
+        self._channel_handlers.clear()
+
+    def _create_lock_store(self):
+        if isinstance(self.pubsub, PostgresPubSub):
+            lock_store = PostgresLockStore(self.node_id, self.pubsub.backend_pid)
+            # Новый pid слушателя после переподключения - иначе наши блокировки сочли бы брошенными
+            self.pubsub.on_reconnect.append(
+                lambda: asyncio.create_task(run_in_threadpool(lock_store.set_owner_pid, self.pubsub.backend_pid))
+            )
+            return lock_store
+        return MemoryLockStore()
+
+    async def connect_to_table(self, websocket: WebSocket, user_id: str, table_id: str, codec=JSON_CODEC) -> str:
+        """
+        Подключиться к конкретной таблице; codec - протокол, согласованный с клиентом (см. protocol.select_codec).
+        Возвращает id нового соединения: по нему идут все дальнейшие вызовы. Другие вкладки пользователя не затрагиваются
+        """
+        await self.start()
+        await websocket.accept(subprotocol=codec.subprotocol)
+        connection_id = uuid.uuid4().hex
+        connection = ClientConnection(websocket, user_id, self._on_connection_closed, codec, connection_id=connection_id)
+        connection.start()
+        self.connections[connection_id] = connection
+        self.connection_tables[connection_id] = set()
+        self.user_connections.setdefault(user_id, set()).add(connection_id)
+        await self._join_table(connection_id, table_id)
+        return connection_id
+
+    async def _join_table(self, connection_id: str, table_id: str):
+        user_id = self.connections[connection_id].user_id
+
         # Подписываем на таблицу
         if table_id not in self.table_subscriptions:
-            self.table_subscriptions[table_id] = set()
-            self.cell_locks[table_id] = {}
-            self.user_cursors[table_id] = {}
-            
-        self.table_subscriptions[table_id].add(user_id)
+            self.table_subscriptions[table_id] = {}
+            self.cell_locks.setdefault(table_id, {})
+            self.user_cursors.setdefault(table_id, {})
+
+        users = self.table_subscriptions[table_id]
+        first_connection = user_id not in users
+        users[user_id] = users.get(user_id, 0) + 1
+        self.table_connections.setdefault(table_id, set()).add(connection_id)
+        self.connection_tables[connection_id].add(table_id)
+        await self._subscribe_channel(table_id)
         
-        logger.info(f"User {user_id} connected to table {table_id}")
+        logger.info(f"User {user_id} connected to table {table_id} ({connection_id})")
         
-        # Уведомляем всех о новом пользователе
-        await self._broadcast_to_table(table_id, {
-            "type": "user_joined",
-            "user_id": user_id,
-            "table_id": table_id,
-            "timestamp": datetime.now().isoformat(),
-            "active_users": list(self.table_subscriptions[table_id])
-        }, exclude_user=user_id)
+        # Уведомляем всех о новом пользователе (новая вкладка того же пользователя - не новый участник)
+        if first_connection:
+            await self._broadcast_to_table(table_id, {
+                "type": "user_joined",
+                "user_id": user_id,
+                "table_id": table_id,
+                "timestamp": datetime.now().isoformat(),
+                "active_users": self._active_users(table_id)
+            }, exclude_user=user_id)
         
-        # Отправляем текущее состояние новому пользователю
-        await self._send_to_user(user_id, {
+        # Отправляем текущее состояние новому соединению; блокировки - из общего хранилища
+        leases = await self.lock_store.table_leases(table_id)
+        for cell in [cell for cell in self.cell_locks.get(table_id, {}) if cell not in leases]:
+            self._untrack_lease(table_id, cell)
+        for cell, (holder, remaining) in leases.items():
+            self._track_lease(table_id, cell, holder, remaining)
+        locked_cells = {cell: holder for cell, (holder, _) in leases.items()}
+        await self._send_to_connection(connection_id, {
             "type": "table_state",
             "table_id": table_id,
-            "active_users": list(self.table_subscriptions[table_id]),
-            "locked_cells": self.cell_locks[table_id],
+            "active_users": self._active_users(table_id),
+            "locked_cells": locked_cells,
             "user_cursors": self.user_cursors[table_id]
         })
 
-    def disconnect(self, user_id: str):
-        """Отключиться от всех таблиц"""
-        if user_id not in self.active_connections:
+    def disconnect(self, connection_id: str):
+        """Закрыть соединение и отписать его от всех его таблиц; остальные соединения пользователя остаются"""
+        connection = self.connections.pop(connection_id, None)
+        if connection is None:
             return
-            
-        # Удаляем из всех таблиц
-        tables_to_cleanup = []
-        for table_id, users in self.table_subscriptions.items():
-            if user_id in users:
-                users.remove(user_id)
-                tables_to_cleanup.append(table_id)
-                
-                # Освобождаем заблокированные ячейки
-                cells_to_unlock = []
-                for cell, locked_by in self.cell_locks.get(table_id, {}).items():
-                    if locked_by == user_id:
-                        cells_to_unlock.append(cell)
-                
-                for cell in cells_to_unlock:
-                    del self.cell_locks[table_id][cell]
-                
-                # Удаляем курсор
-                if table_id in self.user_cursors and user_id in self.user_cursors[table_id]:
-                    del self.user_cursors[table_id][user_id]
-        
-        # Удаляем соединение
-        del self.active_connections[user_id]
-        
-        # Уведомляем об отключении (асинхронно)
-        for table_id in tables_to_cleanup:
+        connection.close()
+        user_id = connection.user_id
+
+        user_connections = self.user_connections.get(user_id, set())
+        user_connections.discard(connection_id)
+        if not user_connections:
+            self.user_connections.pop(user_id, None)
+
+        for table_id in self.connection_tables.pop(connection_id, ()):
+            table_connections = self.table_connections.get(table_id, set())
+            table_connections.discard(connection_id)
+            if not table_connections:
+                self.table_connections.pop(table_id, None)
+
+            users = self.table_subscriptions.get(table_id, {})
+            remaining = users.get(user_id, 1) - 1
+            if remaining > 0:
+                users[user_id] = remaining
+                continue
+            # Последнее соединение пользователя с таблицей: он уходит из нее
+            users.pop(user_id, None)
+            self.user_cursors.get(table_id, {}).pop(user_id, None)
+            self._pending_cursors.get(table_id, {}).pop(user_id, None)
+            # Освобождаем блокировки и уведомляем об отключении (асинхронно: хранилище блокировок общее)
             asyncio.create_task(self._notify_user_left(table_id, user_id))
         
-        logger.info(f"User {user_id} disconnected")
+        logger.info(f"User {user_id} disconnected ({connection_id})")
 
     async def _notify_user_left(self, table_id: str, user_id: str):
-        """Уведомить о выходе пользователя"""
+        """Освободить блокировки ушедшего пользователя и уведомить о выходе"""
+        # Пользователь успел вернуться (переподключение, новая вкладка): блокировки и присутствие остаются за ним
+        if user_id in self.table_subscriptions.get(table_id, {}):
+            return
+        releasing = self._releasing_leases[(table_id, user_id)] = asyncio.Event()
+        try:
+            for cell in await self.lock_store.release_user(table_id, user_id):
+                self._untrack_lease(table_id, cell)
+        except Exception as e:
+            logger.error(f"Не удалось освободить блокировки {user_id} в таблице {table_id}: {e}")
+        finally:
+            if self._releasing_leases.get((table_id, user_id)) is releasing:
+                del self._releasing_leases[(table_id, user_id)]
+            releasing.set()
         await self._broadcast_to_table(table_id, {
             "type": "user_left",
             "user_id": user_id,
             "table_id": table_id,
             "timestamp": datetime.now().isoformat(),
-            "active_users": list(self.table_subscriptions.get(table_id, []))
+            "active_users": self._active_users(table_id)
         })
+        if not self.table_subscriptions.get(table_id):
+            await self._unsubscribe_channel(table_id)
 
     # 🎯 ОСНОВНЫЕ ФУНКЦИИ ДЛЯ СИНХРОНИЗАЦИИ ТАБЛИЦ
 
-    async def sync_cell_update(self, table_id: str, user_id: str, cell_data: dict) -> bool:
+    async def sync_cell_update(self, table_id: str, connection_id: str, cell_data: dict, can_edit: bool = False) -> bool:
         """
-        Синхронизировать обновление ячейки
+        Синхронизировать обновление ячейки.
+        Если в cell_data есть record_id и column, правка еще и сохраняется в запись (отложенно, см. CellWriteBuffer):
+        после commit соединение-автор получает cell_update_ack с версией таблицы, при неудаче - cell_update_error
         """
-        # Проверяем, что пользователь подключен к таблице
-        if not self._is_user_subscribed(table_id, user_id):
+        # Проверяем, что соединение подключено к таблице
+        user_id = self._subscribed_user(table_id, connection_id)
+        if user_id is None:
             return False
+
+        persist = cell_data.get("record_id") is not None
+        if persist:
+            error = self._check_persisted_edit(cell_data, can_edit)
+            if error:
+                await self._send_to_connection(connection_id, {
+                    "type": "cell_update_error",
+                    "table_id": table_id,
+                    "cells": [self._cell_ref(cell_data)],
+                    "message": error
+                })
+                return False
             
         # Проверяем, что ячейка не заблокирована другим пользователем
-        if not self._is_cell_editable(table_id, cell_data["cell"], user_id):
-            await self._send_to_user(user_id, {
+        if not await self._is_cell_editable(table_id, cell_data, user_id):
+            await self._send_to_connection(connection_id, {
                 "type": "cell_lock_error",
                 "cell": cell_data["cell"],
                 "message": "Ячейка заблокирована другим пользователем"
@@ -129,27 +301,101 @@ class TableSyncManager:
             "cell": cell_data["cell"],
             "value": cell_data["value"],
             "formula": cell_data.get("formula"),
+            "record_id": cell_data.get("record_id"),
+            "column": cell_data.get("column"),
             "user_id": user_id,
             "timestamp": datetime.now().isoformat()
         })
+
+        await self._renew_leases(table_id, user_id)
+        if persist:
+            self.cell_writer.submit(table_id, CellEdit(
+                connection_id=connection_id,
+                cell=cell_data["cell"],
+                record_id=cell_data["record_id"],
+                column=cell_data["column"],
+                seq=cell_data.get("seq")
+            ), cell_data["value"])
         
         logger.info(f"Cell {cell_data['cell']} updated by {user_id} in table {table_id}")
         return True
 
-    async def sync_cell_lock(self, table_id: str, user_id: str, cell: str, lock: bool) -> bool:
-        """Заблокировать/разблокировать ячейку для редактирования"""
-        if not self._is_user_subscribed(table_id, user_id):
+    @staticmethod
+    def _check_persisted_edit(cell_data: dict, can_edit: bool) -> Optional[str]:
+        if not can_edit:
+            return "Недостаточно прав: требуется право 'edit_rows'"
+        record_id = cell_data.get("record_id")
+        if not isinstance(record_id, int) or isinstance(record_id, bool) or record_id <= 0:
+            return "record_id должен быть положительным целым числом"
+        if not isinstance(cell_data.get("column"), str) or not cell_data["column"]:
+            return "Не указана колонка (column)"
+        return None
+
+    @staticmethod
+    def _cell_ref(edit) -> dict:
+        if isinstance(edit, CellEdit):
+            return {"cell": edit.cell, "record_id": edit.record_id, "column": edit.column, "seq": edit.seq}
+        return {key: edit.get(key) for key in ("cell", "record_id", "column", "seq")}
+
+    async def _on_cells_written(self, result: WriteResult):
+        """Итог записи порции правок: подтверждения и ошибки их авторам, по одному сообщению на соединение"""
+        acked: Dict[str, List[dict]] = {}
+        failed: Dict[str, List[dict]] = {}
+        for edit in result.edits:
+            target = failed if result.version is None or edit.record_id in result.failed_records else acked
+            target.setdefault(edit.connection_id, []).append(self._cell_ref(edit))
+        for connection_id, cells in acked.items():
+            await self._send_to_connection(connection_id, {
+                "type": "cell_update_ack",
+                "table_id": result.table_id,
+                "version": result.version,
+                "cells": cells
+            })
+        for connection_id, cells in failed.items():
+            await self._send_to_connection(connection_id, {
+                "type": "cell_update_error",
+                "table_id": result.table_id,
+                "cells": cells,
+                "message": "Не удалось сохранить правку" if result.error else "Запись не найдена"
+            })
+
+    async def sync_cell_lock(
+        self, table_id: str, connection_id: str, cell: Optional[str], lock: bool,
+        record_id: Optional[int] = None, column: Optional[str] = None, lock_range: Optional[str] = None
+    ) -> bool:
+        """
+        Заблокировать/разблокировать ячейку для редактирования; блокировка принадлежит пользователю, а не вкладке.
+        lock_range=row/column блокирует строку record_id или колонку column целиком одной записью (ключ row:<id>, column:<имя>).
+        Блокировка - аренда на lock_ttl секунд: продлевается активностью пользователя в таблице и ping,
+        по истечении снимается с рассылкой cell_unlocked (reason=expired)
+        """
+        user_id = self._subscribed_user(table_id, connection_id)
+        if user_id is None:
+            return False
+        if lock_range == RANGE_ROW and not isinstance(record_id, int):
+            return False
+        if lock_range == RANGE_COLUMN and not column:
+            return False
+        key, record_id, column = lock_target(cell, record_id, column, lock_range)
+        if not key:
             return False
             
         if lock:
-            # Пытаемся заблокировать
-            if self._is_cell_editable(table_id, cell, user_id):
-                self.cell_locks[table_id][cell] = user_id
+            releasing = self._releasing_leases.get((table_id, user_id))
+            if releasing is not None:
+                await releasing.wait()
+            # Пытаемся заблокировать: захват атомарный в общем хранилище
+            if await self.lock_store.acquire(table_id, key, user_id, self.lock_ttl, record_id, column):
+                self._track_lease(table_id, key, user_id, self.lock_ttl)
                 await self._broadcast_to_table(table_id, {
                     "type": "cell_locked",
                     "table_id": table_id,
-                    "cell": cell,
+                    "cell": key,
+                    "record_id": record_id,
+                    "column": column,
+                    "range": lock_range,
                     "user_id": user_id,
+                    "expires_in": self.lock_ttl,
                     "timestamp": datetime.now().isoformat()
                 })
                 return True
@@ -157,85 +403,372 @@ class TableSyncManager:
                 return False
         else:
             # Разблокировать
-            if (table_id in self.cell_locks and 
-                cell in self.cell_locks[table_id] and 
-                self.cell_locks[table_id][cell] == user_id):
-                
-                del self.cell_locks[table_id][cell]
+            if await self.lock_store.release(table_id, key, user_id):
+                self._untrack_lease(table_id, key)
                 await self._broadcast_to_table(table_id, {
                     "type": "cell_unlocked",
                     "table_id": table_id,
-                    "cell": cell,
+                    "cell": key,
                     "user_id": user_id,
                     "timestamp": datetime.now().isoformat()
                 })
                 return True
         return False
 
-    async def sync_cursor_move(self, table_id: str, user_id: str, cursor_data: dict):
-        """Синхронизировать перемещение курсора"""
-        if not self._is_user_subscribed(table_id, user_id):
+    async def renew_leases(self, table_id: str, connection_id: str):
+        """Продлить блокировки пользователя соединения (ping клиента)"""
+        user_id = self._subscribed_user(table_id, connection_id)
+        if user_id is not None:
+            await self._renew_leases(table_id, user_id)
+
+    async def _renew_leases(self, table_id: str, user_id: str):
+        """Продление - одна запись в хранилище на все аренды пользователя в таблице и не чаще раза в половину срока"""
+        if not self._user_leases.get((table_id, user_id)):
+            return
+        now = time.monotonic()
+        if now - self._leases_renewed.get((table_id, user_id), 0.0) < self.lock_ttl / 2:
+            return
+        self._leases_renewed[(table_id, user_id)] = now
+        try:
+            for cell in await self.lock_store.renew(table_id, user_id, self.lock_ttl):
+                self.lease_wheel.schedule((table_id, cell, user_id), now + self.lock_ttl)
+        except Exception as e:
+            logger.error(f"Не удалось продлить блокировки {user_id} в таблице {table_id}: {e}")
+
+    def _track_lease(self, table_id: str, cell: str, user_id: str, remaining: float):
+        locks = self.cell_locks.setdefault(table_id, {})
+        previous = locks.get(cell)
+        if previous is not None and previous != user_id:
+            self._untrack_lease(table_id, cell)
+        locks[cell] = user_id
+        self._user_leases.setdefault((table_id, user_id), set()).add(cell)
+        self.lease_wheel.schedule((table_id, cell, user_id), time.monotonic() + max(remaining, 0.0))
+
+    def _untrack_lease(self, table_id: str, cell: str):
+        user_id = self.cell_locks.get(table_id, {}).pop(cell, None)
+        if user_id is None:
+            return
+        self.lease_wheel.cancel((table_id, cell, user_id))
+        user_leases = self._user_leases.get((table_id, user_id))
+        if user_leases is not None:
+            user_leases.discard(cell)
+            if not user_leases:
+                del self._user_leases[(table_id, user_id)]
+                self._leases_renewed.pop((table_id, user_id), None)
+
+    async def _lease_reaper_loop(self):
+        """Такт колеса аренд: разбирается одна ячейка колеса, а не все блокировки"""
+        while True:
+            await asyncio.sleep(self.lease_wheel.tick)
+            for table_id, cell, user_id in self.lease_wheel.advance(time.monotonic()):
+                try:
+                    await self._expire_lease(table_id, cell, user_id)
+                except Exception as e:
+                    logger.error(f"Ошибка снятия истекшей блокировки {cell} в таблице {table_id}: {e}")
+
+    async def _expire_lease(self, table_id: str, cell: str, user_id: str):
+        expired, remaining = await self.lock_store.expire(table_id, cell, user_id)
+        if remaining > 0:
+            # Продлена (в том числе другим узлом) - ждем новый срок
+            self.lease_wheel.schedule((table_id, cell, user_id), time.monotonic() + remaining)
+            return
+        if self.cell_locks.get(table_id, {}).get(cell) == user_id:
+            self._untrack_lease(table_id, cell)
+        if expired:
+            # Сняли мы: рассылаем всем узлам. Уже снятая кем-то аренда рассылку получила от него
+            await self._broadcast_to_table(table_id, {
+                "type": "cell_unlocked",
+                "table_id": table_id,
+                "cell": cell,
+                "user_id": user_id,
+                "reason": "expired",
+                "timestamp": datetime.now().isoformat()
+            })
+
+    async def sync_cursor_move(self, table_id: str, connection_id: str, cursor_data: dict):
+        """
+        Синхронизировать перемещение курсора. Сразу ничего не рассылается: курсоры копятся до такта таблицы
+        (WS_CURSOR_FLUSH_HZ), от каждого пользователя уходит только последняя позиция
+        """
+        user_id = self._subscribed_user(table_id, connection_id)
+        if user_id is None:
+            return
+        await self._renew_leases(table_id, user_id)
+
+        previous = self.user_cursors[table_id].get(user_id)
+        if previous is not None and {k: v for k, v in previous.items() if k != "last_updated"} == cursor_data:
             return
             
         self.user_cursors[table_id][user_id] = {
             **cursor_data,
             "last_updated": datetime.now().isoformat()
         }
-        
-        # Рассылаем обновление позиции курсора
-        await self._broadcast_to_table(table_id, {
-            "type": "cursor_moved",
-            "table_id": table_id,
-            "user_id": user_id,
-            "cursor": cursor_data,
-            "timestamp": datetime.now().isoformat()
-        }, exclude_user=user_id)
+        self._pending_cursors.setdefault(table_id, {})[user_id] = cursor_data
+        if table_id not in self._cursor_flushers:
+            self._cursor_flushers[table_id] = asyncio.create_task(self._flush_cursors(table_id))
+
+    async def _flush_cursors(self, table_id: str):
+        """
+        Такт таблицы: одно сообщение cursors_moved со всеми сдвинувшимися курсорами.
+        Сообщение общее для всех подписчиков (сериализуется один раз), свой курсор клиент пропускает по user_id.
+        Без движения цикл завершается и запускается снова при следующем перемещении
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.cursor_flush_interval)
+                cursors = self._pending_cursors.pop(table_id, None)
+                if not cursors:
+                    break
+                await self._broadcast_to_table(table_id, {
+                    "type": "cursors_moved",
+                    "table_id": table_id,
+                    "cursors": cursors,
+                    "timestamp": datetime.now().isoformat()
+                })
+        except Exception as e:
+            logger.error(f"Ошибка рассылки курсоров таблицы {table_id}: {e}")
+        finally:
+            self._cursor_flushers.pop(table_id, None)
+
+    async def broadcast_to_table(self, table_id: str, message: dict):
+        """Разослать серверное событие (например, прогресс импорта) всем подписчикам таблицы"""
+        await self._broadcast_to_table(table_id, message)
+
+    def publish_table_changes(self, table_id: str, message: dict):
+        """
+        Разослать изменения таблицы после commit (table_changed); можно вызывать из любого потока.
+        Версии одной таблицы из разных потоков могут прийти не по порядку: клиент упорядочивает их по version
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            task = loop.create_task(self._broadcast_to_table(table_id, message))
+            self._change_tasks.add(task)
+            task.add_done_callback(self._change_tasks.discard)
+        else:
+            asyncio.run_coroutine_threadsafe(self._broadcast_to_table(table_id, message), loop)
+
+    async def send_to_connection(self, connection_id: str, message: dict):
+        """Ответ конкретному соединению через его очередь (не в обход писателя соединения)"""
+        await self._send_to_connection(connection_id, message)
+
+    async def send_to_connection_paced(self, connection_id: str, message: dict) -> bool:
+        """Как send_to_connection, но сначала ждет места в очереди соединения - для ответов из многих частей"""
+        connection = self.connections.get(connection_id)
+        if connection is None:
+            return False
+        await connection.wait_for_room()
+        return connection.send(OutboundMessage(message))
+
+    async def send_to_user(self, user_id: str, message: dict):
+        """Сообщение во все соединения пользователя на этом узле"""
+        outbound = OutboundMessage(message)
+        for connection_id in list(self.user_connections.get(user_id, ())):
+            self.connections[connection_id].send(outbound)
 
     # 🛠️ ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ
 
-    def _is_user_subscribed(self, table_id: str, user_id: str) -> bool:
-        """Подписан ли пользователь на таблицу?"""
-        return (table_id in self.table_subscriptions and 
-                user_id in self.table_subscriptions[table_id])
+    def _subscribed_user(self, table_id: str, connection_id: str) -> Optional[str]:
+        """Пользователь соединения, если оно подписано на таблицу"""
+        if table_id not in self.connection_tables.get(connection_id, ()):
+            return None
+        return self.connections[connection_id].user_id
 
-    def _is_cell_editable(self, table_id: str, cell: str, user_id: str) -> bool:
-        """Можно ли редактировать ячейку?"""
-        if table_id not in self.cell_locks:
-            return True
-            
-        current_locker = self.cell_locks[table_id].get(cell)
-        return current_locker is None or current_locker == user_id
+    async def _is_cell_editable(self, table_id: str, cell_data: dict, user_id: str) -> bool:
+        """
+        Можно ли редактировать ячейку? Мешает чужая блокировка ячейки, ее строки или колонки.
+        Решает общее хранилище, а не локальная копия
+        """
+        holder = await self.lock_store.conflicting_holder(
+            table_id, user_id, cell_data["cell"], cell_data.get("record_id"), cell_data.get("column")
+        )
+        return holder is None
+
+    def _active_users(self, table_id: str) -> List[str]:
+        """Пользователи таблицы на этом и на других узлах"""
+        users = set(self.table_subscriptions.get(table_id, ()))
+        for _, remote_users in self.remote_presence.get(table_id, {}).values():
+            users |= remote_users
+        return sorted(users)
 
     async def _broadcast_to_table(self, table_id: str, message: dict, exclude_user: Optional[str] = None):
-        """Разослать сообщение всем подписчикам таблицы"""
-        if table_id not in self.table_subscriptions:
+        """
+        Разослать сообщение всем подписчикам таблицы: своим - постановкой в очереди соединений,
+        другим узлам - через канал таблицы
+        """
+        outbound = OutboundMessage(message)
+        self._deliver_local(table_id, outbound, message.get("type"), exclude_user)
+        await self._publish(table_id, {
+            "kind": ENVELOPE_MESSAGE,
+            "type": message.get("type"),
+            "exclude": exclude_user,
+            "payload": outbound.json
+        })
+
+    def _deliver_local(
+        self, table_id: str, outbound: OutboundMessage, message_type: Optional[str], exclude_user: Optional[str]
+    ):
+        connection_ids = self.table_connections.get(table_id)
+        if not connection_ids:
             return
-        
-        disconnected_users = []
-        
-        for user_id in list(self.table_subscriptions[table_id]):  # копируем список
-            if user_id == exclude_user:
-                continue
-                
-            if user_id in self.active_connections:
+        droppable = message_type in DROPPABLE_MESSAGE_TYPES
+        for connection_id in list(connection_ids):  # копируем: переполнение отключает клиента
+            connection = self.connections.get(connection_id)
+            if connection is not None and connection.user_id != exclude_user:
+                connection.send(outbound, droppable)
+
+    async def _send_to_connection(self, connection_id: str, message: dict):
+        """Отправить сообщение конкретному соединению"""
+        connection = self.connections.get(connection_id)
+        if connection is not None:
+            connection.send(OutboundMessage(message))
+
+    # 📡 КАНАЛЫ ТАБЛИЦ МЕЖДУ УЗЛАМИ
+
+    @staticmethod
+    def _channel(table_id: str) -> str:
+        return f"table_sync_{table_id}"
+
+    async def _subscribe_channel(self, table_id: str):
+        if table_id in self._channel_handlers:
+            return
+        handler = lambda raw: self._on_channel_message(table_id, raw)
+        self._channel_handlers[table_id] = handler
+        await self.pubsub.subscribe(self._channel(table_id), handler)
+        # Узлы, где таблица уже открыта, ответят списком своих пользователей
+        await self._publish(table_id, {"kind": ENVELOPE_PRESENCE_REQUEST})
+
+    async def _unsubscribe_channel(self, table_id: str):
+        handler = self._channel_handlers.pop(table_id, None)
+        if handler is None:
+            return
+        await self._publish(table_id, {"kind": ENVELOPE_PRESENCE, "users": [], "cursors": {}})
+        await self.pubsub.unsubscribe(self._channel(table_id), handler)
+        # Пока отписывались, мог подключиться новый пользователь
+        if self.table_subscriptions.get(table_id):
+            await self._subscribe_channel(table_id)
+            return
+        for cell in list(self.cell_locks.get(table_id, ())):
+            self._untrack_lease(table_id, cell)
+        for state in (self.table_subscriptions, self.cell_locks, self.user_cursors, self.remote_presence):
+            state.pop(table_id, None)
+
+    async def _publish(self, table_id: str, envelope: dict):
+        if self.pubsub is None:
+            return
+        try:
+            await self.pubsub.publish(self._channel(table_id), json.dumps({"node": self.node_id, **envelope}))
+        except Exception as e:
+            # Свои подписчики уже получили сообщение; другие узлы догонят по следующим событиям и объявлениям
+            logger.error(f"Не удалось опубликовать событие таблицы {table_id}: {e}")
+
+    def _on_channel_message(self, table_id: str, raw: str):
+        envelope = json.loads(raw)
+        node_id = envelope.get("node")
+        if node_id == self.node_id:
+            return
+        kind = envelope.get("kind")
+        if kind == ENVELOPE_MESSAGE:
+            # Сообщение приходит в JSON; в другие протоколы перекодируется один раз, если есть такие получатели
+            outbound = OutboundMessage(json_text=envelope["payload"])
+            if envelope.get("type") in STATEFUL_MESSAGE_TYPES:
+                self._apply_remote_message(table_id, node_id, outbound.message)
+            self._deliver_local(table_id, outbound, envelope.get("type"), envelope.get("exclude"))
+        elif kind == ENVELOPE_PRESENCE:
+            self._apply_presence(table_id, node_id, envelope.get("users", []), envelope.get("cursors", {}))
+        elif kind == ENVELOPE_PRESENCE_REQUEST and self.table_subscriptions.get(table_id):
+            asyncio.create_task(self._announce(table_id))
+
+    def _apply_remote_message(self, table_id: str, node_id: str, message: dict):
+        message_type = message.get("type")
+        user_id = message.get("user_id")
+        if message_type == "user_joined":
+            _, users = self.remote_presence.setdefault(table_id, {}).get(node_id, (0.0, set()))
+            self.remote_presence[table_id][node_id] = (time.monotonic(), users | {user_id})
+        elif message_type == "user_left":
+            seen, users = self.remote_presence.get(table_id, {}).get(node_id, (0.0, set()))
+            if node_id in self.remote_presence.get(table_id, {}):
+                self.remote_presence[table_id][node_id] = (seen, users - {user_id})
+            if user_id not in self._active_users(table_id):
+                self._forget_absent_cursors(table_id)
+                for cell in list(self._user_leases.get((table_id, user_id), ())):
+                    self._untrack_lease(table_id, cell)
+        elif message_type == "cursors_moved":
+            cursors = self.user_cursors.setdefault(table_id, {})
+            for cursor_user_id, cursor in message.get("cursors", {}).items():
+                cursors[cursor_user_id] = {**cursor, "last_updated": message.get("timestamp")}
+        elif message_type == "cell_locked":
+            self._track_lease(table_id, message["cell"], user_id, message.get("expires_in", self.lock_ttl))
+        elif message_type == "cell_unlocked":
+            if self.cell_locks.get(table_id, {}).get(message["cell"]) == user_id:
+                self._untrack_lease(table_id, message["cell"])
+
+    def _apply_presence(self, table_id: str, node_id: str, users: List[str], cursors: Dict[str, dict]):
+        before = set(self._active_users(table_id))
+        presence = self.remote_presence.setdefault(table_id, {})
+        if users:
+            presence[node_id] = (time.monotonic(), set(users))
+            self.user_cursors.setdefault(table_id, {}).update(cursors)
+        else:
+            presence.pop(node_id, None)
+            self._forget_absent_cursors(table_id)
+        self._notify_presence_changes(table_id, before)
+
+    def _notify_presence_changes(self, table_id: str, before: Set[str]):
+        """
+        Пользователи, о которых узнали из объявлений (ответ на запрос при открытии таблицы, устаревший узел),
+        приходят клиентам привычными user_joined/user_left
+        """
+        active = self._active_users(table_id)
+        changes = [("user_joined", user_id) for user_id in sorted(set(active) - before)]
+        changes += [("user_left", user_id) for user_id in sorted(before - set(active))]
+        for message_type, user_id in changes:
+            self._deliver_local(table_id, OutboundMessage({
+                "type": message_type,
+                "user_id": user_id,
+                "table_id": table_id,
+                "timestamp": datetime.now().isoformat(),
+                "active_users": active
+            }), message_type, None)
+
+    async def _announce(self, table_id: str):
+        users = sorted(self.table_subscriptions.get(table_id, ()))
+        cursors = {user_id: cursor for user_id, cursor in self.user_cursors.get(table_id, {}).items() if user_id in users}
+        await self._publish(table_id, {"kind": ENVELOPE_PRESENCE, "users": users, "cursors": cursors})
+
+    async def _heartbeat_loop(self):
+        """Периодическое объявление своих пользователей; узлы, молчащие три интервала, считаются ушедшими"""
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            deadline = time.monotonic() - 3 * self.heartbeat_seconds
+            for table_id in list(self._channel_handlers):
                 try:
-                    await self.active_connections[user_id].send_json(message)
+                    before = set(self._active_users(table_id))
+                    presence = self.remote_presence.get(table_id, {})
+                    for node_id in [node_id for node_id, (seen, _) in presence.items() if seen < deadline]:
+                        del presence[node_id]
+                    self._forget_absent_cursors(table_id)
+                    self._notify_presence_changes(table_id, before)
+                    if self.table_subscriptions.get(table_id):
+                        await self._announce(table_id)
                 except Exception as e:
-                    logger.error(f"Error sending to {user_id}: {e}")
-                    disconnected_users.append(user_id)
-        
-        # Чистим отключившихся
-        for user_id in disconnected_users:
-            self.disconnect(user_id)
-
-    async def _send_to_user(self, user_id: str, message: dict):
-        """Отправить сообщение конкретному пользователю"""
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending to {user_id}: {e}")
-                self.disconnect(user_id)
+                    logger.error(f"Ошибка объявления присутствия в таблице {table_id}: {e}")
+
+    def _forget_absent_cursors(self, table_id: str):
+        active = set(self._active_users(table_id))
+        cursors = self.user_cursors.get(table_id, {})
+        for user_id in [user_id for user_id in cursors if user_id not in active]:
+            del cursors[user_id]
+
+    def _on_connection_closed(self, connection: ClientConnection):
+        """Писатель соединения не смог отправить или очередь переполнилась"""
+        if self.connections.get(connection.connection_id) is connection:
+            self.disconnect(connection.connection_id)
 
     # 📊 МЕТОДЫ ДЛЯ МОНИТОРИНГА
 
@@ -246,18 +779,29 @@ class TableSyncManager:
             
         return {
             "table_id": table_id,
-            "active_users": list(self.table_subscriptions[table_id]),
+            "node_id": self.node_id,
+            "active_users": self._active_users(table_id),
+            "local_users": dict(self.table_subscriptions[table_id]),
             "locked_cells": self.cell_locks.get(table_id, {}),
             "user_cursors": self.user_cursors.get(table_id, {}),
-            "total_connections": len(self.active_connections)
+            "total_connections": len(self.connections),
+            "send_queues": {
+                connection_id: {
+                    "user_id": self.connections[connection_id].user_id,
+                    "queued": self.connections[connection_id].queued,
+                    "dropped": self.connections[connection_id].dropped_messages
+                }
+                for connection_id in self.table_connections.get(table_id, ()) if connection_id in self.connections
+            }
         }
 
     def get_user_tables(self, user_id: str) -> List[str]:
-        """На каких таблицах сидит пользователь"""
-        return [
-            table_id for table_id, users in self.table_subscriptions.items()
-            if user_id in users
-        ]
+        """На каких таблицах сидит пользователь (по его соединениям, без обхода всех таблиц)"""
+        tables = set()
+        for connection_id in self.user_connections.get(user_id, ()):
+            tables |= self.connection_tables.get(connection_id, set())
+        return sorted(tables)
 
 # Глобальный экземпляр
-table_sync_manager = TableSyncManager()
\ No newline at end of file
+table_sync_manager = TableSyncManager()
+table_change_tracker.add_publisher(table_sync_manager.publish_table_changes)
\ No newline at end of file
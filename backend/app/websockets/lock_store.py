@@ -0,0 +1,323 @@
+# app/websockets/lock_store.py
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+import logging
+import time
+
+from sqlalchemy import Integer, and_, column, delete, func, or_, select, table, update
+from sqlalchemy.dialects.postgresql import insert
+from starlette.concurrency import run_in_threadpool
+
+from ..database import SessionLocal
+from ..models import TableCellLock
+
+logger = logging.getLogger(__name__)
+
+# Соединения сервера Postgres: по pid слушателя узла видно, жив ли он
+_pg_stat_activity = table("pg_stat_activity", column("pid", Integer))
+
+RANGE_ROW = "row"
+RANGE_COLUMN = "column"
+
+
+def lock_target(
+    cell: Optional[str], record_id: Optional[int] = None, column_name: Optional[str] = None, lock_range: Optional[str] = None
+) -> Tuple[str, Optional[int], Optional[str]]:
+    """
+    (ключ, запись, колонка) блокировки. Строка или колонка целиком - одна запись с ключом row:<id> или column:<имя>,
+    а не по записи на каждую ячейку
+    """
+    if lock_range == RANGE_ROW:
+        return f"row:{record_id}", record_id, None
+    if lock_range == RANGE_COLUMN:
+        return f"column:{column_name}", None, column_name
+    return cell, record_id, column_name
+
+
+def _overlaps(
+    lease_key: str, lease_record_id: Optional[int], lease_column: Optional[str],
+    key: str, record_id: Optional[int], column_name: Optional[str]
+) -> bool:
+    """Пересекаются ли блокировки: тот же ключ, ячейка в заблокированной строке/колонке, строка и колонка"""
+    if lease_key == key:
+        return True
+    lease_is_row = lease_record_id is not None and lease_column is None
+    lease_is_column = lease_column is not None and lease_record_id is None
+    if record_id is not None and column_name is not None:
+        return (lease_is_row and lease_record_id == record_id) or (lease_is_column and lease_column == column_name)
+    if record_id is not None:
+        return lease_record_id == record_id or lease_is_column
+    if column_name is not None:
+        return lease_column == column_name or lease_is_row
+    return False
+
+
+@dataclass
+class _Lease:
+    user_id: str
+    record_id: Optional[int]
+    column_name: Optional[str]
+    expires_at: float
+
+
+class MemoryLockStore:
+    """Блокировки в памяти процесса: для одного воркера и тестов (в паре с InMemoryPubSub)"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        # {table_id: {key: _Lease}}
+        self._locks: Dict[str, Dict[str, _Lease]] = {}
+
+    def _live(self, table_id: str) -> Dict[str, _Lease]:
+        now = self.clock()
+        return {key: lease for key, lease in self._locks.get(table_id, {}).items() if lease.expires_at > now}
+
+    def _conflict(self, table_id: str, user_id: str, key: str, record_id, column_name) -> Optional[str]:
+        for lease_key, lease in self._live(table_id).items():
+            if lease.user_id != user_id and _overlaps(lease_key, lease.record_id, lease.column_name, key, record_id, column_name):
+                return lease.user_id
+        return None
+
+    async def acquire(
+        self, table_id: str, key: str, user_id: str, ttl: float,
+        record_id: Optional[int] = None, column_name: Optional[str] = None
+    ) -> bool:
+        if self._conflict(table_id, user_id, key, record_id, column_name) is not None:
+            return False
+        self._locks.setdefault(table_id, {})[key] = _Lease(user_id, record_id, column_name, self.clock() + ttl)
+        return True
+
+    async def renew(self, table_id: str, user_id: str, ttl: float) -> List[str]:
+        now = self.clock()
+        renewed = []
+        for key, lease in self._locks.get(table_id, {}).items():
+            if lease.user_id == user_id and lease.expires_at > now:
+                lease.expires_at = now + ttl
+                renewed.append(key)
+        return renewed
+
+    async def release(self, table_id: str, key: str, user_id: str) -> bool:
+        locks = self._locks.get(table_id, {})
+        lease = locks.get(key)
+        if lease is None or lease.user_id != user_id:
+            return False
+        del locks[key]
+        return True
+
+    async def release_user(self, table_id: str, user_id: str) -> List[str]:
+        locks = self._locks.get(table_id, {})
+        keys = [key for key, lease in locks.items() if lease.user_id == user_id]
+        for key in keys:
+            del locks[key]
+        return keys
+
+    async def expire(self, table_id: str, key: str, user_id: str) -> Tuple[bool, float]:
+        """(снята ли аренда сейчас, сколько секунд ей осталось); (False, 0) - аренды у пользователя уже нет"""
+        locks = self._locks.get(table_id, {})
+        lease = locks.get(key)
+        if lease is None or lease.user_id != user_id:
+            return False, 0.0
+        remaining = lease.expires_at - self.clock()
+        if remaining > 0:
+            return False, remaining
+        del locks[key]
+        return True, 0.0
+
+    async def conflicting_holder(
+        self, table_id: str, user_id: str, key: str, record_id: Optional[int] = None, column_name: Optional[str] = None
+    ) -> Optional[str]:
+        return self._conflict(table_id, user_id, key, record_id, column_name)
+
+    async def table_leases(self, table_id: str) -> Dict[str, Tuple[str, float]]:
+        """{ключ: (пользователь, сколько секунд осталось)} по действующим арендам"""
+        now = self.clock()
+        return {key: (lease.user_id, lease.expires_at - now) for key, lease in self._live(table_id).items()}
+
+
+class PostgresLockStore:
+    """
+    Блокировки в таблице table_cell_locks - один источник правды для всех узлов.
+    Захват идет под advisory-блокировкой таблицы: проверка пересечений (ячейка, строка, колонка) и запись атомарны.
+    Чужая аренда не мешает, если истек ее срок или закрыто соединение LISTEN ее узла (узел упал)
+    """
+
+    def __init__(self, node_id: str, owner_pid: Optional[int] = None):
+        self.node_id = node_id
+        self.owner_pid = owner_pid
+
+    def set_owner_pid(self, owner_pid: Optional[int]):
+        """После переподключения слушателя: иначе наши блокировки выглядели бы блокировками мертвого узла"""
+        self.owner_pid = owner_pid
+        db = SessionLocal()
+        try:
+            db.execute(update(TableCellLock).where(TableCellLock.node_id == self.node_id).values(owner_pid=owner_pid))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Не удалось обновить владельца блокировок узла {self.node_id}: {e}")
+        finally:
+            db.close()
+
+    async def acquire(
+        self, table_id: str, key: str, user_id: str, ttl: float,
+        record_id: Optional[int] = None, column_name: Optional[str] = None
+    ) -> bool:
+        return await run_in_threadpool(self._acquire, table_id, key, user_id, ttl, record_id, column_name)
+
+    async def renew(self, table_id: str, user_id: str, ttl: float) -> List[str]:
+        return await run_in_threadpool(self._renew, table_id, user_id, ttl)
+
+    async def release(self, table_id: str, key: str, user_id: str) -> bool:
+        return await run_in_threadpool(self._delete, table_id, user_id, key)
+
+    async def release_user(self, table_id: str, user_id: str) -> List[str]:
+        return await run_in_threadpool(self._delete, table_id, user_id)
+
+    async def expire(self, table_id: str, key: str, user_id: str) -> Tuple[bool, float]:
+        return await run_in_threadpool(self._expire, table_id, key, user_id)
+
+    async def conflicting_holder(
+        self, table_id: str, user_id: str, key: str, record_id: Optional[int] = None, column_name: Optional[str] = None
+    ) -> Optional[str]:
+        return await run_in_threadpool(self._conflicting_holder, table_id, user_id, key, record_id, column_name)
+
+    async def table_leases(self, table_id: str) -> Dict[str, Tuple[str, float]]:
+        return await run_in_threadpool(self._table_leases, table_id)
+
+    @staticmethod
+    def _live():
+        owner_alive = or_(
+            TableCellLock.owner_pid.is_(None),
+            TableCellLock.owner_pid.in_(select(_pg_stat_activity.c.pid))
+        )
+        return and_(TableCellLock.expires_at > func.now(), owner_alive)
+
+    @staticmethod
+    def _overlaps(key: str, record_id: Optional[int], column_name: Optional[str]):
+        """То же, что _overlaps для памяти, условием SQL"""
+        lock = TableCellLock
+        is_row = and_(lock.record_id.isnot(None), lock.column_name.is_(None))
+        is_column = and_(lock.column_name.isnot(None), lock.record_id.is_(None))
+        conditions = [lock.cell == key]
+        if record_id is not None and column_name is not None:
+            conditions += [and_(is_row, lock.record_id == record_id), and_(is_column, lock.column_name == column_name)]
+        elif record_id is not None:
+            conditions += [lock.record_id == record_id, is_column]
+        elif column_name is not None:
+            conditions += [lock.column_name == column_name, is_row]
+        return or_(*conditions)
+
+    def _conflict_query(self, table_id: str, user_id: str, key: str, record_id, column_name):
+        return select(TableCellLock.user_id).where(
+            TableCellLock.table_id == table_id,
+            TableCellLock.user_id != user_id,
+            self._live(),
+            self._overlaps(key, record_id, column_name)
+        ).limit(1)
+
+    def _acquire(self, table_id: str, key: str, user_id: str, ttl: float, record_id, column_name) -> bool:
+        db = SessionLocal()
+        try:
+            # Захваты одной таблицы по очереди, до конца транзакции
+            db.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"table_cell_locks:{table_id}"))))
+            if db.execute(self._conflict_query(table_id, user_id, key, record_id, column_name)).first() is not None:
+                db.rollback()
+                return False
+            expires_at = func.now() + timedelta(seconds=ttl)
+            statement = insert(TableCellLock).values(
+                table_id=table_id, cell=key, record_id=record_id, column_name=column_name,
+                user_id=user_id, node_id=self.node_id, owner_pid=self.owner_pid, expires_at=expires_at
+            )
+            statement = statement.on_conflict_do_update(
+                constraint="uq_table_cell_locks_cell",
+                set_={
+                    "record_id": statement.excluded.record_id,
+                    "column_name": statement.excluded.column_name,
+                    "user_id": statement.excluded.user_id,
+                    "node_id": statement.excluded.node_id,
+                    "owner_pid": statement.excluded.owner_pid,
+                    "expires_at": statement.excluded.expires_at,
+                    "locked_at": func.now(),
+                }
+            )
+            db.execute(statement)
+            db.commit()
+            return True
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _renew(self, table_id: str, user_id: str, ttl: float) -> List[str]:
+        db = SessionLocal()
+        try:
+            keys = list(db.execute(
+                update(TableCellLock)
+                .where(
+                    TableCellLock.table_id == table_id,
+                    TableCellLock.user_id == user_id,
+                    TableCellLock.expires_at > func.now()
+                )
+                .values(expires_at=func.now() + timedelta(seconds=ttl))
+                .returning(TableCellLock.cell)
+            ).scalars())
+            db.commit()
+            return keys
+        finally:
+            db.close()
+
+    def _delete(self, table_id: str, user_id: str, key: Optional[str] = None):
+        statement = delete(TableCellLock).where(
+            TableCellLock.table_id == table_id,
+            TableCellLock.user_id == user_id,
+            TableCellLock.node_id == self.node_id
+        )
+        if key is not None:
+            statement = statement.where(TableCellLock.cell == key)
+        db = SessionLocal()
+        try:
+            keys = list(db.execute(statement.returning(TableCellLock.cell)).scalars())
+            db.commit()
+            return bool(keys) if key is not None else keys
+        finally:
+            db.close()
+
+    def _expire(self, table_id: str, key: str, user_id: str) -> Tuple[bool, float]:
+        lease = and_(TableCellLock.table_id == table_id, TableCellLock.cell == key, TableCellLock.user_id == user_id)
+        db = SessionLocal()
+        try:
+            deleted = db.execute(
+                delete(TableCellLock).where(lease, TableCellLock.expires_at <= func.now()).returning(TableCellLock.id)
+            ).first()
+            db.commit()
+            if deleted is not None:
+                return True, 0.0
+            remaining = db.execute(
+                select(func.extract("epoch", TableCellLock.expires_at - func.now())).where(lease)
+            ).scalar()
+            return False, float(remaining or 0.0)
+        finally:
+            db.close()
+
+    def _conflicting_holder(self, table_id: str, user_id: str, key: str, record_id, column_name) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            return db.execute(self._conflict_query(table_id, user_id, key, record_id, column_name)).scalar()
+        finally:
+            db.close()
+
+    def _table_leases(self, table_id: str) -> Dict[str, Tuple[str, float]]:
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(
+                    TableCellLock.cell,
+                    TableCellLock.user_id,
+                    func.extract("epoch", TableCellLock.expires_at - func.now())
+                ).where(TableCellLock.table_id == table_id, self._live())
+            )
+            return {key: (user_id, float(remaining)) for key, user_id, remaining in rows}
+        finally:
+            db.close()
@@ -0,0 +1,247 @@
+# app/websockets/protocol.py
+"""
+Протоколы WebSocket синхронизации таблиц.
+
+json - по умолчанию: один JSON-объект на кадр, как раньше.
+table-sync.msgpack.v1 - клиент запрашивает подпротоколом (new WebSocket(url, ["table-sync.msgpack.v1"])):
+бинарные кадры MessagePack, кадр - массив событий, событие - [код типа, тело].
+Ключи тела сокращены по FIELD_KEYS, коды типов - MESSAGE_CODES (0 - тип передан в теле полем "type"),
+id пользователей - целые числа, timestamp - миллисекунды Unix. Клиент может прислать одно событие или массив событий
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    import msgpack
+except ImportError:  # без msgpack сервер предлагает только JSON
+    msgpack = None
+
+SUBPROTOCOL_JSON = "table-sync.json.v1"
+SUBPROTOCOL_MSGPACK = "table-sync.msgpack.v1"
+
+MESSAGE_CODES = {
+    # сервер -> клиент
+    "table_state": 1,
+    "user_joined": 2,
+    "user_left": 3,
+    "cell_updated": 4,
+    "cell_update_ack": 5,
+    "cell_update_error": 6,
+    "cell_locked": 7,
+    "cell_unlocked": 8,
+    "cell_lock_result": 9,
+    "cell_lock_error": 10,
+    "cursors_moved": 11,
+    "pong": 12,
+    "table_changed": 13,
+    "table_resync": 14,
+    "resync_error": 15,
+    # клиент -> сервер
+    "cell_update": 32,
+    "cell_lock": 33,
+    "cursor_move": 34,
+    "ping": 35,
+    "resync": 36,
+}
+MESSAGE_TYPES = {code: message_type for message_type, code in MESSAGE_CODES.items()}
+
+FIELD_KEYS = {
+    "table_id": "t",
+    "user_id": "u",
+    "cell": "c",
+    "value": "v",
+    "formula": "f",
+    "record_id": "r",
+    "column": "k",
+    "seq": "s",
+    "version": "n",
+    "lock": "l",
+    "success": "ok",
+    "message": "m",
+    "cells": "cl",
+    "cell_data": "cd",
+    "cursor_data": "xd",
+    "cursors": "cs",
+    "active_users": "au",
+    "locked_cells": "lc",
+    "user_cursors": "uc",
+    "timestamp": "ts",
+    "range": "rg",
+    "expires_in": "ex",
+    "reason": "rs",
+    "changes": "ch",
+    "count": "cn",
+    "truncated": "tr",
+    "entity": "e",
+    "op": "o",
+    "id": "i",
+    "fields": "fs",
+    "data": "d",
+    "since_version": "sv",
+    "snapshot": "sn",
+    "columns": "cols",
+    "done": "dn",
+}
+FIELD_NAMES = {short: name for name, short in FIELD_KEYS.items()}
+
+# Вложенные объекты с известными полями: ключи сокращаются и в них
+_NESTED_OBJECTS = {"cell_data"}
+_NESTED_LISTS = {"cells", "changes"}
+# Где встречаются id пользователей: значение, элементы списка, значения или ключи словаря
+_USER_VALUE = {"user_id"}
+_USER_LIST = {"active_users"}
+_USER_DICT_VALUES = {"locked_cells"}
+_USER_DICT_KEYS = {"cursors", "user_cursors"}
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def _user(user_id: Any) -> Any:
+    # id пользователей - строки с id из БД; целое в MessagePack занимает 1-5 байт
+    if isinstance(user_id, str) and user_id.isdigit():
+        return int(user_id)
+    return user_id
+
+
+def _timestamp_ms(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return int(datetime.fromisoformat(value).timestamp() * 1000)
+        except ValueError:
+            return value
+    return value
+
+
+def _compact_fields(fields: dict) -> dict:
+    compact = {}
+    for key, value in fields.items():
+        if key in _NESTED_OBJECTS and isinstance(value, dict):
+            value = _compact_fields(value)
+        elif key in _NESTED_LISTS and isinstance(value, list):
+            value = [_compact_fields(item) if isinstance(item, dict) else item for item in value]
+        elif key in _USER_VALUE:
+            value = _user(value)
+        elif key in _USER_LIST and isinstance(value, list):
+            value = [_user(item) for item in value]
+        elif key in _USER_DICT_VALUES and isinstance(value, dict):
+            value = {item_key: _user(item) for item_key, item in value.items()}
+        elif key in _USER_DICT_KEYS and isinstance(value, dict):
+            value = {_user(item_key): item for item_key, item in value.items()}
+        elif key == "timestamp":
+            value = _timestamp_ms(value)
+        compact[FIELD_KEYS.get(key, key)] = value
+    return compact
+
+
+def _expand_fields(fields: dict) -> dict:
+    expanded = {}
+    for key, value in fields.items():
+        name = FIELD_NAMES.get(key, key)
+        if name in _NESTED_OBJECTS and isinstance(value, dict):
+            value = _expand_fields(value)
+        elif name in _NESTED_LISTS and isinstance(value, list):
+            value = [_expand_fields(item) if isinstance(item, dict) else item for item in value]
+        expanded[name] = value
+    return expanded
+
+
+class JsonCodec:
+    """Текстовые кадры, одно сообщение на кадр: совместимо со старыми клиентами"""
+    name = "json"
+    binary = False
+
+    def __init__(self, subprotocol: Optional[str] = None):
+        self.subprotocol = subprotocol
+
+    def encode(self, message: dict) -> str:
+        # Как send_json в starlette, но без пробелов
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+    def decode(self, data: Union[str, bytes]) -> List[dict]:
+        parsed = json.loads(data)
+        return parsed if isinstance(parsed, list) else [parsed]
+
+
+class MsgpackCodec:
+    """Бинарные кадры MessagePack с пачками событий"""
+    name = "msgpack"
+    subprotocol = SUBPROTOCOL_MSGPACK
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        fields = dict(message)
+        code = MESSAGE_CODES.get(fields.get("type"), 0)
+        if code:
+            del fields["type"]
+        return msgpack.packb([code, _compact_fields(fields)], use_bin_type=True)
+
+    @staticmethod
+    def frame(events: List[bytes]) -> bytes:
+        """Кадр из уже закодированных событий: заголовок массива MessagePack и события подряд, без перекодирования"""
+        count = len(events)
+        if count < 16:
+            header = bytes((0x90 | count,))
+        elif count < 0x10000:
+            header = b"\xdc" + count.to_bytes(2, "big")
+        else:
+            header = b"\xdd" + count.to_bytes(4, "big")
+        return header + b"".join(events)
+
+    def decode(self, data: Union[str, bytes]) -> List[dict]:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        parsed = msgpack.unpackb(data, raw=False, strict_map_key=False)
+        events = [parsed] if parsed and isinstance(parsed[0], int) else parsed
+        return [self._decode_event(event) for event in events]
+
+    @staticmethod
+    def _decode_event(event: list) -> dict:
+        code, fields = event
+        message = _expand_fields(fields or {})
+        if code:
+            message["type"] = MESSAGE_TYPES.get(code, code)
+        return message
+
+
+JSON_CODEC = JsonCodec()
+JSON_SUBPROTOCOL_CODEC = JsonCodec(SUBPROTOCOL_JSON)
+MSGPACK_CODEC = MsgpackCodec()
+
+
+def select_codec(requested_subprotocols: List[str]):
+    """Протокол соединения по подпротоколам, предложенным клиентом; без совпадений - JSON"""
+    if SUBPROTOCOL_MSGPACK in requested_subprotocols and msgpack_available():
+        return MSGPACK_CODEC
+    if SUBPROTOCOL_JSON in requested_subprotocols:
+        return JSON_SUBPROTOCOL_CODEC
+    return JSON_CODEC
+
+
+class OutboundMessage:
+    """Исходящее сообщение: кодируется не больше одного раза для каждого протокола, сколько бы ни было получателей"""
+    __slots__ = ("_message", "_encoded")
+
+    def __init__(self, message: Optional[dict] = None, json_text: Optional[str] = None):
+        self._message = message
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+        if json_text is not None:
+            self._encoded[JsonCodec.name] = json_text
+
+    @property
+    def message(self) -> dict:
+        if self._message is None:
+            self._message = json.loads(self._encoded[JsonCodec.name])
+        return self._message
+
+    def encode(self, codec) -> Union[str, bytes]:
+        encoded = self._encoded.get(codec.name)
+        if encoded is None:
+            encoded = self._encoded[codec.name] = codec.encode(self.message)
+        return encoded
+
+    @property
+    def json(self) -> str:
+        return self.encode(JSON_CODEC)
@@ -0,0 +1,223 @@
+# app/websockets/pubsub.py
+import asyncio
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import logging
+
+from sqlalchemy.engine import make_url
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BACKEND_MEMORY = 'memory'
+BACKEND_POSTGRES = 'postgres'
+
+# NOTIFY принимает не больше 8000 байт; длинные сообщения режем на кадры по символам (до 4 байт на символ в UTF-8)
+NOTIFY_MAX_BYTES = 7900
+NOTIFY_FRAME_CHARS = 1900
+# Недособранные сообщения (узел упал посреди отправки) забываются, когда их больше этого числа
+MAX_PENDING_FRAMES = 1000
+
+Handler = Callable[[str], None]
+
+
+class PubSubBackend(ABC):
+    """Транспорт каналов таблиц между воркерами: publish отдает строку всем подписчикам канала, включая свой узел"""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def subscribe(self, channel: str, handler: Handler):
+        ...
+
+    @abstractmethod
+    async def unsubscribe(self, channel: str, handler: Handler):
+        ...
+
+    @abstractmethod
+    async def publish(self, channel: str, payload: str):
+        ...
+
+
+class InMemoryPubSub(PubSubBackend):
+    """В пределах одного процесса: один воркер и тесты (несколько менеджеров на одном экземпляре - как несколько узлов)"""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self._handlers[channel].append(handler)
+
+    async def unsubscribe(self, channel: str, handler: Handler):
+        handlers = self._handlers.get(channel, [])
+        if handler in handlers:
+            handlers.remove(handler)
+        if not handlers:
+            self._handlers.pop(channel, None)
+
+    async def publish(self, channel: str, payload: str):
+        # Доставка после возврата, как у настоящего транспорта: издатель не выполняет чужие обработчики
+        loop = asyncio.get_running_loop()
+        for handler in list(self._handlers.get(channel, [])):
+            loop.call_soon(handler, payload)
+
+
+class PostgresPubSub(PubSubBackend):
+    """
+    LISTEN/NOTIFY в той же Postgres, что и данные: новых сервисов не нужно.
+    Одно соединение слушает каналы, второе публикует; при обрыве слушатель переподключается и заново подписывается
+    """
+
+    def __init__(self, dsn: str, reconnect_delay: float = 1.0, poll_timeout: float = 0.5):
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self.poll_timeout = poll_timeout
+        # pid серверного процесса слушателя: пока он жив, узел считается живым (см. PostgresLockStore)
+        self.backend_pid: Optional[int] = None
+        self.on_reconnect: List[Callable[[], None]] = []
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self._listened: Set[str] = set()
+        self._listen_conn = None
+        self._publish_conn = None
+        self._publish_lock = asyncio.Lock()
+        self._listener: Optional[asyncio.Task] = None
+        self._frames: Dict[str, Tuple[int, Dict[int, str]]] = {}
+
+    async def start(self):
+        await self._connect_listener()
+        self._listener = asyncio.create_task(self._listen_loop())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        for conn in (self._listen_conn, self._publish_conn):
+            if conn is not None:
+                await conn.close()
+        self._listen_conn = self._publish_conn = None
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self._handlers[channel].append(handler)
+        if channel not in self._listened:
+            self._listened.add(channel)
+            await self._execute_listen("LISTEN", channel)
+
+    async def unsubscribe(self, channel: str, handler: Handler):
+        handlers = self._handlers.get(channel, [])
+        if handler in handlers:
+            handlers.remove(handler)
+        if not handlers and channel in self._listened:
+            self._handlers.pop(channel, None)
+            self._listened.discard(channel)
+            await self._execute_listen("UNLISTEN", channel)
+
+    async def publish(self, channel: str, payload: str):
+        frames = self._split(payload)
+        async with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publish_conn is None or self._publish_conn.closed:
+                        self._publish_conn = await self._connect()
+                    for frame in frames:
+                        await self._publish_conn.execute("SELECT pg_notify(%s, %s)", (channel, frame))
+                    return
+                except Exception as e:
+                    # Одна повторная попытка на новом соединении, дальше ошибка уходит вызывающему
+                    self._publish_conn = None
+                    if attempt:
+                        raise
+                    logger.warning(f"Publish to {channel} failed, reconnecting: {e}")
+
+    async def _connect(self):
+        import psycopg
+        return await psycopg.AsyncConnection.connect(self.dsn, autocommit=True)
+
+    async def _connect_listener(self):
+        self._listen_conn = await self._connect()
+        self.backend_pid = self._listen_conn.info.backend_pid
+        for channel in self._listened:
+            await self._listen_conn.execute(self._listen_sql("LISTEN", channel))
+
+    @staticmethod
+    def _listen_sql(command: str, channel: str):
+        from psycopg import sql
+        return sql.SQL(command + " {}").format(sql.Identifier(channel))
+
+    async def _execute_listen(self, command: str, channel: str):
+        # Соединение занято ожиданием уведомлений не дольше poll_timeout, после чего команда выполнится
+        try:
+            if self._listen_conn is not None and not self._listen_conn.closed:
+                await self._listen_conn.execute(self._listen_sql(command, channel))
+        except Exception as e:
+            # Цикл слушателя переподключится и повторит LISTEN по _listened
+            logger.warning(f"{command} {channel} failed: {e}")
+
+    async def _listen_loop(self):
+        while True:
+            try:
+                if self._listen_conn is None or self._listen_conn.closed:
+                    await self._connect_listener()
+                    for callback in self.on_reconnect:
+                        callback()
+                async for notify in self._listen_conn.notifies(timeout=self.poll_timeout):
+                    self._dispatch(notify.channel, notify.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Pub/sub listener error: {e}")
+                self._listen_conn = None
+                await asyncio.sleep(self.reconnect_delay)
+
+    def _dispatch(self, channel: str, frame: str):
+        payload = self._join(frame)
+        if payload is None:
+            return
+        for handler in list(self._handlers.get(channel, [])):
+            try:
+                handler(payload)
+            except Exception as e:
+                logger.error(f"Pub/sub handler error on {channel}: {e}")
+
+    # Кадры: "=" + сообщение целиком или "#id:номер:всего:" + часть
+
+    @staticmethod
+    def _split(payload: str) -> List[str]:
+        if len(payload.encode("utf-8")) <= NOTIFY_MAX_BYTES:
+            return ["=" + payload]
+        message_id = uuid.uuid4().hex
+        parts = [payload[i:i + NOTIFY_FRAME_CHARS] for i in range(0, len(payload), NOTIFY_FRAME_CHARS)]
+        return [f"#{message_id}:{index}:{len(parts)}:{part}" for index, part in enumerate(parts)]
+
+    def _join(self, frame: str) -> Optional[str]:
+        if frame.startswith("="):
+            return frame[1:]
+        message_id, index, total, part = frame[1:].split(":", 3)
+        if message_id not in self._frames and len(self._frames) >= MAX_PENDING_FRAMES:
+            self._frames.clear()
+        _, parts = self._frames.setdefault(message_id, (int(total), {}))
+        parts[int(index)] = part
+        if len(parts) < int(total):
+            return None
+        del self._frames[message_id]
+        return "".join(parts[i] for i in range(int(total)))
+
+
+def postgres_dsn(database_url: str = settings.DATABASE_URL) -> str:
+    """DSN для psycopg из URL SQLAlchemy (postgresql+psycopg2://... -> postgresql://...)"""
+    return make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def create_pubsub(backend: Optional[str] = None) -> PubSubBackend:
+    backend = backend or settings.WS_PUBSUB_BACKEND
+    if backend == BACKEND_POSTGRES:
+        return PostgresPubSub(postgres_dsn())
+    if backend == BACKEND_MEMORY:
+        return InMemoryPubSub()
+    raise ValueError(f"Неизвестный WS_PUBSUB_BACKEND: {backend}")
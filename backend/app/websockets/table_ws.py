@@ -1,49 +1,124 @@
 # app/websockets/table_ws.py
-from fastapi import WebSocket, WebSocketDisconnect
-from websockets.connection_manager import table_sync_manager
+from typing import Optional
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+from .connection_manager import table_sync_manager
+from .lock_store import lock_target
+from .protocol import select_codec
+from ..core.config import settings
+from ..database import SessionLocal
+from ..services.table_service import TableChangeService
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def handle_table_websocket(websocket: WebSocket, table_id: str, user_id: str):
+async def handle_table_websocket(
+    websocket: WebSocket, table_id: str, user_id: str, can_edit_rows: bool = False, since_version: Optional[int] = None
+):
     """
-    Обработчик WebSocket для конкретной таблицы
+    Обработчик WebSocket для конкретной таблицы.
+    can_edit_rows - право edit_rows: без него правки с адресом записи (record_id) отклоняются.
+    since_version - версия, которую клиент видел до переподключения: сразу после table_state придут изменения с нее.
+    Протокол (JSON или msgpack) выбирается по подпротоколам клиента; в одном кадре может прийти несколько событий
     """
-    await table_sync_manager.connect_to_table(websocket, user_id, table_id)
-    
+    codec = select_codec(websocket.scope.get("subprotocols", []))
+    # Каждая вкладка - отдельное соединение: закрытие одной не отключает остальные
+    connection_id = await table_sync_manager.connect_to_table(websocket, user_id, table_id, codec)
+
     try:
+        if since_version is not None:
+            await _resync(table_id, connection_id, since_version)
         while True:
             # Ждём сообщения от клиента
-            data = await websocket.receive_json()
-            
-            # 🎯 Обрабатываем ТОЛЬКО сообщения связанные с таблицами
-            if data["type"] == "cell_update":
-                await table_sync_manager.sync_cell_update(
-                    table_id, user_id, data["cell_data"]
-                )
-                
-            elif data["type"] == "cell_lock":
-                success = await table_sync_manager.sync_cell_lock(
-                    table_id, user_id, data["cell"], data["lock"]
-                )
-                # Отправляем результат блокировки
-                await websocket.send_json({
-                    "type": "cell_lock_result",
-                    "success": success,
-                    "cell": data["cell"]
-                })
-                
-            elif data["type"] == "cursor_move":
-                await table_sync_manager.sync_cursor_move(
-                    table_id, user_id, data["cursor_data"]
-                )
-                
-            elif data["type"] == "ping":
-                await websocket.send_json({"type": "pong"})
-                
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            data = frame.get("bytes")
+            for event in codec.decode(data if data is not None else frame.get("text")):
+                await _handle_event(table_id, connection_id, event, can_edit_rows)
+
     except WebSocketDisconnect:
-        table_sync_manager.disconnect(user_id)
+        table_sync_manager.disconnect(connection_id)
         logger.info(f"User {user_id} disconnected from table {table_id}")
     except Exception as e:
         logger.error(f"Table WS error for user {user_id}: {e}")
-        table_sync_manager.disconnect(user_id)
\ No newline at end of file
+        table_sync_manager.disconnect(connection_id)
+
+async def _handle_event(table_id: str, connection_id: str, data: dict, can_edit_rows: bool):
+    # 🎯 Обрабатываем ТОЛЬКО сообщения связанные с таблицами
+    if data["type"] == "cell_update":
+        await table_sync_manager.sync_cell_update(
+            table_id, connection_id, data["cell_data"], can_edit_rows
+        )
+
+    elif data["type"] == "cell_lock":
+        # range: row/column - блокировка строки record_id или колонки column целиком
+        cell, record_id, column, lock_range = data.get("cell"), data.get("record_id"), data.get("column"), data.get("range")
+        success = await table_sync_manager.sync_cell_lock(
+            table_id, connection_id, cell, data["lock"], record_id, column, lock_range
+        )
+        # Отправляем результат блокировки
+        await table_sync_manager.send_to_connection(connection_id, {
+            "type": "cell_lock_result",
+            "success": success,
+            "cell": lock_target(cell, record_id, column, lock_range)[0]
+        })
+
+    elif data["type"] == "cursor_move":
+        await table_sync_manager.sync_cursor_move(
+            table_id, connection_id, data["cursor_data"]
+        )
+
+    elif data["type"] == "resync":
+        # Клиент заметил пропуск версий в table_changed
+        await _resync(table_id, connection_id, data.get("since_version"))
+
+    elif data["type"] == "ping":
+        # ping продлевает блокировки пользователя
+        await table_sync_manager.renew_leases(table_id, connection_id)
+        await table_sync_manager.send_to_connection(connection_id, {"type": "pong"})
+
+async def _resync(table_id: str, connection_id: str, since_version):
+    """
+    Догон клиента: записи, измененные после since_version (удаленные - надгробиями), или снимок таблицы,
+    если журнал не покрывает версию. Ответ - table_resync частями по WS_CHANGE_FEED_MAX_RECORDS записей, последняя с done
+    """
+    if not isinstance(since_version, int) or isinstance(since_version, bool) or since_version < 0:
+        await table_sync_manager.send_to_connection(connection_id, {
+            "type": "resync_error",
+            "table_id": table_id,
+            "message": "since_version должен быть неотрицательным целым числом"
+        })
+        return
+    try:
+        result = await run_in_threadpool(_load_changes, int(table_id), since_version)
+    except HTTPException as e:
+        await table_sync_manager.send_to_connection(connection_id, {
+            "type": "resync_error",
+            "table_id": table_id,
+            "message": e.detail
+        })
+        return
+
+    payload = result.model_dump(mode="json")
+    changes = payload["changes"]
+    size = max(settings.WS_CHANGE_FEED_MAX_RECORDS, 1)
+    chunks = [changes[start:start + size] for start in range(0, len(changes), size)] or [[]]
+    for index, chunk in enumerate(chunks):
+        await table_sync_manager.send_to_connection_paced(connection_id, {
+            "type": "table_resync",
+            "table_id": table_id,
+            "since_version": payload["since_version"],
+            "version": payload["version"],
+            "snapshot": payload["snapshot"],
+            "columns": payload["columns"] if index == 0 else None,
+            "changes": chunk,
+            "done": index == len(chunks) - 1
+        })
+
+def _load_changes(table_id: int, since_version: int):
+    db = SessionLocal()
+    try:
+        return TableChangeService(db).get_changes(table_id, since_version)
+    finally:
+        db.close()
@@ -0,0 +1,58 @@
+# app/websockets/timer_wheel.py
+import math
+from typing import Dict, Hashable, List, Optional, Set
+
+
+class TimerWheel:
+    """
+    Хешированное колесо таймеров: постановка, перенос и отмена - O(1), за такт разбирается только одна ячейка.
+    Перенос не ищет старую запись: она остается в своей ячейке и пропускается, потому что срок ключа уже другой.
+    Сроки дальше одного оборота колеса ждут в ячейке нужное число оборотов
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, now: float = 0.0):
+        self.tick = tick
+        self.slots: List[Set[Hashable]] = [set() for _ in range(slots)]
+        self._deadlines: Dict[Hashable, float] = {}
+        self._current_tick = math.floor(now / tick)
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._deadlines
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        return self._deadlines.get(key)
+
+    def schedule(self, key: Hashable, deadline: float):
+        """Поставить или перенести срок ключа"""
+        self._deadlines[key] = deadline
+        # Срок в уже разобранном такте сработает на ближайшем
+        slot_tick = max(math.ceil(deadline / self.tick), self._current_tick + 1)
+        self.slots[slot_tick % len(self.slots)].add(key)
+
+    def cancel(self, key: Hashable):
+        self._deadlines.pop(key, None)
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Провернуть колесо до now; ключи с истекшим сроком снимаются и возвращаются"""
+        expired = []
+        target_tick = math.floor(now / self.tick)
+        # Больше оборота за раз разбирать незачем: каждая ячейка будет просмотрена один раз
+        first_tick = max(self._current_tick + 1, target_tick - len(self.slots) + 1)
+        for tick in range(first_tick, target_tick + 1):
+            slot = self.slots[tick % len(self.slots)]
+            for key in list(slot):
+                deadline = self._deadlines.get(key)
+                if deadline is None:
+                    slot.discard(key)
+                elif deadline <= now:
+                    slot.discard(key)
+                    del self._deadlines[key]
+                    expired.append(key)
+                elif math.ceil(deadline / self.tick) % len(self.slots) != tick % len(self.slots):
+                    # Ключ перенесен в другую ячейку: здесь осталась устаревшая запись
+                    slot.discard(key)
+        self._current_tick = max(self._current_tick, target_tick)
+        return expired
@@ -0,0 +1,3 @@
+# benchmarks/__init__.py
+# Нагрузочные прогоны API: python -m benchmarks.http_bench --help
+# Нагрузка на WebSocket-синхронизацию таблиц: python -m benchmarks.ws_bench --help
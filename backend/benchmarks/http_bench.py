@@ -0,0 +1,340 @@
+# benchmarks/http_bench.py
+"""
+HTTP-бенчмарк для эндпоинтов аутентификации, таблиц и записей.
+
+Прогон внутри процесса через ASGI (БД берется из SQLALCHEMY_DATABASE_URL):
+    SQLALCHEMY_DATABASE_URL=sqlite:///bench.db python -m benchmarks.http_bench run --mode asgi
+
+Прогон против запущенного uvicorn (сервер должен смотреть в ту же БД, что и сидер):
+    python -m benchmarks.http_bench run --mode http --base-url http://127.0.0.1:8000
+
+Сравнение двух прогонов (код возврата 1 при регрессии):
+    python -m benchmarks.http_bench compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from .seed import SeedConfig, seed, BENCH_PREFIX, ADMIN_EMAIL, VIEWER_EMAIL, BENCH_PASSWORD, random_value
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+@dataclass
+class BenchContext:
+    admin_headers: Dict[str, str] = field(default_factory=dict)
+    viewer_headers: Dict[str, str] = field(default_factory=dict)
+    template_id: int = 0
+    columns: List[Dict[str, str]] = field(default_factory=list)
+    records: int = 0
+    bulk_rows: int = 500
+    bulk_file: bytes = b""
+
+
+ScenarioFn = Callable[[httpx.AsyncClient, BenchContext, int], Awaitable[httpx.Response]]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    values = sorted(v * 1000 for v in latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(sum(values) / len(values), 3) if values else 0.0,
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+            "max": round(values[-1], 3) if values else 0.0,
+        },
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    ctx: BenchContext,
+    fn: ScenarioFn,
+    requests: int,
+    concurrency: int,
+    warmup: int
+) -> Dict[str, Any]:
+    """Гоняет сценарий заданным числом конкурентных клиентов"""
+    for i in range(warmup):
+        await fn(client, ctx, i)
+
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        # Общий итератор раздает номера запросов между клиентами
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await fn(client, ctx, i)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+# Сценарии
+
+async def login(client, ctx, i):
+    return await client.post("/login", json={"email": ADMIN_EMAIL, "password": BENCH_PASSWORD})
+
+
+async def template_fetch(client, ctx, i):
+    return await client.get(f"/tables/{ctx.template_id}/template", headers=ctx.admin_headers)
+
+
+def records_list(skip: int, limit: int) -> ScenarioFn:
+    async def fn(client, ctx, i):
+        return await client.get(
+            f"/tables/{ctx.template_id}/records",
+            params={"skip": skip, "limit": limit},
+            headers=ctx.admin_headers
+        )
+    return fn
+
+
+async def single_write(client, ctx, i):
+    rnd = random.Random(i)
+    data = {col["name"]: random_value(rnd, col["data_type"], i) for col in ctx.columns}
+    return await client.post(
+        f"/tables/{ctx.template_id}/records",
+        json={"table_template_id": ctx.template_id, "data": data},
+        headers=ctx.admin_headers
+    )
+
+
+async def bulk_write(client, ctx, i):
+    mapping = {col["name"]: col["name"] for col in ctx.columns}
+    return await client.post(
+        f"/excel/import/{ctx.template_id}",
+        files={"file": ("bench.xlsx", ctx.bulk_file,
+                        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+        data={"mapping": json.dumps(mapping), "skip_first_rows": "0"},
+        headers=ctx.admin_headers
+    )
+
+
+async def permission_checked_read(client, ctx, i):
+    return await client.get(
+        f"/tables/{ctx.template_id}/records",
+        params={"skip": 0, "limit": 100},
+        headers=ctx.viewer_headers
+    )
+
+
+def build_bulk_file(columns: List[Dict[str, str]], rows: int) -> bytes:
+    """Генерирует xlsx для сценария массовой записи"""
+    from openpyxl import Workbook
+
+    rnd = random.Random(0)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([col["name"] for col in columns])
+    for row in range(rows):
+        sheet.append([random_value(rnd, col["data_type"], row) for col in columns])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+async def prepare_context(client: httpx.AsyncClient, records: int, bulk_rows: int) -> BenchContext:
+    """Логинится и находит таблицу, созданную сидером"""
+    ctx = BenchContext(records=records, bulk_rows=bulk_rows)
+    for email, attr in ((ADMIN_EMAIL, "admin_headers"), (VIEWER_EMAIL, "viewer_headers")):
+        response = await client.post("/login", json={"email": email, "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        setattr(ctx, attr, {"Authorization": f"Bearer {response.json()['access_token']}"})
+
+    response = await client.get("/tables/", params={"limit": 1000}, headers=ctx.admin_headers)
+    response.raise_for_status()
+    templates = [t for t in response.json() if t["name"].startswith(BENCH_PREFIX)]
+    if not templates:
+        raise RuntimeError("Таблицы бенчмарка не найдены: запустите сидер или уберите --no-seed")
+    template = min(templates, key=lambda t: t["id"])
+    ctx.template_id = template["id"]
+    ctx.columns = [
+        {"name": c["name"], "data_type": c["data_type"]}
+        for c in sorted(template["columns"], key=lambda c: c["order_index"])
+    ]
+    ctx.bulk_file = build_bulk_file(ctx.columns, bulk_rows)
+    return ctx
+
+
+def build_scenarios(ctx: BenchContext, args) -> Dict[str, Dict[str, Any]]:
+    """Набор сценариев: имя -> функция и число запросов"""
+    depths = sorted({0, ctx.records // 2, max(ctx.records - args.page_size, 0)})
+    scenarios: Dict[str, Dict[str, Any]] = {
+        "login": {"fn": login, "requests": args.requests},
+        "template_fetch": {"fn": template_fetch, "requests": args.requests},
+    }
+    for skip in depths:
+        scenarios[f"records_list_skip_{skip}"] = {
+            "fn": records_list(skip, args.page_size), "requests": args.requests
+        }
+    scenarios["permission_checked_read"] = {"fn": permission_checked_read, "requests": args.requests}
+    scenarios["single_write"] = {"fn": single_write, "requests": args.requests}
+    scenarios["bulk_write"] = {"fn": bulk_write, "requests": args.bulk_requests}
+
+    if args.only:
+        scenarios = {name: s for name, s in scenarios.items() if name in args.only}
+    return scenarios
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> Dict[str, Any]:
+    seed_config = SeedConfig(templates=args.templates, columns=args.columns, records=args.records)
+    if not args.no_seed:
+        seed(seed_config)
+
+    if args.mode == "asgi":
+        from app.main import app
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench"
+    else:
+        transport = None
+        base_url = args.base_url
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        ctx = await prepare_context(client, args.records, args.bulk_rows)
+        results: Dict[str, Any] = {}
+        for name, scenario in build_scenarios(ctx, args).items():
+            results[name] = await run_scenario(
+                client, ctx, scenario["fn"], scenario["requests"], args.concurrency, args.warmup
+            )
+            stats = results[name]
+            print(
+                f"{name:32} {stats['throughput_rps']:>10.1f} rps  "
+                f"p50={stats['latency_ms']['p50']:.1f}ms p95={stats['latency_ms']['p95']:.1f}ms "
+                f"p99={stats['latency_ms']['p99']:.1f}ms errors={stats['errors']}",
+                file=sys.stderr
+            )
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "mode": args.mode,
+            "base_url": base_url,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "page_size": args.page_size,
+            "bulk_rows": args.bulk_rows,
+            "seed": {"templates": args.templates, "columns": args.columns, "records": args.records},
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "scenarios": results,
+    }
+
+
+def compare(base: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Сравнивает два прогона: рост p95 или падение пропускной способности больше порога"""
+    regressions = []
+    for name, new in current["scenarios"].items():
+        old = base["scenarios"].get(name)
+        if not old:
+            continue
+        old_p95, new_p95 = old["latency_ms"]["p95"], new["latency_ms"]["p95"]
+        old_rps, new_rps = old["throughput_rps"], new["throughput_rps"]
+        if old_p95 and (new_p95 - old_p95) / old_p95 > threshold:
+            regressions.append(f"{name}: p95 {old_p95:.1f}ms -> {new_p95:.1f}ms")
+        if old_rps and (old_rps - new_rps) / old_rps > threshold:
+            regressions.append(f"{name}: throughput {old_rps:.1f} -> {new_rps:.1f} rps")
+        if new["errors"] > old["errors"]:
+            regressions.append(f"{name}: errors {old['errors']} -> {new['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP-бенчмарк API")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Прогнать бенчмарк")
+    run_parser.add_argument("--mode", choices=["asgi", "http"], default="asgi")
+    run_parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--requests", type=int, default=500, help="Запросов на сценарий")
+    run_parser.add_argument("--bulk-requests", type=int, default=5)
+    run_parser.add_argument("--bulk-rows", type=int, default=500)
+    run_parser.add_argument("--page-size", type=int, default=100)
+    run_parser.add_argument("--warmup", type=int, default=5)
+    run_parser.add_argument("--timeout", type=float, default=120.0)
+    run_parser.add_argument("--templates", type=int, default=SeedConfig.templates)
+    run_parser.add_argument("--columns", type=int, default=SeedConfig.columns)
+    run_parser.add_argument("--records", type=int, default=SeedConfig.records)
+    run_parser.add_argument("--no-seed", action="store_true", help="Использовать уже наполненную БД")
+    run_parser.add_argument("--only", nargs="*", help="Запустить только указанные сценарии")
+    run_parser.add_argument("--output", type=Path, help="Файл для JSON с результатами")
+    run_parser.add_argument("--baseline", type=Path, help="Сравнить с предыдущим прогоном")
+    run_parser.add_argument("--threshold", type=float, default=0.15)
+
+    compare_parser = sub.add_parser("compare", help="Сравнить два прогона")
+    compare_parser.add_argument("base", type=Path)
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=0.15)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        base = json.loads(args.base.read_text(encoding="utf-8"))
+        current = json.loads(args.current.read_text(encoding="utf-8"))
+    else:
+        current = asyncio.run(run(args))
+        output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{current['meta']['commit'] or 'nocommit'}.json"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Результаты сохранены в {output}", file=sys.stderr)
+        if not args.baseline:
+            return
+        base = json.loads(args.baseline.read_text(encoding="utf-8"))
+
+    regressions = compare(base, current, args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# benchmarks/seed.py
+"""
+Наполнение локальной БД тестовыми данными для бенчмарков.
+
+Пример:
+    SQLALCHEMY_DATABASE_URL=sqlite:///bench.db python -m benchmarks.seed --templates 3 --columns 12 --records 20000
+"""
+import argparse
+import json
+import random
+import string
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Any
+
+from sqlalchemy import insert, delete, select
+
+from app.database import SessionLocal, init_db
+from app.models import TableTemplate, TableColumn, TableRecord, User, Department
+from app.models.Roles import UserTablePermission
+from app.utils import get_password_hash
+
+BENCH_PREFIX = "bench_"
+BENCH_DEPARTMENT = "Бенчмарк"
+ADMIN_EMAIL = "bench-admin@example.com"
+VIEWER_EMAIL = "bench-viewer@example.com"
+BENCH_PASSWORD = "bench-password"
+
+# Типы колонок по кругу, чтобы в каждой таблице были все типы данных
+COLUMN_TYPES = ["text", "number", "date", "boolean", "datetime", "select"]
+
+
+@dataclass
+class SeedConfig:
+    templates: int = 2
+    columns: int = 10
+    records: int = 10000
+    batch_size: int = 5000
+    random_seed: int = 42
+
+
+@dataclass
+class SeedResult:
+    config: SeedConfig
+    admin: Dict[str, str]
+    viewer: Dict[str, str]
+    template_ids: List[int] = field(default_factory=list)
+    columns: Dict[int, List[Dict[str, str]]] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def random_value(rnd: random.Random, data_type: str, row: int) -> Any:
+    """Значение ячейки в том виде, в каком его сохраняет импорт"""
+    if data_type == "number":
+        return round(rnd.uniform(0, 100000), 2)
+    if data_type == "boolean":
+        return rnd.random() < 0.5
+    if data_type == "date":
+        return (datetime(2020, 1, 1) + timedelta(days=rnd.randint(0, 2000))).strftime("%Y-%m-%d")
+    if data_type == "datetime":
+        return (datetime(2020, 1, 1) + timedelta(seconds=rnd.randint(0, 10 ** 8))).isoformat()
+    if data_type == "select":
+        return rnd.choice(["новый", "в работе", "готово", "архив"])
+    return f"{row}-" + "".join(rnd.choices(string.ascii_letters, k=12))
+
+
+def _get_or_create_user(db, email: str, role: str, department_id: int) -> User:
+    user = db.execute(select(User).where(User.email == email)).scalar_one_or_none()
+    if user is None:
+        user = User(
+            email=email,
+            password=get_password_hash(BENCH_PASSWORD),
+            lastname="Бенчмарк",
+            firstname=role,
+            middlename="",
+            role=role,
+            department_id=department_id,
+        )
+        db.add(user)
+        db.flush()
+    return user
+
+
+def clear_bench_data(db) -> None:
+    """Удаляет таблицы, созданные предыдущими прогонами"""
+    template_ids = db.execute(
+        select(TableTemplate.id).where(TableTemplate.name.like(f"{BENCH_PREFIX}%"))
+    ).scalars().all()
+    if not template_ids:
+        return
+    db.execute(delete(TableRecord).where(TableRecord.table_template_id.in_(template_ids)))
+    db.execute(delete(TableColumn).where(TableColumn.table_template_id.in_(template_ids)))
+    db.execute(delete(UserTablePermission).where(UserTablePermission.table_template_id.in_(template_ids)))
+    db.execute(delete(TableTemplate).where(TableTemplate.id.in_(template_ids)))
+    db.commit()
+
+
+def seed(config: SeedConfig) -> SeedResult:
+    """Создает пользователей, шаблоны, колонки и записи пачками"""
+    init_db()
+    rnd = random.Random(config.random_seed)
+    db = SessionLocal()
+    try:
+        clear_bench_data(db)
+
+        department = db.execute(
+            select(Department).where(Department.title == BENCH_DEPARTMENT)
+        ).scalar_one_or_none()
+        if department is None:
+            department = Department(title=BENCH_DEPARTMENT)
+            db.add(department)
+            db.flush()
+
+        admin = _get_or_create_user(db, ADMIN_EMAIL, "admin", department.id)
+        viewer = _get_or_create_user(db, VIEWER_EMAIL, "employee", department.id)
+
+        result = SeedResult(
+            config=config,
+            admin={"email": ADMIN_EMAIL, "password": BENCH_PASSWORD},
+            viewer={"email": VIEWER_EMAIL, "password": BENCH_PASSWORD},
+        )
+
+        for t in range(config.templates):
+            template = TableTemplate(name=f"{BENCH_PREFIX}{t}")
+            db.add(template)
+            db.flush()
+
+            columns = [
+                {"name": f"col_{c}", "data_type": COLUMN_TYPES[c % len(COLUMN_TYPES)]}
+                for c in range(config.columns)
+            ]
+            db.execute(insert(TableColumn), [
+                {"table_template_id": template.id, "order_index": i, "config": {}, **col}
+                for i, col in enumerate(columns)
+            ])
+
+            # Права только на чтение, чтобы проверять путь с проверкой разрешений
+            db.add(UserTablePermission(
+                user_id=viewer.id,
+                table_template_id=template.id,
+                can_view=True,
+            ))
+
+            for start in range(0, config.records, config.batch_size):
+                stop = min(start + config.batch_size, config.records)
+                db.execute(insert(TableRecord), [
+                    {
+                        "table_template_id": template.id,
+                        "data": {col["name"]: random_value(rnd, col["data_type"], row) for col in columns},
+                    }
+                    for row in range(start, stop)
+                ])
+
+            result.template_ids.append(template.id)
+            result.columns[template.id] = columns
+
+        db.commit()
+        return result
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Наполнение БД данными для бенчмарков")
+    parser.add_argument("--templates", type=int, default=SeedConfig.templates)
+    parser.add_argument("--columns", type=int, default=SeedConfig.columns)
+    parser.add_argument("--records", type=int, default=SeedConfig.records, help="Записей на одну таблицу")
+    parser.add_argument("--batch-size", type=int, default=SeedConfig.batch_size)
+    parser.add_argument("--random-seed", type=int, default=SeedConfig.random_seed)
+    args = parser.parse_args()
+
+    result = seed(SeedConfig(
+        templates=args.templates,
+        columns=args.columns,
+        records=args.records,
+        batch_size=args.batch_size,
+        random_seed=args.random_seed,
+    ))
+    print(json.dumps(result.to_dict(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
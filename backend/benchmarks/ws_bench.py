@@ -0,0 +1,886 @@
+# benchmarks/ws_bench.py
+"""
+Нагрузочный прогон синхронизации таблиц по WebSocket: тысячи редакторов на нескольких таблицах.
+
+Каждый клиент - отдельный пользователь с правом редактирования, подключенный к одной из таблиц. Клиенты шлют смесь
+cursor_move, cell_update, cell_lock и ping с заданной частотой (пуассоновский поток), а принимающие стороны меряют
+задержку рассылки от отправки до получения. Потерянные сообщения считаются по надежным рассылкам (cell_updated,
+cell_locked, cell_unlocked): каждую принятую сервером операцию должны получить все соединения таблицы.
+Курсоры сервер имеет право выбрасывать и склеивать, для них считается только задержка.
+
+Сервер внутри процесса (uvicorn на том же цикле событий, CPU и память общие с генератором нагрузки):
+    SQLALCHEMY_DATABASE_URL=sqlite:///bench.db python -m benchmarks.ws_bench run --clients 500 --tables 5
+
+Отдельный процесс uvicorn, CPU и RSS сервера снимаются из /proc:
+    SQLALCHEMY_DATABASE_URL=sqlite:///bench.db python -m benchmarks.ws_bench run --mode spawn --clients 2000 --protocol msgpack
+
+Уже запущенный сервер (та же БД и тот же SECRET_KEY: токены редакторов выпускаются локально):
+    python -m benchmarks.ws_bench run --mode external --base-url http://127.0.0.1:8000 --server-pid 12345
+
+Сравнение двух прогонов (код возврата 1 при регрессии):
+    python -m benchmarks.ws_bench compare benchmarks/results/ws-old.json benchmarks/results/ws-new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from app.database import SessionLocal
+from app.models import Department, TableColumn, TableRecord, TableTemplate, User
+from app.models.Roles import UserTablePermission
+from app.utils import create_access_token, get_password_hash
+from app.websockets.protocol import JSON_CODEC, MSGPACK_CODEC, SUBPROTOCOL_JSON, SUBPROTOCOL_MSGPACK
+
+from .http_bench import git_commit, percentile
+from .seed import BENCH_DEPARTMENT, BENCH_PASSWORD, BENCH_PREFIX, SeedConfig, seed
+
+RESULTS_DIR = Path(__file__).parent / "results"
+BACKEND_DIR = Path(__file__).parent.parent
+EDITOR_EMAIL = "bench-editor-{}@example.com"
+
+MESSAGE_KINDS = ("cursor_move", "cell_update", "cell_lock", "ping")
+DEFAULT_MIX = "cursor_move=70,cell_update=20,cell_lock=5,ping=5"
+# Рассылки, которые сервер обязан доставить каждому соединению таблицы
+RELIABLE_TYPES = ("cell_updated", "cell_locked", "cell_unlocked")
+
+
+class LatencyRecorder:
+    """Задержки одного вида: точные счетчик, среднее и максимум, перцентили - по равномерной выборке (reservoir)"""
+
+    def __init__(self, capacity: int = 200_000, rnd: Optional[random.Random] = None):
+        self.capacity = capacity
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.sample: List[float] = []
+        self._rnd = rnd or random.Random(0)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if len(self.sample) < self.capacity:
+            self.sample.append(seconds)
+        else:
+            slot = self._rnd.randrange(self.count)
+            if slot < self.capacity:
+                self.sample[slot] = seconds
+
+    def summary(self) -> Dict[str, Any]:
+        values = sorted(v * 1000 for v in self.sample)
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+            "max": round(self.max * 1000, 3),
+        }
+
+
+class ProcessSampler:
+    """
+    CPU (% одного ядра) и RSS процесса вместе с потомками (воркеры uvicorn) по /proc.
+    Без /proc (не Linux) снимается только текущий процесс через resource, RSS - пиковый
+    """
+
+    def __init__(self, pid: int, interval: float):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_percent: List[float] = []
+        self.rss_mb: List[float] = []
+        self._clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self._procfs = Path(f"/proc/{pid}/stat").exists()
+
+    def _tree(self) -> List[int]:
+        pids, stack = [], [self.pid]
+        while stack:
+            pid = stack.pop()
+            pids.append(pid)
+            for children in Path(f"/proc/{pid}/task").glob("*/children"):
+                try:
+                    stack.extend(int(child) for child in children.read_text().split())
+                except OSError:
+                    pass
+        return pids
+
+    def read(self) -> Tuple[float, float]:
+        """(CPU-секунды с запуска, RSS в МБ)"""
+        if not self._procfs:
+            import resource
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            scale = 1 if sys.platform == "darwin" else 1024
+            return usage.ru_utime + usage.ru_stime, usage.ru_maxrss * scale / 2 ** 20
+        cpu, rss = 0.0, 0.0
+        for pid in self._tree():
+            try:
+                stat = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+                status = Path(f"/proc/{pid}/status").read_text()
+            except OSError:
+                continue  # процесс завершился между обходом и чтением
+            cpu += (int(stat[11]) + int(stat[12])) / self._clock_ticks
+            for line in status.splitlines():
+                if line.startswith("VmRSS:"):
+                    rss += int(line.split()[1]) / 1024
+                    break
+        return cpu, rss
+
+    async def run(self):
+        previous_cpu, _ = self.read()
+        previous_at = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.interval)
+            cpu, rss = self.read()
+            now = time.perf_counter()
+            self.cpu_percent.append((cpu - previous_cpu) / (now - previous_at) * 100)
+            self.rss_mb.append(rss)
+            previous_cpu, previous_at = cpu, now
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.cpu_percent:
+            return {"pid": self.pid, "samples": 0}
+        return {
+            "pid": self.pid,
+            "samples": len(self.cpu_percent),
+            "cpu_percent": {
+                "mean": round(sum(self.cpu_percent) / len(self.cpu_percent), 1),
+                "max": round(max(self.cpu_percent), 1),
+            },
+            "rss_mb": {
+                "start": round(self.rss_mb[0], 1),
+                "max": round(max(self.rss_mb), 1),
+                "end": round(self.rss_mb[-1], 1),
+            },
+        }
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Смесь вида "cursor_move=70,cell_update=20" -> доли видов сообщений"""
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in MESSAGE_KINDS:
+            raise ValueError(f"Неизвестный вид сообщения {name!r}, допустимы: {', '.join(MESSAGE_KINDS)}")
+        weights[name] = float(weight or 1)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Сумма весов смеси должна быть положительной")
+    return {name: weight / total for name, weight in weights.items()}
+
+
+class TableTarget:
+    """Таблица, на которой сидят клиенты: записи и колонки для правок и курсоров"""
+
+    def __init__(self, table_id: int, record_ids: List[int], columns: List[str], text_columns: List[str]):
+        self.table_id = table_id
+        self.record_ids = record_ids
+        self.columns = columns
+        # Правки пишутся в текстовые колонки: маркер отправки - строка
+        self.text_columns = text_columns or columns
+        self.clients: List["SimClient"] = []
+
+
+class BenchStats:
+    def __init__(self):
+        self.sent: Counter = Counter()
+        self.received: Counter = Counter()
+        self.bytes_received = 0
+        self.errors: Counter = Counter()
+        self.closes: Counter = Counter()
+        self.connect_errors: Counter = Counter()
+        self.latency: Dict[str, LatencyRecorder] = {
+            name: LatencyRecorder()
+            for name in ("connect", "cell_updated", "cursors_moved", "cell_locked", "cell_update_ack", "pong", "loop_lag")
+        }
+        # По таблицам: принятые сервером операции (ждем по рассылке на каждое соединение) и полученные рассылки
+        self.accepted: Dict[int, Counter] = {}
+        # Получатели учитываются отдельно: (таблица, медленный ли клиент)
+        self.delivered: Dict[Tuple[int, bool], Counter] = {}
+        # (пользователь, ячейка) -> когда отправлен запрос блокировки
+        self.lock_sent: Dict[Tuple[str, str], float] = {}
+        self.clients: List["SimClient"] = []
+        self.measuring = False
+        self.stopping = False
+
+
+class SimClient:
+    """Один редактор: соединение, поток сообщений и разбор входящих рассылок"""
+
+    def __init__(self, index: int, table: TableTarget, user_id: int, token: str, stats: BenchStats, args):
+        self.index = index
+        self.table = table
+        self.user_id = str(user_id)
+        self.token = token
+        self.stats = stats
+        self.args = args
+        self.rnd = random.Random(args.random_seed * 100_003 + index)
+        self.codec = MSGPACK_CODEC if args.protocol == "msgpack" else JSON_CODEC
+        self.ws = None
+        self.receiver: Optional[asyncio.Task] = None
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.slow = self.rnd.random() < args.slow_clients
+        # Время отправки по порядковому номеру: номер едет в сообщении и возвращается в рассылке
+        self.update_sent: List[float] = []
+        self.cursor_sent: List[float] = []
+        self.ping_sent: Deque[float] = deque()
+        # Ответы cell_lock_result приходят в порядке запросов: (блокировка или снятие, ячейка)
+        self.lock_requests: Deque[Tuple[bool, str]] = deque()
+        self.held_lock: Optional[Tuple[str, int, str]] = None
+        # Окно строк, с которыми работает редактор; окна соседей пересекаются - блокировки конфликтуют
+        rows = len(table.record_ids)
+        self.viewport_start = self.rnd.randrange(rows) if rows else 0
+
+    def url(self, base_url: str) -> str:
+        scheme = "wss" if base_url.startswith("https") else "ws"
+        host = base_url.split("://", 1)[-1].rstrip("/")
+        return f"{scheme}://{host}/ws/tables/{self.table.table_id}?token={self.token}"
+
+    async def connect(self, base_url: str):
+        subprotocols = [SUBPROTOCOL_MSGPACK] if self.args.protocol == "msgpack" else [SUBPROTOCOL_JSON]
+        started = time.perf_counter()
+        self.ws = await connect(
+            self.url(base_url),
+            subprotocols=subprotocols,
+            compression=None if self.args.no_deflate else "deflate",
+            open_timeout=self.args.connect_timeout,
+            ping_interval=None,
+            max_size=None,
+        )
+        self.receiver = asyncio.create_task(self.receive_loop())
+        # Подключение готово, когда пришло состояние таблицы
+        await asyncio.wait_for(self.ready.wait(), self.args.connect_timeout)
+        self.stats.latency["connect"].add(time.perf_counter() - started)
+
+    def _cell(self) -> Tuple[str, int, str]:
+        records = self.table.record_ids
+        row = (self.viewport_start + self.rnd.randrange(self.args.viewport)) % len(records)
+        column = self.rnd.choice(self.table.text_columns)
+        return f"{records[row]}:{column}", records[row], column
+
+    async def send(self, message: dict):
+        await self.ws.send(self.codec.encode(message))
+        self.stats.sent[message["type"]] += 1
+
+    async def send_loop(self, kinds: List[str], weights: List[float], deadline: float):
+        rate = self.args.rate
+        # Клиенты стартуют вразнобой, а не одним залпом
+        await asyncio.sleep(self.rnd.uniform(0, 1 / rate))
+        while not self.closed and time.perf_counter() < deadline:
+            kind = self.rnd.choices(kinds, weights)[0]
+            try:
+                await getattr(self, f"_send_{kind}")()
+            except ConnectionClosed:
+                break
+            await asyncio.sleep(self.rnd.expovariate(rate))
+
+    async def _send_cursor_move(self):
+        seq = len(self.cursor_sent)
+        row = (self.viewport_start + self.rnd.randrange(self.args.viewport)) % len(self.table.record_ids)
+        self.cursor_sent.append(time.perf_counter())
+        await self.send({"type": "cursor_move", "cursor_data": {
+            "row": row, "col": self.rnd.choice(self.table.columns), "c": self.index, "s": seq
+        }})
+
+    async def _send_cell_update(self):
+        seq = len(self.update_sent)
+        cell, record_id, column = self.held_lock or self._cell()
+        cell_data = {"cell": cell, "value": f"{self.index}:{seq}", "seq": seq}
+        if not self.args.no_persist:
+            cell_data.update(record_id=record_id, column=column)
+        self.update_sent.append(time.perf_counter())
+        await self.send({"type": "cell_update", "cell_data": cell_data})
+        self.stats.accepted.setdefault(self.table.table_id, Counter())["cell_updated"] += 1
+
+    async def _send_cell_lock(self):
+        # Как в редакторе: взял ячейку, поправил, отпустил
+        if self.held_lock is not None:
+            cell, record_id, column = self.held_lock
+            self.held_lock = None
+            self.lock_requests.append((False, cell))
+            await self.send({"type": "cell_lock", "cell": cell, "record_id": record_id, "column": column, "lock": False})
+            return
+        cell, record_id, column = self._cell()
+        self.lock_requests.append((True, cell))
+        self.stats.lock_sent[(self.user_id, cell)] = time.perf_counter()
+        self.held_lock = (cell, record_id, column)
+        await self.send({"type": "cell_lock", "cell": cell, "record_id": record_id, "column": column, "lock": True})
+
+    async def _send_ping(self):
+        self.ping_sent.append(time.perf_counter())
+        await self.send({"type": "ping"})
+
+    async def receive_loop(self):
+        try:
+            async for frame in self.ws:
+                now = time.perf_counter()
+                self.stats.bytes_received += len(frame)
+                for event in self.codec.decode(frame):
+                    self.handle(event, now)
+                if self.slow and not self.stats.stopping:
+                    # Медленный клиент: сервер копит очередь, выбрасывает курсоры, затем отключает
+                    await asyncio.sleep(self.args.slow_delay_ms / 1000)
+        except ConnectionClosed as e:
+            # Закрытие сервером доходит до медленного клиента поздно, уже во время остановки, или сервер обрывает
+            # соединение без кадра закрытия (1006): учитывается всегда, кроме штатного закрытия самим клиентом
+            code = e.rcvd.code if e.rcvd is not None else 1006
+            if code != 1000:
+                self.stats.closes[str(code)] += 1
+        except Exception as e:
+            self.stats.errors[f"receive:{type(e).__name__}"] += 1
+        finally:
+            self.closed = True
+            self.ready.set()
+
+    def handle(self, event: dict, now: float):
+        kind = event.get("type")
+        stats = self.stats
+        if kind == "table_state":
+            self.ready.set()
+        if not stats.measuring:
+            return
+        stats.received[kind] += 1
+        if kind in RELIABLE_TYPES:
+            stats.delivered.setdefault((self.table.table_id, self.slow), Counter())[kind] += 1
+        if self.slow:
+            # Медленный клиент сам копит отставание: его задержки - не задержки сервера, считается только доставка
+            return
+
+        if kind == "cell_updated":
+            origin, _, seq = str(event.get("value")).partition(":")
+            sent = self._sent_at("update_sent", origin, seq)
+            if sent is not None:
+                stats.latency["cell_updated"].add(now - sent)
+        elif kind == "cursors_moved":
+            for cursor in (event.get("cursors") or {}).values():
+                if isinstance(cursor, dict):
+                    sent = self._sent_at("cursor_sent", cursor.get("c"), cursor.get("s"))
+                    if sent is not None:
+                        stats.latency["cursors_moved"].add(now - sent)
+        elif kind == "cell_locked":
+            sent = stats.lock_sent.get((str(event.get("user_id")), event.get("cell")))
+            if sent is not None:
+                stats.latency["cell_locked"].add(now - sent)
+        elif kind == "cell_lock_result":
+            lock, cell = self.lock_requests.popleft() if self.lock_requests else (True, None)
+            if event.get("success"):
+                accepted = stats.accepted.setdefault(self.table.table_id, Counter())
+                accepted["cell_locked" if lock else "cell_unlocked"] += 1
+            elif lock:
+                stats.errors["lock_conflict"] += 1
+                if self.held_lock and self.held_lock[0] == cell:
+                    self.held_lock = None
+        elif kind == "cell_lock_error":
+            # Правка в чужую заблокированную ячейку не рассылается
+            stats.accepted.setdefault(self.table.table_id, Counter())["cell_updated"] -= 1
+            stats.errors["update_conflict"] += 1
+        elif kind == "cell_update_ack":
+            for cell in event.get("cells") or ():
+                seq = cell.get("seq")
+                if isinstance(seq, int) and seq < len(self.update_sent):
+                    stats.latency["cell_update_ack"].add(now - self.update_sent[seq])
+        elif kind == "pong":
+            if self.ping_sent:
+                stats.latency["pong"].add(now - self.ping_sent.popleft())
+        elif kind in ("cell_update_error", "resync_error", "error"):
+            stats.errors[kind] += 1
+
+    def _sent_at(self, attribute: str, origin: Any, seq: Any) -> Optional[float]:
+        try:
+            client = self.stats.clients[int(origin)]
+            return getattr(client, attribute)[int(seq)]
+        except (ValueError, TypeError, IndexError):
+            return None
+
+    async def close(self):
+        self.closed = True
+        if self.ws is not None:
+            try:
+                await asyncio.wait_for(self.ws.close(), 5)
+            except Exception:
+                pass
+        if self.receiver is not None:
+            try:
+                await asyncio.wait_for(self.receiver, 5)
+            except Exception:
+                pass
+
+
+def prepare_editors(table_ids: List[int], clients: int, users: int) -> Tuple[List[int], Dict[int, str]]:
+    """
+    Редакторы bench-editor-N с правами просмотра и редактирования на своих таблицах; клиент i сидит на таблице
+    i % len(table_ids) под пользователем i % users. Возвращает (id пользователя клиента, токен пользователя)
+    """
+    db = SessionLocal()
+    try:
+        department = db.execute(select(Department).where(Department.title == BENCH_DEPARTMENT)).scalar_one_or_none()
+        if department is None:
+            department = Department(title=BENCH_DEPARTMENT)
+            db.add(department)
+            db.flush()
+
+        emails = [EDITOR_EMAIL.format(i) for i in range(users)]
+        existing = dict(db.execute(select(User.email, User.id).where(User.email.in_(emails))).all())
+        missing = [email for email in emails if email not in existing]
+        if missing:
+            password = get_password_hash(BENCH_PASSWORD)
+            db.execute(insert(User), [
+                {
+                    "email": email, "password": password, "lastname": "Бенчмарк", "firstname": "editor",
+                    "middlename": "", "role": "employee", "department_id": department.id,
+                }
+                for email in missing
+            ])
+            existing = dict(db.execute(select(User.email, User.id).where(User.email.in_(emails))).all())
+        user_ids = [existing[email] for email in emails]
+
+        client_users = [user_ids[i % users] for i in range(clients)]
+        grants = {(client_users[i], table_ids[i % len(table_ids)]) for i in range(clients)}
+        db.execute(delete(UserTablePermission).where(
+            UserTablePermission.user_id.in_(user_ids), UserTablePermission.table_template_id.in_(table_ids)
+        ))
+        db.execute(insert(UserTablePermission), [
+            {"user_id": user_id, "table_template_id": table_id, "can_view": True, "can_edit_rows": True}
+            for user_id, table_id in sorted(grants)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    # Токены выпускаются локально, без /login на каждого редактора
+    tokens = {
+        user_id: create_access_token({"sub": str(user_id)}, timedelta(hours=12))
+        for user_id in set(client_users)
+    }
+    return client_users, tokens
+
+
+def load_tables(count: int) -> List[TableTarget]:
+    db = SessionLocal()
+    try:
+        table_ids = db.execute(
+            select(TableTemplate.id).where(TableTemplate.name.like(f"{BENCH_PREFIX}%")).order_by(TableTemplate.id).limit(count)
+        ).scalars().all()
+        tables = []
+        for table_id in table_ids:
+            columns = db.execute(
+                select(TableColumn.name, TableColumn.data_type)
+                .where(TableColumn.table_template_id == table_id).order_by(TableColumn.order_index)
+            ).all()
+            record_ids = db.execute(
+                select(TableRecord.id).where(TableRecord.table_template_id == table_id).order_by(TableRecord.id)
+            ).scalars().all()
+            if not record_ids or not columns:
+                continue
+            tables.append(TableTarget(
+                table_id, list(record_ids), [name for name, _ in columns],
+                [name for name, data_type in columns if data_type == "text"]
+            ))
+        return tables
+    finally:
+        db.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def raise_open_files_limit(needed: int):
+    """Каждый клиент - дескриптор (в режиме inprocess - два); мягкий лимит поднимается до жесткого"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = hard if hard == resource.RLIM_INFINITY else min(hard, max(needed, soft))
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        if target < needed:
+            print(f"Лимит открытых файлов {target} меньше нужных {needed}: часть клиентов не подключится", file=sys.stderr)
+
+
+async def wait_for_port(port: int, timeout: float, process: Optional[subprocess.Popen] = None):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Сервер завершился с кодом {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Сервер не открыл порт {port} за {timeout} с")
+
+
+async def monitor_loop_lag(recorder: LatencyRecorder, interval: float = 0.05):
+    """Запаздывание цикла событий генератора: если оно велико, задержки меряет перегруженный клиент, а не сервер"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        recorder.add(max(time.perf_counter() - started - interval, 0.0))
+
+
+async def connect_clients(clients: List[SimClient], base_url: str, concurrency: int, stats: BenchStats) -> List[SimClient]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def open_one(client: SimClient):
+        async with semaphore:
+            try:
+                await client.connect(base_url)
+            except Exception as e:
+                stats.connect_errors[type(e).__name__] += 1
+                await client.close()
+
+    await asyncio.gather(*(open_one(client) for client in clients))
+    return [client for client in clients if client.ws is not None and not client.closed]
+
+
+def delivery_report(
+    stats: BenchStats, tables: List[TableTarget], connected: Dict[Tuple[int, bool], int], slow: bool = False
+) -> Dict[str, Any]:
+    """
+    Ожидаемые рассылки = принятые сервером операции x соединения таблицы на начало замера.
+    Обычные и медленные клиенты считаются отдельно: медленный может не дочитать отставание до конца досылки
+    """
+    report = {}
+    for kind in RELIABLE_TYPES:
+        expected = sum(
+            max(stats.accepted.get(table.table_id, Counter())[kind], 0) * connected.get((table.table_id, slow), 0)
+            for table in tables
+        )
+        received = sum(stats.delivered.get((table.table_id, slow), Counter())[kind] for table in tables)
+        report[kind] = {
+            "expected": expected,
+            "received": received,
+            "lost": max(expected - received, 0),
+            "delivery_ratio": round(received / expected, 6) if expected else 1.0,
+        }
+    return report
+
+
+async def run(args) -> Dict[str, Any]:
+    mix = parse_mix(args.mix)
+    kinds, weights = list(mix), list(mix.values())
+    if not args.no_seed:
+        seed(SeedConfig(templates=args.tables, columns=args.columns, records=args.records))
+    tables = load_tables(args.tables)
+    if not tables:
+        raise SystemExit("Нет таблиц бенчмарка: запустите без --no-seed")
+
+    users = args.users or args.clients
+    client_users, tokens = prepare_editors([table.table_id for table in tables], args.clients, users)
+    raise_open_files_limit(args.clients * (2 if args.mode == "inprocess" else 1) + 256)
+
+    stats = BenchStats()
+    for index in range(args.clients):
+        table = tables[index % len(tables)]
+        client = SimClient(index, table, client_users[index], tokens[client_users[index]], stats, args)
+        table.clients.append(client)
+        stats.clients.append(client)
+
+    server = server_task = process = None
+    if args.mode == "inprocess":
+        import uvicorn
+        from app.main import app
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=port, log_level="warning", ws_per_message_deflate=not args.no_deflate,
+            backlog=max(2048, args.connect_concurrency * 2),
+        ))
+        server_task = asyncio.create_task(server.serve())
+        await wait_for_port(port, 30)
+        base_url, server_pid = f"http://127.0.0.1:{port}", os.getpid()
+    elif args.mode == "spawn":
+        port = free_port()
+        command = [
+            sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", "--ws-per-message-deflate", str(not args.no_deflate).lower(),
+            "--workers", str(args.server_workers), "--backlog", str(max(2048, args.connect_concurrency * 2)),
+        ]
+        process = subprocess.Popen(command, cwd=BACKEND_DIR)
+        await wait_for_port(port, 60, process)
+        base_url, server_pid = f"http://127.0.0.1:{port}", process.pid
+    else:
+        base_url, server_pid = args.base_url, args.server_pid
+
+    client_sampler = ProcessSampler(os.getpid(), args.sample_interval)
+    server_sampler = ProcessSampler(server_pid, args.sample_interval) if server_pid and args.mode != "inprocess" else None
+    background = [
+        asyncio.create_task(client_sampler.run()),
+        asyncio.create_task(monitor_loop_lag(stats.latency["loop_lag"])),
+    ]
+    if server_sampler is not None:
+        background.append(asyncio.create_task(server_sampler.run()))
+
+    try:
+        started = time.perf_counter()
+        connected_clients = await connect_clients(stats.clients, base_url, args.connect_concurrency, stats)
+        connect_elapsed = time.perf_counter() - started
+        connected: Dict[Tuple[int, bool], int] = Counter((client.table.table_id, client.slow) for client in connected_clients)
+        print(
+            f"Подключено {len(connected_clients)}/{args.clients} клиентов к {len(tables)} таблицам "
+            f"за {connect_elapsed:.1f} с, ошибки: {dict(stats.connect_errors) or 'нет'}",
+            file=sys.stderr
+        )
+
+        # Замер: без волны user_joined при подключении, только смесь сообщений
+        await asyncio.sleep(args.settle)
+        stats.measuring = True
+        started = time.perf_counter()
+        deadline = started + args.duration
+        # Медленные клиенты только читают: ответы на их собственные операции опаздывали бы и путали учет доставки
+        await asyncio.gather(*(
+            client.send_loop(kinds, weights, deadline) for client in connected_clients if not client.slow
+        ))
+        send_elapsed = time.perf_counter() - started
+
+        # Досылка: ждем, пока дойдут рассылки, отправленные в последние мгновения
+        drain_deadline = time.perf_counter() + args.drain
+        while time.perf_counter() < drain_deadline:
+            report = delivery_report(stats, tables, connected)
+            if all(item["lost"] == 0 for item in report.values()):
+                break
+            await asyncio.sleep(0.1)
+        elapsed = time.perf_counter() - started
+        stats.measuring = False
+        delivery = delivery_report(stats, tables, connected)
+        if args.slow_clients:
+            delivery["slow_clients"] = delivery_report(stats, tables, connected, slow=True)
+
+        server_queues = None
+        if args.mode == "inprocess":
+            from app.websockets.connection_manager import table_sync_manager
+            connections = list(table_sync_manager.connections.values())
+            server_queues = {
+                "connections": len(connections),
+                "dropped_messages": sum(connection.dropped_messages for connection in connections),
+                "queued_max": max((connection.queued for connection in connections), default=0),
+            }
+    finally:
+        stats.stopping = True
+        await asyncio.gather(*(client.close() for client in stats.clients))
+        for task in background:
+            task.cancel()
+        if server is not None:
+            server.should_exit = True
+            await server_task
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    sent_total = sum(stats.sent.values())
+    received_total = sum(stats.received.values())
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "mode": args.mode,
+            "base_url": base_url,
+            "protocol": args.protocol,
+            "deflate": not args.no_deflate,
+            "clients": args.clients,
+            "users": users,
+            "tables": len(tables),
+            "rate_per_client": args.rate,
+            "mix": mix,
+            "duration_s": args.duration,
+            "persist": not args.no_persist,
+            "viewport": args.viewport,
+            "slow_clients": args.slow_clients,
+            "slow_delay_ms": args.slow_delay_ms,
+            "server_workers": args.server_workers if args.mode == "spawn" else None,
+            "seed": {"columns": args.columns, "records": args.records},
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "connections": {
+            "connected": len(connected_clients),
+            "connect_errors": dict(stats.connect_errors),
+            "connect_elapsed_s": round(connect_elapsed, 3),
+            "closed_by_server": dict(stats.closes),
+        },
+        "throughput": {
+            "elapsed_s": round(elapsed, 3),
+            "sent": dict(stats.sent),
+            "received": dict(stats.received),
+            "sent_per_s": round(sent_total / send_elapsed, 1) if send_elapsed else 0.0,
+            "received_per_s": round(received_total / elapsed, 1) if elapsed else 0.0,
+            "received_mb": round(stats.bytes_received / 2 ** 20, 3),
+        },
+        "latency_ms": {name: recorder.summary() for name, recorder in stats.latency.items() if name != "loop_lag"},
+        "delivery": delivery,
+        "errors": dict(stats.errors),
+        "server": {
+            "process": server_sampler.summary() if server_sampler else None,
+            "queues": server_queues,
+        },
+        "client": {
+            "process": client_sampler.summary(),
+            "loop_lag_ms": stats.latency["loop_lag"].summary(),
+            # В режиме inprocess сервер и клиенты делят процесс и цикл событий
+            "shared_with_server": args.mode == "inprocess",
+        },
+    }
+    print_summary(result)
+    return result
+
+
+def print_summary(result: Dict[str, Any]):
+    for name, stats in result["latency_ms"].items():
+        print(
+            f"{name:18} n={stats['count']:>9}  p50={stats['p50']:.1f}ms p95={stats['p95']:.1f}ms "
+            f"p99={stats['p99']:.1f}ms max={stats['max']:.1f}ms",
+            file=sys.stderr
+        )
+    for name, item in result["delivery"].items():
+        if name == "slow_clients":
+            item = {
+                "expected": sum(value["expected"] for value in item.values()),
+                "received": sum(value["received"] for value in item.values()),
+                "lost": sum(value["lost"] for value in item.values()),
+            }
+        print(
+            f"{name:18} доставлено {item['received']}/{item['expected']} (потеряно {item['lost']})",
+            file=sys.stderr
+        )
+    lag = result["client"]["loop_lag_ms"]
+    print(
+        f"{'loop_lag':18} p95={lag['p95']:.1f}ms max={lag['max']:.1f}ms (большое запаздывание - перегружен генератор)",
+        file=sys.stderr
+    )
+    throughput = result["throughput"]
+    print(
+        f"отправлено {throughput['sent_per_s']:.0f}/с, получено {throughput['received_per_s']:.0f}/с, "
+        f"отключено сервером: {result['connections']['closed_by_server'] or 'нет'}",
+        file=sys.stderr
+    )
+    for side in ("server", "client"):
+        process = result[side]["process"]
+        if process and process.get("samples"):
+            print(
+                f"{side:18} CPU mean={process['cpu_percent']['mean']}% max={process['cpu_percent']['max']}%  "
+                f"RSS max={process['rss_mb']['max']}MB",
+                file=sys.stderr
+            )
+
+
+def compare(base: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Сравнивает два прогона: рост p95 задержек, потери рассылок, отключения, рост CPU и памяти сервера"""
+    regressions = []
+    for name, new in current["latency_ms"].items():
+        old = base["latency_ms"].get(name)
+        if not old or name == "connect":
+            continue
+        if old["p95"] and (new["p95"] - old["p95"]) / old["p95"] > threshold:
+            regressions.append(f"{name}: p95 {old['p95']:.1f}ms -> {new['p95']:.1f}ms")
+    for name, new in current["delivery"].items():
+        old = base["delivery"].get(name)
+        if name == "slow_clients":
+            continue
+        if old and new["delivery_ratio"] < old["delivery_ratio"]:
+            regressions.append(f"{name}: delivery {old['delivery_ratio']:.4%} -> {new['delivery_ratio']:.4%}")
+    old_closes = sum(base["connections"]["closed_by_server"].values())
+    new_closes = sum(current["connections"]["closed_by_server"].values())
+    if new_closes > old_closes:
+        regressions.append(f"closed by server: {old_closes} -> {new_closes}")
+
+    old_server = (base.get("server") or {}).get("process") or {}
+    new_server = (current.get("server") or {}).get("process") or {}
+    if old_server.get("samples") and new_server.get("samples"):
+        for metric, key in (("cpu_percent", "mean"), ("rss_mb", "max")):
+            old_value, new_value = old_server[metric][key], new_server[metric][key]
+            if old_value and (new_value - old_value) / old_value > threshold:
+                regressions.append(f"server {metric} {key}: {old_value} -> {new_value}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон WebSocket-синхронизации таблиц")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Прогнать нагрузку")
+    run_parser.add_argument("--mode", choices=["inprocess", "spawn", "external"], default="inprocess")
+    run_parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Адрес сервера для --mode external")
+    run_parser.add_argument("--server-pid", type=int, help="PID сервера для --mode external (CPU и память)")
+    run_parser.add_argument("--server-workers", type=int, default=1, help="Воркеры uvicorn для --mode spawn")
+    run_parser.add_argument("--clients", type=int, default=200)
+    run_parser.add_argument("--users", type=int, default=0, help="Разных пользователей (0 - по одному на клиента)")
+    run_parser.add_argument("--tables", type=int, default=4)
+    run_parser.add_argument("--rate", type=float, default=2.0, help="Сообщений в секунду от одного клиента")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help="Доли видов сообщений")
+    run_parser.add_argument("--duration", type=float, default=30.0, help="Секунд нагрузки")
+    run_parser.add_argument("--drain", type=float, default=5.0, help="Сколько ждать рассылки после остановки")
+    run_parser.add_argument("--settle", type=float, default=1.0, help="Пауза между подключением и нагрузкой")
+    run_parser.add_argument("--protocol", choices=["json", "msgpack"], default="json")
+    run_parser.add_argument("--no-deflate", action="store_true", help="Без сжатия permessage-deflate")
+    run_parser.add_argument("--no-persist", action="store_true", help="Правки без record_id: только рассылка, без записи в БД")
+    run_parser.add_argument("--viewport", type=int, default=30, help="Строк в рабочем окне редактора")
+    run_parser.add_argument("--slow-clients", type=float, default=0.0, help="Доля клиентов, медленно читающих сокет (сами не пишут)")
+    run_parser.add_argument("--slow-delay-ms", type=float, default=50.0, help="Пауза медленного клиента после кадра")
+    run_parser.add_argument("--connect-concurrency", type=int, default=100)
+    run_parser.add_argument("--connect-timeout", type=float, default=30.0)
+    run_parser.add_argument("--sample-interval", type=float, default=0.5, help="Период снятия CPU и памяти")
+    run_parser.add_argument("--columns", type=int, default=SeedConfig.columns)
+    run_parser.add_argument("--records", type=int, default=500, help="Записей на таблицу")
+    run_parser.add_argument("--random-seed", type=int, default=42)
+    run_parser.add_argument("--no-seed", action="store_true", help="Использовать уже наполненную БД")
+    run_parser.add_argument("--output", type=Path, help="Файл для JSON с результатами")
+    run_parser.add_argument("--baseline", type=Path, help="Сравнить с предыдущим прогоном")
+    run_parser.add_argument("--threshold", type=float, default=0.15)
+
+    compare_parser = sub.add_parser("compare", help="Сравнить два прогона")
+    compare_parser.add_argument("base", type=Path)
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=0.15)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        base = json.loads(args.base.read_text(encoding="utf-8"))
+        current = json.loads(args.current.read_text(encoding="utf-8"))
+    else:
+        if args.rate <= 0 or args.clients <= 0 or args.viewport <= 0:
+            parser.error("--rate, --clients и --viewport должны быть положительными")
+        try:
+            parse_mix(args.mix)
+        except ValueError as e:
+            parser.error(str(e))
+        current = asyncio.run(run(args))
+        output = args.output or RESULTS_DIR / f"ws-{datetime.now():%Y%m%d-%H%M%S}-{current['meta']['commit'] or 'nocommit'}.json"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Результаты сохранены в {output}", file=sys.stderr)
+        if not args.baseline:
+            return
+        base = json.loads(args.baseline.read_text(encoding="utf-8"))
+
+    regressions = compare(base, current, args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
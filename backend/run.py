@@ -1,7 +1,11 @@
 import uvicorn
 
+from app.core.config import settings
+
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app",
-        log_level="info"
+        log_level="info",
+        # Сжатие кадров WebSocket, если клиент его предлагает (браузеры предлагают всегда)
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE
     )
@@ -0,0 +1,22 @@
+# tests/conftest.py
+import os
+import tempfile
+
+import pytest
+
+# БД подменяется до импорта приложения: настройки читаются при импорте
+_DB_DIR = tempfile.mkdtemp(prefix="wautb_tests_")
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models import Roles  # noqa: E402,F401 - связи моделей ссылаются на UserTablePermission
+
+
+@pytest.fixture
+def db():
+    init_db()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
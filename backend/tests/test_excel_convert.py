@@ -0,0 +1,151 @@
+# tests/test_excel_convert.py
+import time
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from app.services.excel_service import DATE_FORMATS, TRUE_VALUES, ExcelService
+
+
+def _convert(values, data_type):
+    result, invalid = ExcelService.convert_column(pd.Series(values, dtype=object), data_type)
+    return result.tolist(), invalid.tolist()
+
+
+def test_number_separators_and_invalid_values():
+    result, invalid = _convert(["1,5", "1 234,5", "1\u00a0000", "2\u202f500", 7, True, None, "abc", np.nan], "number")
+
+    assert result == [1.5, 1234.5, 1000.0, 2500.0, 7.0, 1.0, None, "abc", None]
+    assert invalid == [False, False, False, False, False, False, False, True, False]
+
+
+def test_number_column_with_nan():
+    result, invalid = ExcelService.convert_column(pd.Series([1, np.nan, 2.5]), "number")
+
+    assert result.tolist() == [1.0, None, 2.5]
+    assert not invalid.any()
+
+
+def test_boolean_tokens():
+    result, invalid = _convert(["Да", "нет", "TRUE", "0", "истина", "maybe", None, 1, 0.0, False], "boolean")
+
+    assert result == [True, False, True, False, True, False, None, True, False, False]
+    assert invalid == [False, False, False, False, False, True, False, False, False, False]
+
+
+def test_dates_in_mixed_formats():
+    values = [
+        "2023-01-05", "05.02.2023", "07/03/2023", "2023.04.09", "31.02.2023", "not a date",
+        datetime(2023, 5, 1, 10, 30), date(2023, 6, 2), 45000, None
+    ]
+    result, invalid = _convert(values, "date")
+
+    assert result == [
+        "2023-01-05", "2023-02-05", "2023-03-07", "2023-04-09", "31.02.2023", "not a date",
+        "2023-05-01", "2023-06-02", "45000", None
+    ]
+    # date без времени уже в нужном формате и ошибкой не считается
+    assert invalid == [False, False, False, False, True, True, False, False, True, False]
+
+
+def test_datetimes_in_mixed_formats():
+    result, invalid = _convert(
+        ["2023-01-05 10:20:30", "05.02.2023 08:15", "2023-03-01T01:02:03", "05.02.2023", None], "datetime"
+    )
+
+    assert result == ["2023-01-05T10:20:30", "2023-02-05T08:15:00", "2023-03-01T01:02:03", "05.02.2023", None]
+    assert invalid == [False, False, False, True, False]
+
+
+def test_datetime64_column_with_nat():
+    series = pd.Series([datetime(2023, 1, 5, 10, 20, 30, 250000), None, datetime(2023, 2, 1)], dtype="datetime64[ns]")
+
+    assert ExcelService.convert_column(series, "date")[0].tolist() == ["2023-01-05", None, "2023-02-01"]
+    assert ExcelService.convert_column(series, "datetime")[0].tolist() == [
+        "2023-01-05T10:20:30.250000", None, "2023-02-01T00:00:00"
+    ]
+
+
+def test_text_fallback_and_empty_column():
+    result, invalid = _convert([1, 2.5, "x", datetime(2023, 1, 2, 3, 4, 5), None], "select")
+    assert result == ["1", "2.5", "x", "2023-01-02 03:04:05", None]
+    assert not any(invalid)
+
+    result, invalid = ExcelService.convert_column(pd.Series([np.nan, None]), "number")
+    assert result.tolist() == [None, None]
+    assert not invalid.any()
+
+
+def test_convert_columns_and_build_data():
+    df = pd.DataFrame({"Имя": ["a", None, "c"], "Сумма": ["1,5", None, "x"]})
+    columns = [SimpleNamespace(name="name", data_type="text"), SimpleNamespace(name="sum", data_type="number")]
+
+    converted = ExcelService.convert_columns(df, {"name": "Имя", "sum": "Сумма", "other": "Нет такой"}, columns)
+
+    assert list(converted) == ["name", "sum"]
+    assert converted["sum"][1].tolist() == [False, False, True]
+    # Пустая строка отбрасывается, неконвертируемое значение остается строкой
+    assert ExcelService.build_data(converted) == [{"name": "a", "sum": 1.5}, {"name": "c", "sum": "x"}]
+    assert ExcelService.build_data(converted, np.array([True, True, False])) == [{"name": "a", "sum": 1.5}]
+
+
+def _convert_value(value, data_type):
+    """Прежняя конвертация по одному значению - для сравнения скорости"""
+    if pd.isna(value):
+        return None
+    if data_type == "number":
+        return float(value.replace(" ", "").replace(",", ".")) if isinstance(value, str) else float(value)
+    if data_type == "boolean":
+        return value.lower() in TRUE_VALUES if isinstance(value, str) else bool(value)
+    if data_type == "date":
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+    return str(value)
+
+
+def _per_row(df, mapping, columns):
+    types = {column.name: column.data_type for column in columns}
+    records = []
+    for _, row in df.iterrows():
+        data = {name: _convert_value(row[excel_column], types[name]) for name, excel_column in mapping.items()}
+        if any(value is not None for value in data.values()):
+            records.append(data)
+    return records
+
+
+def _best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def test_vectorized_conversion_is_faster_than_per_row():
+    rows = np.arange(20_000)
+    df = pd.DataFrame({
+        "text": [f"name {i}" for i in rows],
+        "amount": [f"{i} {i % 1000:03d},5" for i in rows],
+        "price": rows * 0.5,
+        "flag": np.where(rows % 2, "да", "нет"),
+        "day": [f"{1 + i % 28:02d}.{1 + i % 12:02d}.2023" for i in rows],
+    })
+    columns = [
+        SimpleNamespace(name=name, data_type=data_type)
+        for name, data_type in zip(df.columns, ["text", "number", "number", "boolean", "date"])
+    ]
+    mapping = {name: name for name in df.columns}
+
+    per_row_time, expected = _best_time(lambda: _per_row(df, mapping, columns), 1)
+    vectorized_time, data = _best_time(lambda: ExcelService.convert_to_data(df, mapping, columns), 5)
+
+    assert data == expected
+    # Замер на этой машине - около 20x; порог с запасом на шумные CI
+    assert per_row_time / vectorized_time >= 8, f"{per_row_time:.3f}s vs {vectorized_time:.3f}s"
@@ -0,0 +1,152 @@
+# tests/test_lock_leases.py
+import asyncio
+
+from app.websockets.connection_manager import TableSyncManager
+from app.websockets.lock_store import RANGE_COLUMN, RANGE_ROW, MemoryLockStore, lock_target
+from app.websockets.pubsub import InMemoryPubSub
+from app.websockets.timer_wheel import TimerWheel
+
+from test_table_sync import FakeWebSocket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _store():
+    clock = FakeClock()
+    return MemoryLockStore(clock=clock), clock
+
+
+def test_wheel_expires_keys_at_deadline():
+    wheel = TimerWheel(tick=1.0, slots=8)
+    wheel.schedule("a", 2.5)
+    wheel.schedule("b", 4.0)
+
+    assert wheel.advance(2.0) == []
+    assert wheel.advance(3.0) == ["a"]
+    assert wheel.advance(4.0) == ["b"]
+    assert len(wheel) == 0
+
+
+def test_wheel_reschedule_and_cancel():
+    wheel = TimerWheel(tick=1.0, slots=8)
+    wheel.schedule("a", 2.0)
+    wheel.schedule("a", 5.0)
+    wheel.schedule("b", 3.0)
+    wheel.cancel("b")
+
+    # Старая запись "a" во второй ячейке пропускается, отмененный "b" не срабатывает
+    assert wheel.advance(4.0) == []
+    assert wheel.deadline("a") == 5.0
+    assert wheel.advance(5.0) == ["a"]
+
+
+def test_wheel_deadline_beyond_one_revolution():
+    wheel = TimerWheel(tick=1.0, slots=4)
+    wheel.schedule("a", 10.0)
+
+    assert wheel.advance(6.0) == []
+    assert wheel.advance(9.0) == []
+    assert wheel.advance(10.0) == ["a"]
+
+
+def test_lease_expires_after_ttl():
+    async def scenario():
+        store, clock = _store()
+        assert await store.acquire("t", "A1", "1", ttl=10)
+        assert not await store.acquire("t", "A1", "2", ttl=10)
+
+        clock.now = 4
+        assert await store.expire("t", "A1", "1") == (False, 6)
+
+        clock.now = 10
+        assert await store.expire("t", "A1", "1") == (True, 0.0)
+        assert await store.table_leases("t") == {}
+        assert await store.acquire("t", "A1", "2", ttl=10)
+
+    asyncio.run(scenario())
+
+
+def test_renew_pushes_back_deadline():
+    async def scenario():
+        store, clock = _store()
+        await store.acquire("t", "A1", "1", ttl=10)
+        await store.acquire("t", "row:5", "1", ttl=10, record_id=5)
+
+        clock.now = 8
+        assert sorted(await store.renew("t", "1", ttl=10)) == ["A1", "row:5"]
+
+        clock.now = 12
+        assert not await store.acquire("t", "A1", "2", ttl=10)
+        assert await store.expire("t", "A1", "1") == (False, 6)
+        assert await store.table_leases("t") == {"A1": ("1", 6), "row:5": ("1", 6)}
+
+        # Истекшая аренда продлением не возвращается
+        clock.now = 18
+        assert await store.renew("t", "1", ttl=10) == []
+        assert await store.acquire("t", "A1", "2", ttl=10)
+
+    asyncio.run(scenario())
+
+
+def test_range_lock_blocks_cells_inside_it():
+    async def scenario():
+        store, _ = _store()
+        row_key, record_id, _column = lock_target(None, 5, None, RANGE_ROW)
+        assert (row_key, record_id) == ("row:5", 5)
+        assert await store.acquire("t", row_key, "1", ttl=10, record_id=record_id)
+
+        # Ячейка в заблокированной строке и колонка, пересекающая ее, заняты; соседняя строка свободна
+        assert await store.conflicting_holder("t", "2", "C5", 5, "price") == "1"
+        assert not await store.acquire("t", "C5", "2", ttl=10, record_id=5, column_name="price")
+        column_key, _record, column_name = lock_target(None, None, "price", RANGE_COLUMN)
+        assert not await store.acquire("t", column_key, "2", ttl=10, column_name=column_name)
+        assert await store.acquire("t", "C6", "2", ttl=10, record_id=6, column_name="price")
+        # Владельцу своя блокировка строки не мешает
+        assert await store.acquire("t", "B5", "1", ttl=10, record_id=5, column_name="name")
+
+    asyncio.run(scenario())
+
+
+def test_column_lock_blocked_by_cell_lock():
+    async def scenario():
+        store, _ = _store()
+        assert await store.acquire("t", "C6", "2", ttl=10, record_id=6, column_name="price")
+
+        assert not await store.acquire("t", "column:price", "1", ttl=10, column_name="price")
+        assert await store.acquire("t", "column:name", "1", ttl=10, column_name="name")
+        assert await store.conflicting_holder("t", "2", "B7", 7, "name") == "1"
+
+    asyncio.run(scenario())
+
+
+def test_expired_lease_is_broadcast_and_renewal_keeps_it():
+    async def scenario():
+        manager = TableSyncManager(InMemoryPubSub(), MemoryLockStore(), "node", lock_ttl=0.4, lock_reaper_tick=0.05)
+        other = FakeWebSocket()
+        await manager.connect_to_table(other, "2", "t")
+        holder = await manager.connect_to_table(FakeWebSocket(), "1", "t")
+        assert await manager.sync_cell_lock("t", holder, "A1", True)
+
+        # Продление после половины срока переносит его: исходный срок проходит без снятия
+        await asyncio.sleep(0.25)
+        await manager.renew_leases("t", holder)
+        await asyncio.sleep(0.25)
+        unlocked = [message for message in other.messages if message["type"] == "cell_unlocked"]
+        assert unlocked == []
+        assert "A1" in await manager.lock_store.table_leases("t")
+
+        await asyncio.sleep(0.35)
+        unlocked = [message for message in other.messages if message["type"] == "cell_unlocked"]
+        await manager.stop()
+        return unlocked, manager.cell_locks.get("t", {})
+
+    unlocked, locks = asyncio.run(scenario())
+
+    assert [(message["cell"], message["user_id"], message["reason"]) for message in unlocked] == [("A1", "1", "expired")]
+    assert locks == {}
@@ -0,0 +1,66 @@
+# tests/test_record_merge.py
+import pandas as pd
+
+from app.crud.table import table_record_repository
+from app.models import TableColumn, TableTemplate
+from app.services.excel_stream_service import COMMIT_MODE_PARTIAL, ExcelStreamImporter
+
+
+def _table(db, name):
+    template = TableTemplate(name=name)
+    db.add(template)
+    db.flush()
+    columns = [
+        TableColumn(table_template_id=template.id, name="k", data_type="text", order_index=0, config={}),
+        TableColumn(table_template_id=template.id, name="n", data_type="number", order_index=1, config={}),
+    ]
+    db.add_all(columns)
+    db.commit()
+    table_record_repository.create_many(db, template.id, [{"k": "a", "n": 1}, {"k": "b", "n": 2}])
+    return template.id, columns
+
+
+def _merge(db, template_id, columns, rows):
+    importer = ExcelStreamImporter(
+        db, template_id, {"k": "k", "n": "n"}, columns,
+        commit_mode=COMMIT_MODE_PARTIAL, key_columns=["k"], delete_missing=True
+    )
+    importer.import_dataframes(iter([pd.DataFrame(rows, columns=["k", "n"])]), len(rows))
+    return importer.merge_stats
+
+
+def _keys(db, template_id):
+    return sorted(data["k"] for _, data in table_record_repository.iter_data(db, template_id))
+
+
+def test_delete_missing_keeps_records_of_invalid_rows(db):
+    template_id, columns = _table(db, "merge_invalid_value")
+
+    stats = _merge(db, template_id, columns, [["a", 5], ["b", "oops"]])
+
+    assert stats.updated == 1
+    assert stats.deleted == 0
+    assert _keys(db, template_id) == ["a", "b"]
+
+
+def test_delete_missing_skipped_when_key_is_invalid(db):
+    template_id, columns = _table(db, "merge_invalid_key")
+    db.query(TableColumn).filter(TableColumn.table_template_id == template_id, TableColumn.name == "k") \
+        .update({"data_type": "number"})
+    db.commit()
+    columns = db.query(TableColumn).filter(TableColumn.table_template_id == template_id).all()
+
+    stats = _merge(db, template_id, columns, [["oops", 5]])
+
+    assert stats.deleted == 0
+    assert stats.delete_skipped
+    assert len(_keys(db, template_id)) == 2
+
+
+def test_delete_missing_removes_absent_records(db):
+    template_id, columns = _table(db, "merge_absent")
+
+    stats = _merge(db, template_id, columns, [["a", 5]])
+
+    assert stats.deleted == 1
+    assert _keys(db, template_id) == ["a"]
@@ -0,0 +1,104 @@
+# tests/test_table_changes.py
+from app.crud.table import (
+    table_change_log_repository, table_change_tracker, table_record_repository, table_version_repository
+)
+from app.models import TableColumn, TableTemplate
+from app.services.table_service import TableChangeService
+
+
+def _table(db, name):
+    template = TableTemplate(name=name)
+    db.add(template)
+    db.flush()
+    db.add(TableColumn(table_template_id=template.id, name="n", data_type="number", order_index=0, config={}))
+    db.commit()
+    return template.id
+
+
+def _ids(db, template_id):
+    return [record_id for record_id, _ in table_record_repository.iter_data(db, template_id)]
+
+
+def _changes(db, template_id, since_version):
+    response = TableChangeService(db).get_changes(template_id, since_version)
+    return response, {change.record_id: (change.op, change.fields, change.data) for change in response.changes}
+
+
+def test_changes_since_version(db):
+    template_id = _table(db, "changes_delta")
+    table_record_repository.create_many(db, template_id, [{"n": 1}, {"n": 2}, {"n": 3}])
+    first, second, third = _ids(db, template_id)
+    since = table_version_repository.get(db, template_id)
+
+    table_record_repository.update_data_many(db, template_id, {first: {"n": 10}})
+    table_record_repository.delete_many(db, template_id, [second])
+    table_record_repository.create_many(db, template_id, [{"n": 4}, {"n": 5}])
+    added, transient = _ids(db, template_id)[-2:]
+    table_record_repository.delete_many(db, template_id, [transient])
+
+    response, changes = _changes(db, template_id, since)
+
+    assert not response.snapshot
+    assert response.version == since + 4
+    # Удаленная запись - надгробием; созданная и удаленная после since клиенту не нужна; third не менялась
+    assert changes == {
+        first: ("update", ["n"], {"n": 10}),
+        second: ("delete", [], None),
+        added: ("insert", ["n"], {"n": 4}),
+    }
+    assert third not in changes
+
+    response, changes = _changes(db, template_id, response.version)
+    assert not response.snapshot
+    assert changes == {}
+
+
+def test_snapshot_when_version_is_not_covered(db, monkeypatch):
+    template_id = _table(db, "changes_pruned")
+    monkeypatch.setattr(table_change_log_repository, "prune_every", 1)
+    monkeypatch.setattr(table_change_log_repository, "retention_versions", 2)
+
+    table_record_repository.create_many(db, template_id, [{"n": 1}, {"n": 2}])
+    first, second = _ids(db, template_id)
+    table_record_repository.delete_many(db, template_id, [second])
+    for value in (3, 4, 5):
+        table_record_repository.update_data_many(db, template_id, {first: {"n": value}})
+    version = table_version_repository.get(db, template_id)
+
+    # Журнал хранит только последние версии: v1 удалена, из нее дельту не собрать
+    assert table_change_log_repository.oldest_version(db, template_id) == version - 1
+    response, changes = _changes(db, template_id, 1)
+    assert response.snapshot
+    assert response.columns is not None
+    assert changes == {first: ("insert", ["n"], {"n": 5})}
+
+    response, changes = _changes(db, template_id, version - 2)
+    assert not response.snapshot
+    assert changes == {first: ("update", ["n"], {"n": 5})}
+
+    # Версия из будущего (например, после восстановления БД) - тоже снимок
+    response, _ = _changes(db, template_id, version + 5)
+    assert response.snapshot
+
+
+def test_snapshot_after_truncated_operation(db, monkeypatch):
+    template_id = _table(db, "changes_truncated")
+    table_record_repository.create_many(db, template_id, [{"n": 0}])
+    before_import = table_version_repository.get(db, template_id)
+
+    monkeypatch.setattr(table_change_tracker, "max_records", 2)
+    table_record_repository.create_many(db, template_id, [{"n": value} for value in range(1, 6)])
+    after_import = table_version_repository.get(db, template_id)
+
+    # Вместо пяти записей в журнале одна запись reset - версию до импорта покрывает только снимок
+    response, changes = _changes(db, template_id, before_import)
+    assert response.snapshot
+    assert response.version == after_import
+    assert sorted(data["n"] for _, _, data in changes.values()) == [0, 1, 2, 3, 4, 5]
+
+    # Изменения после большой операции снова отдаются дельтой
+    last = _ids(db, template_id)[-1]
+    table_record_repository.update_data_many(db, template_id, {last: {"n": 50}})
+    response, changes = _changes(db, template_id, after_import)
+    assert not response.snapshot
+    assert changes == {last: ("update", ["n"], {"n": 50})}
@@ -0,0 +1,93 @@
+# tests/test_table_sync.py
+import asyncio
+import json
+
+from app.websockets.connection_manager import TableSyncManager
+from app.websockets.lock_store import MemoryLockStore
+from app.websockets.pubsub import InMemoryPubSub
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.messages = []
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, text):
+        self.messages.append(json.loads(text))
+
+    async def close(self, code=1000):
+        pass
+
+
+class SlowReleaseLockStore(MemoryLockStore):
+    """release_user отдает управление, как запрос к общему хранилищу"""
+
+    async def release_user(self, table_id, user_id):
+        await asyncio.sleep(0.05)
+        return await super().release_user(table_id, user_id)
+
+
+def _run(scenario, lock_store):
+    async def main():
+        manager = TableSyncManager(InMemoryPubSub(), lock_store, "node")
+        try:
+            return await scenario(manager)
+        finally:
+            await manager.stop()
+    return asyncio.run(main())
+
+
+def test_reconnect_before_release_keeps_new_lock():
+    async def scenario(manager):
+        first = await manager.connect_to_table(FakeWebSocket(), "1", "t")
+        manager.disconnect(first)
+        # Вкладка переподключилась и взяла блокировку раньше, чем отработало освобождение
+        second = await manager.connect_to_table(FakeWebSocket(), "1", "t")
+        assert await manager.sync_cell_lock("t", second, "A1", True)
+        await asyncio.sleep(0.05)
+        return await manager.lock_store.table_leases("t")
+
+    leases = _run(scenario, MemoryLockStore())
+
+    assert leases["A1"][0] == "1"
+
+
+def test_lock_during_release_waits_for_it():
+    async def scenario(manager):
+        other = FakeWebSocket()
+        await manager.connect_to_table(other, "2", "t")
+        first = await manager.connect_to_table(FakeWebSocket(), "1", "t")
+        assert await manager.sync_cell_lock("t", first, "A1", True)
+        manager.disconnect(first)
+        await asyncio.sleep(0.01)
+        # Освобождение уже идет: новый захват ждет его и не снимается им
+        second = await manager.connect_to_table(FakeWebSocket(), "1", "t")
+        assert await manager.sync_cell_lock("t", second, "B2", True)
+        await asyncio.sleep(0.1)
+        return await manager.lock_store.table_leases("t"), [message["type"] for message in other.messages]
+
+    leases, seen = _run(scenario, SlowReleaseLockStore())
+
+    assert {key: holder for key, (holder, _) in leases.items()} == {"B2": "1"}
+    assert "user_left" in seen
+
+
+def test_last_connection_releases_locks():
+    async def scenario(manager):
+        first = await manager.connect_to_table(FakeWebSocket(), "1", "t")
+        second = await manager.connect_to_table(FakeWebSocket(), "1", "t")
+        assert await manager.sync_cell_lock("t", first, "A1", True)
+        manager.disconnect(first)
+        await asyncio.sleep(0.01)
+        # Блокировка принадлежит пользователю, а не вкладке
+        kept = dict(await manager.lock_store.table_leases("t"))
+        manager.disconnect(second)
+        await asyncio.sleep(0.01)
+        return kept, await manager.lock_store.table_leases("t")
+
+    kept, leases = _run(scenario, MemoryLockStore())
+
+    assert list(kept) == ["A1"]
+    assert leases == {}